@@ -1,6 +1,6 @@
 import os
 import sys
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash
+from flask import Flask, Response, g, render_template, request, jsonify, redirect, url_for, flash, stream_with_context
 from werkzeug.utils import secure_filename
 import json
 
@@ -11,8 +11,13 @@ from src.config import Config
 from src.file_handler import FileHandler
 from src.ocr_reader import OCRReader
 from src.summarizer import Summarizer
-from src.vector_store import VectorStore
 from src.qa_service import QAService
+from src.services import get_vector_store, warm_up, readiness
+from src.job_queue import JOB_REINDEX, STATUS_FAILED, JobQueue
+from src.content_cache import file_sha256
+from src.document_catalog import parse_scope
+from src.tenants import Tenant, TenantRegistry, tenant_from_headers
+from src.writer_lock import WriterLock
 
 
 app = Flask(__name__)
@@ -24,88 +29,216 @@ app.config['MAX_CONTENT_LENGTH'] = 32 * 1024 * 1024
 file_handler = FileHandler()
 ocr_reader = OCRReader()
 summarizer = Summarizer()
-vector_store = VectorStore()
-qa_service = QAService()
+# 嵌入模型與向量資料庫在程序內只建立一份，由各服務共用（模型於第一次使用時才載入）
+vector_store = get_vector_store()
+qa_service = QAService(vector_store=vector_store)
+# 可選：於背景執行緒預先載入模型，避免第一個問答請求等待
+# （OCR 程序池以 spawn 啟動子程序時會以 __mp_main__ 重新執行本檔，子程序不需要模型）
+if Config.WARMUP_ON_START and __name__ != '__mp_main__':
+    warm_up()
+ingestion_queue = JobQueue()
+# 各 tenant 的檔案、向量集合與問答服務；上方的共用實例即為預設 tenant，其他 tenant 第一次請求時才開啟
+tenants = TenantRegistry(
+    default_tenant=Tenant(
+        Config.DEFAULT_TENANT, file_handler=file_handler, vector_store=vector_store, qa_service=qa_service
+    ),
+    executor=qa_service.executor
+)
+
+
+# 與批次匯入 CLI 互斥寫入資料目錄；於實際處理請求的程序中取得（避免 debug reloader 的父程序佔住）
+writer_lock = WriterLock()
+
+
+def claim_data_dir() -> bool:
+    """取得資料目錄的寫入者鎖，批次匯入 CLI 執行中時回傳 False"""
+    return writer_lock.acquire()
+
+
+@app.before_request
+def _require_data_dir():
+    if request.endpoint in ('liveness', 'static') or claim_data_dir():
+        return None
+    return jsonify({'success': False, 'error': '批次匯入進行中，請稍後再試'}), 503
+
+
+@app.before_request
+def _resolve_tenant():
+    """由 TENANT_HEADER 標頭決定請求所屬的 tenant（未開啟 TRUST_TENANT_HEADER 或未提供時為預設 tenant）"""
+    try:
+        g.tenant_id = tenant_from_headers(request.headers)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+
+@app.teardown_request
+def _release_tenant(exception=None):
+    tenant = g.pop('tenant', None)
+    if tenant is not None:
+        tenants.release(tenant)
+
+
+def current_tenant() -> Tenant:
+    """目前請求所屬的 tenant（第一次取用時開啟，請求結束前不會被關閉）"""
+    if 'tenant' not in g:
+        g.tenant = tenants.acquire(g.tenant_id)
+    return g.tenant
+
+
+def process_document(job, stage):
+    """背景 worker 執行的文件處理流程：OCR → 摘要 → 向量化，或重新索引（在工作所屬的 tenant 中處理）"""
+    with tenants.use(job['tenant_id']) as tenant:
+        if job['kind'] == JOB_REINDEX:
+            _reindex_document(tenant, job, stage)
+        else:
+            _process_document(tenant, job, stage)
+
+
+def _reindex_document(tenant, job, stage):
+    """以目前的 OCR 文字重新索引（只重新嵌入有變動的片段）"""
+    filename = job['filename']
+    vector_store = tenant.vector_store
+    stage('embedding')
+    with open(job['file_path'], 'r', encoding='utf-8') as f:
+        text = f.read()
+    entry = vector_store.catalog.get(filename) or {}
+    if not vector_store.add_document(text, filename, content_hash=entry.get('content_hash')):
+        raise Exception('向量資料庫處理失敗')
+
+
+def _process_document(tenant, job, stage):
+    filename = job['filename']
+    file_path = job['file_path']
+    vector_store = tenant.vector_store
+    content_cache = tenant.file_handler.content_cache
+    content_hash = file_sha256(file_path)
+
+    # 相同內容已處理過：直接連結既有產物，不重跑 OCR、摘要與嵌入
+    if content_cache.has_artifacts(content_hash):
+        stage('ocr')
+        print(f"Content cache hit for {filename} ({content_hash[:12]})")
+        content_cache.link(content_hash, filename)
+        stage('summary')
+        stage('embedding')
+        sources = [name for name in content_cache.get_filenames(content_hash) if name != filename]
+        if any(vector_store.copy_document(source, filename) for source in sources):
+            return
+        # 既有的向量已被刪除時，改以快取的文字重新嵌入
+        text = content_cache.read_ocr_text(content_hash)
+        if not vector_store.add_document(text, filename, content_hash=content_hash):
+            raise Exception('向量資料庫處理失敗')
+        return
+
+    # OCR
+    stage('ocr')
+    ocr_path, text = ocr_reader.process_pdf(file_path, filename, output_dir=tenant.paths.ocr_dir)
+    if not text:
+        raise Exception('OCR 文字提取失敗')
+    # 摘要
+    stage('summary')
+    summary_path, summary = summarizer.create_summary(text, filename, output_dir=tenant.paths.summary_dir)
+    if not summary:
+        raise Exception('摘要生成失敗')
+    # 向量化
+    stage('embedding')
+    success = vector_store.add_document(text, filename, content_hash=content_hash)
+    if not success:
+        raise Exception('向量資料庫處理失敗')
+    # 存入內容快取，供之後相同內容的上傳直接使用
+    try:
+        content_cache.store(content_hash, filename, ocr_path, summary_path)
+    except Exception as e:
+        print(f"Error storing {filename} in content cache: {str(e)}")
+
+
+def _ensure_ingestion_workers():
+    """於實際處理請求的程序中延遲啟動背景 worker（避免 debug reloader 重複啟動）"""
+    ingestion_queue.start(process_document)
 
 @app.route('/')
 def index():
-    """首頁，自動補處理所有未完成的 PDF"""
-    pdf_files = file_handler.get_pdf_list()
-    available_docs = set(qa_service.get_available_documents())
-    errors = []
-    # 自動補處理未完成的 PDF
-    for filename in pdf_files:
-        if filename not in available_docs:
-            try:
-                file_path = os.path.join(Config.PDF_DIR, filename)
-                # OCR
-                ocr_path, text = ocr_reader.process_pdf(file_path, filename)
-                if not text:
-                    raise Exception('OCR 文字提取失敗')
-                # 摘要
-                summary_path, summary = summarizer.create_summary(text, filename)
-                if not summary:
-                    raise Exception('摘要生成失敗')
-                # 向量化
-                success = vector_store.add_document(text, filename)
-                if not success:
-                    raise Exception('向量資料庫處理失敗')
-                available_docs.add(filename)
-            except Exception as e:
-                error_msg = f"檔案 {filename} 處理失敗：{str(e)}"
-                print(error_msg)
-                errors.append(error_msg)
-    # 顯示所有錯誤
-    for msg in errors:
-        flash(msg, 'danger')
-    return render_template('index.html', pdf_files=pdf_files, available_docs=available_docs)
+    """首頁，將所有未完成的 PDF 交給背景佇列補處理（上次處理失敗的檔案顯示錯誤，等待使用者重試）"""
+    tenant = current_tenant()
+    pdf_files = tenant.file_handler.get_pdf_list()
+    available_docs = set(tenant.qa_service.get_available_documents())
+    pending = [filename for filename in pdf_files if filename not in available_docs]
+    latest_jobs = ingestion_queue.get_latest_jobs(tenant.tenant_id, pending)
+    failed_jobs = {
+        filename: job for filename, job in latest_jobs.items() if job['status'] == STATUS_FAILED
+    }
+    # 自動補處理未完成的 PDF（背景執行，不阻塞頁面）
+    pending = [filename for filename in pending if filename not in failed_jobs]
+    if pending:
+        _ensure_ingestion_workers()
+        for filename in pending:
+            file_path = os.path.join(tenant.paths.pdf_dir, filename)
+            ingestion_queue.enqueue_if_absent(filename, file_path, tenant.tenant_id)
+    return render_template('index.html', pdf_files=pdf_files, available_docs=available_docs,
+                           failed_jobs=failed_jobs)
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
     print("[DEBUG] /upload 路由被呼叫")
-    """處理 PDF 上傳，並加強錯誤提示"""
+    """處理 PDF 上傳，將處理工作放入背景佇列並立即回傳工作 ID"""
+    wants_json = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
     try:
+        tenant = current_tenant()
+        file_handler = tenant.file_handler
         if 'file' not in request.files:
-            flash('沒有選擇檔案', 'danger')
-            return redirect(request.url)
+            return _upload_error('沒有選擇檔案', wants_json)
 
         file = request.files['file']
 
         if file.filename == '':
-            flash('沒有選擇檔案', 'danger')
-            return redirect(request.url)
-
-        if file and file_handler.allowed_file(file.filename):
-            # 1. 儲存 PDF 檔案
-            file_path, filename = file_handler.save_pdf(file)
-            if not file_path:
-                flash('檔案儲存失敗', 'danger')
-                return redirect(url_for('index'))
-            try:
-                # 2. OCR 處理
-                ocr_path, text = ocr_reader.process_pdf(file_path, filename)
-                if not text:
-                    raise Exception('OCR 文字提取失敗')
-                # 3. 生成摘要
-                summary_path, summary = summarizer.create_summary(text, filename)
-                if not summary:
-                    raise Exception('摘要生成失敗')
-                # 4. 添加到向量資料庫
-                success = vector_store.add_document(text, filename)
-                if success:
-                    flash(f'檔案 {filename} 上傳並處理成功！', 'success')
-                else:
-                    raise Exception('向量資料庫處理失敗')
-            except Exception as e:
-                flash(f'檔案 {filename} 處理失敗：{str(e)}', 'danger')
-        else:
-            flash('不支援的檔案格式，請上傳 PDF 檔案', 'danger')
+            return _upload_error('沒有選擇檔案', wants_json)
+
+        if not file_handler.allowed_file(file.filename):
+            return _upload_error('不支援的檔案格式，請上傳 PDF 檔案', wants_json)
+
+        # 1. 儲存 PDF 檔案
+        file_path, filename = file_handler.save_pdf(file)
+        if not file_path:
+            return _upload_error('檔案儲存失敗', wants_json)
+
+        # 2. OCR、摘要、向量化交由背景 worker 處理
+        _ensure_ingestion_workers()
+        job_id = ingestion_queue.enqueue(filename, file_path, tenant.tenant_id)
 
+        if wants_json:
+            return jsonify({
+                'success': True,
+                'job_id': job_id,
+                'filename': filename,
+                'status_url': url_for('get_job_status', job_id=job_id)
+            }), 202
+
+        flash(f'檔案 {filename} 已上傳，正在背景處理中', 'success')
         return redirect(url_for('index'))
 
     except Exception as e:
-        flash(f'處理檔案時發生錯誤：{str(e)}', 'danger')
-        return redirect(url_for('index'))
+        return _upload_error(f'處理檔案時發生錯誤：{str(e)}', wants_json)
+
+def _upload_error(message, wants_json):
+    """回傳上傳錯誤（AJAX 回傳 JSON，表單則 flash 後導回首頁）"""
+    if wants_json:
+        return jsonify({'success': False, 'error': message}), 400
+    flash(message, 'danger')
+    return redirect(url_for('index'))
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    """查詢背景處理工作的進度 API"""
+    job = ingestion_queue.get_job(job_id)
+    # 其他 tenant 的工作視同不存在
+    if not job or job['tenant_id'] != g.tenant_id:
+        return jsonify({
+            'success': False,
+            'error': '找不到指定的工作'
+        }), 404
+    return jsonify({
+        'success': True,
+        'job': job
+    })
 
 @app.route('/ask', methods=['POST'])
 def ask_question():
@@ -120,15 +253,25 @@ def ask_question():
                 'error': '問題不能為空'
             })
         
+        # 可選的檢索範圍：{"filenames": [...], "uploaded_after": "2024-01-01", "uploaded_before": ..., "tags": [...]}
+        try:
+            scope = parse_scope(data.get('scope'))
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': f'檢索範圍格式錯誤：{str(e)}'
+            }), 400
+        
         # 使用增強的 QA 服務回答問題
-        result = qa_service.answer_question(question)
+        result = current_tenant().qa_service.answer_question(question, scope)
         
         response_data = {
             'success': True,
             'answer': result['answer'],
             'sources': result['sources'],
             'confidence': result['confidence'],
-            'retrieved_docs': result.get('retrieved_docs', 0)
+            'retrieved_docs': result.get('retrieved_docs', 0),
+            'cached': result.get('cached', False)
         }
         
         # 添加問題分析資訊（如果有的話）
@@ -147,11 +290,49 @@ def ask_question():
             'error': f'處理問題時發生錯誤：{str(e)}'
         })
 
+def _sse(event, data):
+    """格式化一則 Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.route('/ask/stream', methods=['POST'])
+def ask_question_stream():
+    """以 Server-Sent Events 串流回答：先送出來源，再逐段轉送 LLM 輸出"""
+    data = request.get_json(silent=True) or {}
+    question = data.get('question', '').strip()
+    if not question:
+        return jsonify({
+            'success': False,
+            'error': '問題不能為空'
+        }), 400
+    try:
+        scope = parse_scope(data.get('scope'))
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': f'檢索範圍格式錯誤：{str(e)}'
+        }), 400
+
+    def generate():
+        # 先送出註解行，讓瀏覽器與代理立即收到回應標頭
+        yield ": stream opened\n\n"
+        for event, payload in current_tenant().qa_service.answer_question_stream(question, scope):
+            yield _sse(event, payload)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            # 告知 nginx 不要緩衝此回應
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
 @app.route('/api/retrieval-stats', methods=['GET'])
 def get_retrieval_stats():
     """獲取檢索統計資訊 API"""
     try:
-        stats = qa_service.get_retrieval_stats()
+        stats = current_tenant().qa_service.get_retrieval_stats()
         return jsonify({
             'success': True,
             'stats': stats
@@ -162,14 +343,42 @@ def get_retrieval_stats():
             'error': str(e)
         })
 
+@app.route('/healthz', methods=['GET'])
+def liveness():
+    """Liveness 檢查：程序可回應即視為存活，不觸發模型載入"""
+    return jsonify({'status': 'ok'})
+
+@app.route('/readyz', methods=['GET'])
+def readiness_check():
+    """Readiness 檢查：嵌入模型與向量資料庫載入完成後才回傳 200"""
+    state = readiness()
+    return jsonify(state), 200 if state['ready'] else 503
+
+@app.route('/retry/<filename>', methods=['POST'])
+def retry_file(filename):
+    """重新處理上次失敗的檔案"""
+    tenant = current_tenant()
+    filename = os.path.basename(filename)
+    file_path = os.path.join(tenant.paths.pdf_dir, filename)
+    if not os.path.exists(file_path):
+        flash(f'找不到檔案 {filename}', 'danger')
+    elif ingestion_queue.get_active_job(filename, tenant.tenant_id):
+        flash(f'檔案 {filename} 已在處理中')
+    else:
+        _ensure_ingestion_workers()
+        ingestion_queue.enqueue(filename, file_path, tenant.tenant_id)
+        flash(f'檔案 {filename} 已重新排入背景處理', 'success')
+    return redirect(url_for('index'))
+
 @app.route('/delete/<filename>', methods=['POST'])
 def delete_file(filename):
     """刪除檔案"""
     try:
+        tenant = current_tenant()
         # 從文件系統刪除
-        if file_handler.delete_pdf(filename):
+        if tenant.file_handler.delete_pdf(filename):
             # 從向量資料庫刪除
-            vector_store.delete_document(filename)
+            tenant.vector_store.delete_document(filename)
             flash(f'檔案 {filename} 已成功刪除')
         else:
             flash(f'刪除檔案 {filename} 失敗')
@@ -183,8 +392,9 @@ def delete_file(filename):
 def get_documents():
     """取得文檔清單 API"""
     try:
-        pdf_files = file_handler.get_pdf_list()
-        vector_docs = qa_service.get_available_documents()
+        tenant = current_tenant()
+        pdf_files = tenant.file_handler.get_pdf_list()
+        vector_docs = tenant.qa_service.get_available_documents()
         
         return jsonify({
             'success': True,
@@ -198,6 +408,53 @@ def get_documents():
             'error': str(e)
         })
 
+@app.route('/api/documents/<filename>/reindex', methods=['POST'])
+def reindex_document(filename):
+    """以目前的 OCR 文字重新索引文檔（修正或重新擷取文字後使用，只重新嵌入有變動的片段）
+
+    重新索引交由背景佇列執行，立即回傳工作 ID；該檔案已有排隊中或處理中的工作時回傳 409。
+    """
+    filename = os.path.basename(filename)
+    tenant = current_tenant()
+    ocr_path = os.path.join(tenant.paths.ocr_dir, os.path.splitext(filename)[0] + '.txt')
+    if not os.path.exists(ocr_path):
+        return jsonify({'success': False, 'error': '找不到此文檔的 OCR 文字'}), 404
+    try:
+        active = ingestion_queue.get_active_job(filename, tenant.tenant_id)
+        if active:
+            return jsonify({
+                'success': False,
+                'error': '此文檔已有處理中的工作，請稍後再試',
+                'job_id': active['id'],
+                'status_url': url_for('get_job_status', job_id=active['id'])
+            }), 409
+        _ensure_ingestion_workers()
+        job_id = ingestion_queue.enqueue(filename, ocr_path, tenant.tenant_id, kind=JOB_REINDEX)
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'filename': filename,
+            'status_url': url_for('get_job_status', job_id=job_id)
+        }), 202
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/documents/<filename>/tags', methods=['PUT'])
+def set_document_tags(filename):
+    """設定文檔標籤（取代原有標籤），問答時可以 scope.tags 限定檢索範圍"""
+    filename = os.path.basename(filename)
+    data = request.get_json(silent=True) or {}
+    tags = data.get('tags')
+    if not isinstance(tags, list) or not all(isinstance(tag, str) for tag in tags):
+        return jsonify({'success': False, 'error': 'tags 必須是字串陣列'}), 400
+    vector_store = current_tenant().vector_store
+    if not vector_store.catalog.set_tags(filename, tags):
+        return jsonify({'success': False, 'error': '找不到指定的文檔'}), 404
+    return jsonify({'success': True, 'filename': filename, 'tags': vector_store.catalog.get(filename)['tags']})
+
 if __name__ == '__main__':
     # 確保所有目錄都存在
     Config.ensure_directories()
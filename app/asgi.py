@@ -0,0 +1,132 @@
+"""
+ASGI 進入點 - 以非同步方式處理問答請求
+
+用法：uvicorn app.asgi:app --host 0.0.0.0 --port 5000
+
+/ask 與 /ask/stream 由原生非同步路由處理：檢索在執行緒池執行，LLM 以非同步客戶端呼叫，
+等待 LLM 回應的請求不佔用執行緒。其餘路由（上傳、文檔管理、健康檢查）沿用 Flask 應用。
+"""
+
+import asyncio
+import os
+import sys
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+
+# 添加專案根目錄到 Python 路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.config import Config
+from src.document_catalog import parse_scope
+from src.tenants import tenant_from_headers
+from app.app import app as flask_app, claim_data_dir, tenants, _sse
+
+
+async def _read_question(request):
+    """讀取 tenant、問題與檢索範圍，回傳 (tenant_id, question, scope, 錯誤回應或 None)"""
+    if not claim_data_dir():
+        return None, None, None, JSONResponse({'success': False, 'error': '批次匯入進行中，請稍後再試'}, status_code=503)
+    try:
+        tenant_id = tenant_from_headers(request.headers)
+    except ValueError as e:
+        return None, None, None, JSONResponse({'success': False, 'error': str(e)}, status_code=400)
+    try:
+        data = await request.json()
+    except Exception:
+        data = {}
+    data = data or {}
+    try:
+        scope = parse_scope(data.get('scope'))
+    except ValueError as e:
+        return None, None, None, JSONResponse({
+            'success': False,
+            'error': f'檢索範圍格式錯誤：{str(e)}'
+        }, status_code=400)
+    return tenant_id, data.get('question', '').strip(), scope, None
+
+
+async def _acquire_tenant(tenant_id):
+    """取得 tenant（第一次使用時需開啟資料庫，在執行緒中進行），用完須以 tenants.release 歸還"""
+    if tenant_id == Config.DEFAULT_TENANT:
+        return tenants.acquire(tenant_id)
+    return await asyncio.to_thread(tenants.acquire, tenant_id)
+
+
+async def ask_question(request):
+    """處理問答請求（非同步版本，回應格式與 Flask /ask 相同）"""
+    tenant_id, question, scope, error = await _read_question(request)
+    if error is not None:
+        return error
+    if not question:
+        return JSONResponse({
+            'success': False,
+            'error': '問題不能為空'
+        })
+
+    try:
+        tenant = await _acquire_tenant(tenant_id)
+        try:
+            result = await tenant.qa_service.answer_question_async(question, scope)
+        finally:
+            tenants.release(tenant)
+        response_data = {
+            'success': True,
+            'answer': result['answer'],
+            'sources': result['sources'],
+            'confidence': result['confidence'],
+            'retrieved_docs': result.get('retrieved_docs', 0),
+            'cached': result.get('cached', False)
+        }
+        if 'question_analysis' in result:
+            response_data['question_analysis'] = result['question_analysis']
+        if 'sub_questions' in result:
+            response_data['sub_questions'] = result['sub_questions']
+        return JSONResponse(response_data)
+
+    except Exception as e:
+        return JSONResponse({
+            'success': False,
+            'error': f'處理問題時發生錯誤：{str(e)}'
+        })
+
+
+async def ask_question_stream(request):
+    """以 Server-Sent Events 串流回答（非同步版本）"""
+    tenant_id, question, scope, error = await _read_question(request)
+    if error is not None:
+        return error
+    if not question:
+        return JSONResponse({
+            'success': False,
+            'error': '問題不能為空'
+        }, status_code=400)
+
+    async def generate():
+        yield ": stream opened\n\n"
+        tenant = await _acquire_tenant(tenant_id)
+        try:
+            async for event, payload in tenant.qa_service.answer_question_stream_async(question, scope):
+                yield _sse(event, payload)
+        finally:
+            tenants.release(tenant)
+
+    return StreamingResponse(
+        generate(),
+        media_type='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+
+Config.ensure_directories()
+
+app = Starlette(routes=[
+    Route('/ask', ask_question, methods=['POST']),
+    Route('/ask/stream', ask_question_stream, methods=['POST']),
+    Mount('/', app=WSGIMiddleware(flask_app)),
+])
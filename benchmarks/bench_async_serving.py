@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+負載測試：Flask 多執行緒伺服器（app.run）與 ASGI（uvicorn app.asgi:app）處理 /ask 的延遲
+
+用法：python benchmarks/bench_async_serving.py [--concurrency 10,50,100,200] [--llm-latency 1.0]
+伺服器在子程序中啟動，檢索與 LLM 以固定延遲的替身取代（不需嵌入模型與 API 金鑰），
+依序以不同並行數送出請求，回報 p50/p95/p99 延遲、吞吐量與伺服器的最高執行緒數。
+負載產生端使用 aiohttp。
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+import aiohttp
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def serve(mode, port, llm_latency, retrieval_latency):
+    """子程序：以替身 LLM 與檢索啟動伺服器"""
+    sys.path.insert(0, ROOT_DIR)
+    from flask import jsonify
+    import app.app as flask_module
+
+    qa_service = flask_module.qa_service
+    qa_service.answer_cache = None
+    plan = {
+        'question': '', 'context': '', 'question_analysis': {'is_broad': False, 'complexity_score': 1},
+        'docs': [{'content': 'stub', 'metadata': {'filename': 'stub.pdf', 'chunk_index': 0}, 'distance': 0.2}]
+    }
+
+    def plan_answer(question, filenames=None):
+        time.sleep(retrieval_latency)  # 嵌入與向量檢索（阻塞）
+        return dict(plan, question=question)
+
+    def generate_answer(plan):
+        time.sleep(llm_latency)  # 同步 LLM 呼叫
+        return 'stub answer'
+
+    async def astream_answer(plan):
+        await asyncio.sleep(llm_latency)  # 非同步 LLM 呼叫
+        yield 'stub answer'
+
+    qa_service._plan_answer = plan_answer
+    qa_service._generate_answer = generate_answer
+    qa_service._astream_answer = astream_answer
+
+    peak = {'threads': threading.active_count()}
+
+    def sample_threads():
+        while True:
+            peak['threads'] = max(peak['threads'], threading.active_count())
+            time.sleep(0.05)
+
+    threading.Thread(target=sample_threads, daemon=True).start()
+
+    @flask_module.app.route('/bench/threads')
+    def bench_threads():
+        return jsonify(peak)
+
+    if mode == 'wsgi':
+        flask_module.app.run(host='127.0.0.1', port=port, threaded=True)
+    else:
+        import uvicorn
+        from app.asgi import app as asgi_app
+        uvicorn.run(asgi_app, host='127.0.0.1', port=port, log_level='warning')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(base_url, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f"{base_url}/healthz", timeout=1) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"server at {base_url} did not start")
+
+
+async def run_level(base_url, concurrency, total):
+    """以固定並行數送出 total 個請求，回傳延遲（秒）列表、錯誤數與總耗時"""
+    latencies, errors = [], 0
+    counter = iter(range(total))
+    # httpx 的連線池在數百個並行連線時本身就成為瓶頸，改用 aiohttp
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=120)
+
+    async with aiohttp.ClientSession(base_url=base_url, connector=connector, timeout=timeout) as session:
+        async def worker():
+            nonlocal errors
+            for i in counter:
+                start = time.perf_counter()
+                try:
+                    async with session.post('/ask', json={'question': f'question {i}'}) as response:
+                        data = await response.json()
+                    if response.status != 200 or not data.get('success'):
+                        errors += 1
+                        continue
+                    latencies.append(time.perf_counter() - start)
+                except aiohttp.ClientError:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        wall = time.perf_counter() - start
+    return latencies, errors, wall
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test /ask under WSGI and ASGI serving with a stub LLM')
+    parser.add_argument('--modes', default='wsgi,asgi')
+    parser.add_argument('--concurrency', default='10,50,100,200')
+    parser.add_argument('--requests-per-worker', type=int, default=3)
+    parser.add_argument('--llm-latency', type=float, default=1.0)
+    parser.add_argument('--retrieval-latency', type=float, default=0.02)
+    parser.add_argument('--serve', choices=['wsgi', 'asgi'], help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port, args.llm_latency, args.retrieval_latency)
+        return
+
+    levels = [int(level) for level in args.concurrency.split(',')]
+    print(f"stub LLM latency {args.llm_latency}s, retrieval latency {args.retrieval_latency}s")
+    print(f"{'mode':<6}{'conc':>6}{'req':>6}{'err':>5}{'p50 (s)':>10}{'p95 (s)':>10}{'p99 (s)':>10}"
+          f"{'req/s':>9}{'threads':>9}")
+
+    for mode in args.modes.split(','):
+        port = free_port()
+        env = dict(os.environ, WARMUP_ON_START='false')
+        server = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), '--serve', mode, '--port', str(port),
+             '--llm-latency', str(args.llm_latency), '--retrieval-latency', str(args.retrieval_latency)],
+            cwd=ROOT_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        base_url = f"http://127.0.0.1:{port}"
+        try:
+            wait_ready(base_url)
+            for concurrency in levels:
+                total = concurrency * args.requests_per_worker
+                latencies, errors, wall = asyncio.run(run_level(base_url, concurrency, total))
+                with urllib.request.urlopen(f"{base_url}/bench/threads") as response:
+                    threads = json.load(response)['threads']
+                if latencies:
+                    p50, p95, p99 = (percentile(latencies, q) for q in (50, 95, 99))
+                else:
+                    p50 = p95 = p99 = float('nan')
+                print(f"{mode:<6}{concurrency:>6}{total:>6}{errors:>5}{p50:>10.2f}{p95:>10.2f}{p99:>10.2f}"
+                      f"{len(latencies) / wall:>9.1f}{threads:>9}")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+基準測試：廣泛問題的子問題逐一 adaptive_retrieval 與 adaptive_retrieval_many 批次檢索的延遲
+
+用法：python benchmarks/bench_broad_retrieval.py [--docs 20] [--sub-questions 5] [--fake-model]
+以暫存的 ChromaDB 集合與 BM25 索引量測；--fake-model 以雜湊向量取代嵌入模型，
+只量測向量資料庫、BM25 與鄰居擴展的部分（不需下載模型）。
+"""
+
+import argparse
+import hashlib
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import chromadb
+import numpy as np
+from chromadb.config import Settings
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.bm25_index import BM25Index
+from src.document_catalog import DocumentCatalog
+from src.smart_retrieval import SmartRetrievalService
+from src.vector_store import VectorStore
+
+TOPICS = ['線性代數', '微積分', '機率與統計', '資料結構', '演算法', '作業系統', '計算機網路', '訊號與系統']
+
+
+class HashEmbeddingModel:
+    """以文字雜湊產生固定向量的替身模型"""
+
+    def encode(self, texts, **kwargs):
+        return np.stack([
+            np.random.default_rng(int(hashlib.md5(text.encode('utf-8')).hexdigest()[:8], 16))
+            .standard_normal(384).astype(np.float32)
+            for text in texts
+        ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare sequential and batched sub-question retrieval')
+    parser.add_argument('--docs', type=int, default=20)
+    parser.add_argument('--sub-questions', type=int, default=5)
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--fake-model', action='store_true')
+    args = parser.parse_args()
+
+    if args.fake_model:
+        model = HashEmbeddingModel()
+    else:
+        from src.services import get_embedding_model
+        model = get_embedding_model()
+
+    with tempfile.TemporaryDirectory() as path:
+        store = VectorStore(
+            client=chromadb.PersistentClient(path=path, settings=Settings(anonymized_telemetry=False)),
+            embedding_model=model,
+            catalog=DocumentCatalog(db_path=os.path.join(path, 'catalog.db')),
+            bm25_index=BM25Index(db_path=os.path.join(path, 'bm25.db'))
+        )
+        for d in range(args.docs):
+            topic = TOPICS[d % len(TOPICS)]
+            text = ''.join(f"{topic}第{i}節：定義、定理與例題 {d}-{i}。" * 8 for i in range(60))
+            store.add_document(text, f"note{d}.pdf")
+        retrieval = SmartRetrievalService(store)
+        print(f"Indexed {store.get_chunk_count()} chunks from {args.docs} documents")
+
+        timings = {'sequential': [], 'batched': []}
+        for r in range(args.rounds):
+            # 每輪使用不同的子問題，避免查詢嵌入快取命中
+            sub_questions = [
+                f"請說明{TOPICS[(r + i) % len(TOPICS)]}第{r}節的重點 {i}" for i in range(args.sub_questions)
+            ]
+            start = time.perf_counter()
+            sequential = [retrieval.adaptive_retrieval(question) for question in sub_questions]
+            timings['sequential'].append((time.perf_counter() - start) * 1000)
+            store.query_cache.clear()
+
+            start = time.perf_counter()
+            batched = retrieval.adaptive_retrieval_many(sub_questions)
+            timings['batched'].append((time.perf_counter() - start) * 1000)
+            store.query_cache.clear()
+
+            assert [[doc['id'] for doc in docs] for docs in sequential] == \
+                   [[doc['id'] for doc in docs] for docs in batched]
+
+    sequential_ms = statistics.median(timings['sequential'])
+    batched_ms = statistics.median(timings['batched'])
+    print(f"{args.sub_questions} sub-questions, median over {args.rounds} rounds")
+    print(f"sequential: {sequential_ms:.1f} ms")
+    print(f"batched:    {batched_ms:.1f} ms  ({sequential_ms / batched_ms:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+基準測試：舊版逐字元回溯分塊與共用分塊引擎在大型 OCR 輸出上的速度與重複率
+
+用法：python benchmarks/bench_chunker.py [--chars 2000000] [--chunk-size 1000] [--overlap 200]
+以合成的 OCR 文字（中英混合、不規則換行、部分段落沒有標點）量測每秒分塊數、
+重複率（各塊總字數 / 原文字數 - 1）與近乎重複的片段數（新增內容不到塊長 10% 的片段）。
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.text_chunker import TextChunker
+from src.token_counter import HeuristicTokenCounter
+
+SENTENCES = [
+    '特徵值與特徵向量描述線性轉換在特定方向上的伸縮。',
+    '若矩陣可對角化，則存在由特徵向量組成的基底！',
+    'The determinant is zero exactly when the matrix is singular.',
+    '梯度下降法沿負梯度方向更新參數，學習率過大時可能發散？',
+    'Big-O notation bounds the growth rate of an algorithm, e.g. O(n log n).',
+    '作業系統以分頁與分段管理記憶體，',
+]
+SCAN_NOISE = '模糊掃描文字影像辨識錯誤頁碼表格公式圖片'
+
+
+def legacy_split(text, chunk_size, chunk_overlap):
+    """舊版 VectorStore._split_text_into_chunks"""
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = start + chunk_size
+        if end >= len(text):
+            chunks.append(text[start:])
+            break
+        split_end = end
+        for i in range(end, max(start, end - 100), -1):
+            if text[i] in [' ', '\n', '\t', '。', '！', '？', '.', '!', '?']:
+                split_end = i + 1
+                break
+        chunks.append(text[start:split_end])
+        start = split_end - chunk_overlap if split_end > chunk_overlap else split_end
+    return [chunk.strip() for chunk in chunks if chunk.strip()]
+
+
+def synthetic_ocr_text(chars, seed=0):
+    rng = random.Random(seed)
+    parts, length = [], 0
+    while length < chars:
+        if rng.random() < 0.05:
+            # 掃描品質差、沒有標點與空白的長段落
+            part = ''.join(rng.choice(SCAN_NOISE) for _ in range(rng.randint(120, 360)))
+        else:
+            # 句子加上編號，讓每個片段在原文中的位置唯一
+            part = ''.join(f"{rng.choice(SENTENCES)}[{len(parts)}-{i}]" for i in range(rng.randint(2, 8)))
+            part = part.replace('，', '\n', rng.randint(0, 2))  # OCR 斷行
+        parts.append(part)
+        length += len(part) + 2
+    return '\n\n'.join(parts)[:chars]
+
+
+def measure(name, split, text, chunk_size):
+    start = time.perf_counter()
+    chunks = split(text)
+    seconds = time.perf_counter() - start
+
+    duplicate_ratio = sum(len(chunk) for chunk in chunks) / len(text) - 1
+    # 近乎重複：與前一塊相比，新增的內容不到 chunk_size 的 10%
+    near_duplicates, covered, cursor = 0, 0, 0
+    for chunk in chunks:
+        position = text.find(chunk, cursor)
+        end = position + len(chunk)
+        if end - max(position, covered) < chunk_size * 0.1:
+            near_duplicates += 1
+        covered, cursor = max(covered, end), position + 1
+
+    print(f"{name:<18}{len(chunks):>9}{len(chunks) / seconds:>12.0f}{seconds * 1000:>10.0f}"
+          f"{duplicate_ratio:>12.1%}{near_duplicates:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare chunking throughput and duplicate ratio')
+    parser.add_argument('--chars', type=int, default=2_000_000)
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--overlap', type=int, default=200)
+    args = parser.parse_args()
+
+    text = synthetic_ocr_text(args.chars)
+    print(f"{len(text)} chars, chunk_size={args.chunk_size}, overlap={args.overlap}")
+    print(f"{'splitter':<18}{'chunks':>9}{'chunks/s':>12}{'ms':>10}{'dup ratio':>12}{'near-dup':>10}")
+
+    measure('legacy', lambda t: legacy_split(t, args.chunk_size, args.overlap), text, args.chunk_size)
+    measure('chunker (chars)', TextChunker(args.chunk_size, args.overlap).split, text, args.chunk_size)
+    # token 模式：以約 1.5 字元/token 換算，讓塊長與字元模式相近
+    token_size, token_overlap = int(args.chunk_size / 1.5), int(args.overlap / 1.5)
+    chunker = TextChunker(token_size, token_overlap, token_counter=HeuristicTokenCounter())
+    measure('chunker (tokens)', chunker.split, text, args.chunk_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+基準測試：`import app.app` 的冷啟動時間
+
+用法：python benchmarks/bench_cold_start.py [--runs 5]
+每次在新的子程序中匯入（關閉背景預熱），並另外量測 sentence_transformers 與 chromadb
+的匯入時間作為延遲載入前的對照。
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TIMED_IMPORT = r'''
+import sys, time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+{statement}
+print(time.perf_counter() - start)
+'''
+
+
+def time_import(statement, runs):
+    env = dict(os.environ, WARMUP_ON_START='false')
+    timings = []
+    for _ in range(runs):
+        script = TIMED_IMPORT.format(root=ROOT_DIR, statement=statement)
+        output = subprocess.run(
+            [sys.executable, '-c', script], cwd=ROOT_DIR, env=env,
+            capture_output=True, text=True, check=True
+        ).stdout
+        timings.append(float(output.strip().splitlines()[-1]))
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure cold-start import time of app.app')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    cases = [
+        ('import app.app', 'import app.app'),
+        ('heavy deps (eager baseline)', 'import sentence_transformers, chromadb'),
+    ]
+    print(f"{'case':<30}{'median (s)':>12}{'min (s)':>10}{'max (s)':>10}")
+    for label, statement in cases:
+        timings = time_import(statement, args.runs)
+        print(f"{label:<30}{statistics.median(timings):>12.2f}{min(timings):>10.2f}{max(timings):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+基準測試：逐一 get_chunk_by_id 與批次 get_chunks 取得相鄰片段的延遲
+
+用法：python benchmarks/bench_neighbor_fetch.py [--docs 50] [--chunks 200] [--hits 20]
+以隨機向量建立暫存的 ChromaDB 集合，不需要載入嵌入模型。
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+import chromadb
+import numpy as np
+from chromadb.config import Settings
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.bm25_index import BM25Index
+from src.document_catalog import DocumentCatalog
+from src.vector_store import VectorStore
+
+
+def build_store(path, docs, chunks, dim=384, batch_size=5000):
+    client = chromadb.PersistentClient(path=path, settings=Settings(anonymized_telemetry=False))
+    catalog = DocumentCatalog(db_path=os.path.join(path, 'catalog.db'))
+    bm25_index = BM25Index(db_path=os.path.join(path, 'bm25.db'))
+    store = VectorStore(client=client, embedding_model=object(), catalog=catalog, bm25_index=bm25_index)
+    rng = np.random.default_rng(0)
+    ids, documents, metadatas = [], [], []
+    for d in range(docs):
+        for i in range(chunks):
+            ids.append(f"doc{d}.pdf_chunk_{i}")
+            documents.append(f"document {d} chunk {i} " * 20)
+            metadatas.append({'filename': f"doc{d}.pdf", 'chunk_index': i, 'total_chunks': chunks})
+    for start in range(0, len(ids), batch_size):
+        end = start + batch_size
+        store.collection.add(
+            ids=ids[start:end], documents=documents[start:end], metadatas=metadatas[start:end],
+            embeddings=rng.standard_normal((len(ids[start:end]), dim)).astype(np.float32)
+        )
+    return store
+
+
+def neighbor_ids(hits):
+    return [
+        f"{filename}_chunk_{index + offset}"
+        for filename, index in hits for offset in (-1, 1) if index + offset >= 0
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare serial and batched neighbor fetch')
+    parser.add_argument('--docs', type=int, default=50)
+    parser.add_argument('--chunks', type=int, default=200)
+    parser.add_argument('--hits', type=int, default=20)
+    parser.add_argument('--rounds', type=int, default=30)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as path:
+        store = build_store(path, args.docs, args.chunks)
+        random.seed(0)
+        serial, batched = [], []
+        for _ in range(args.rounds):
+            hits = [(f"doc{random.randrange(args.docs)}.pdf", random.randrange(args.chunks)) for _ in range(args.hits)]
+            ids = neighbor_ids(hits)
+
+            start = time.perf_counter()
+            serial_chunks = [chunk for chunk in (store.get_chunk_by_id(i) for i in ids) if chunk]
+            serial.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            batched_chunks = store.get_chunks(ids)
+            batched.append(time.perf_counter() - start)
+
+            assert {c['id'] for c in serial_chunks} == {c['id'] for c in batched_chunks}
+
+        print(f"{args.docs * args.chunks} chunks, {args.hits} hits -> up to {args.hits * 2} neighbors per question")
+        print(f"{'approach':<28}{'median (ms)':>12}{'p95 (ms)':>10}")
+        for label, timings in (('serial get_chunk_by_id', serial), ('batched get_chunks', batched)):
+            timings = sorted(timings)
+            p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+            print(f"{label:<28}{statistics.median(timings) * 1000:>12.2f}{p95 * 1000:>10.2f}")
+        print(f"Speedup: {statistics.median(serial) / statistics.median(batched):.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+基準測試：小幅修改長文件後，刪除重建與增量重新索引的耗時與嵌入片段數
+
+用法：python benchmarks/bench_reindex.py [--paragraphs 400] [--edits 1,5,20] [--fake-model]
+以暫存的 ChromaDB 集合與 BM25 索引量測；--fake-model 以雜湊向量取代嵌入模型，
+並以 --encode-ms 模擬每個片段的嵌入時間（不需下載模型）。
+"""
+
+import argparse
+import hashlib
+import os
+import random
+import sys
+import tempfile
+import time
+
+import chromadb
+import numpy as np
+from chromadb.config import Settings
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.bm25_index import BM25Index
+from src.document_catalog import DocumentCatalog
+from src.vector_store import VectorStore
+
+
+class HashEmbeddingModel:
+    """以文字雜湊產生固定向量的替身模型，每個片段加上固定的模擬嵌入時間"""
+
+    def __init__(self, encode_ms):
+        self.encode_ms = encode_ms
+        self.encoded_texts = 0
+
+    def encode(self, texts, **kwargs):
+        self.encoded_texts += len(texts)
+        time.sleep(self.encode_ms / 1000 * len(texts))
+        return np.stack([
+            np.random.default_rng(int(hashlib.md5(text.encode('utf-8')).hexdigest()[:8], 16))
+            .standard_normal(384).astype(np.float32)
+            for text in texts
+        ])
+
+
+def make_paragraphs(count):
+    return [f"第{p}節：" + f"定義{p}說明矩陣、特徵值與線性轉換之間的關係。" * 12 for p in range(count)]
+
+
+def edit(paragraphs, edits, seed):
+    """隨機修正 edits 個段落中的一個字（模擬 OCR 錯字修正）"""
+    rng = random.Random(seed)
+    edited = list(paragraphs)
+    for p in rng.sample(range(len(edited)), edits):
+        edited[p] = edited[p].replace('特徵值', '特徵植', 1)
+    return edited
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare full rebuild and incremental re-indexing after small edits')
+    parser.add_argument('--paragraphs', type=int, default=400)
+    parser.add_argument('--edits', default='1,5,20')
+    parser.add_argument('--fake-model', action='store_true')
+    parser.add_argument('--encode-ms', type=float, default=5.0)
+    args = parser.parse_args()
+
+    if args.fake_model:
+        model = HashEmbeddingModel(args.encode_ms)
+    else:
+        from src.services import get_embedding_model
+        model = get_embedding_model()
+
+    paragraphs = make_paragraphs(args.paragraphs)
+    print(f"{'edits':<8}{'mode':<14}{'chunks':>8}{'embedded':>10}{'seconds':>10}")
+    for edits in [int(level) for level in args.edits.split(',')]:
+        edited = '\n\n'.join(edit(paragraphs, edits, seed=edits))
+        for mode in ('rebuild', 'incremental'):
+            with tempfile.TemporaryDirectory() as path:
+                store = VectorStore(
+                    client=chromadb.PersistentClient(path=path, settings=Settings(anonymized_telemetry=False)),
+                    embedding_model=model,
+                    catalog=DocumentCatalog(db_path=os.path.join(path, 'catalog.db')),
+                    bm25_index=BM25Index(db_path=os.path.join(path, 'bm25.db'))
+                )
+                store.add_document('\n\n'.join(paragraphs), 'notes.pdf')
+                encoded_before = getattr(model, 'encoded_texts', None)
+
+                start = time.perf_counter()
+                if mode == 'rebuild':
+                    store.delete_document('notes.pdf')
+                store.add_document(edited, 'notes.pdf')
+                seconds = time.perf_counter() - start
+
+                embedded = model.encoded_texts - encoded_before if encoded_before is not None else '-'
+                print(f"{edits:<8}{mode:<14}{store.get_chunk_count():>8}{embedded:>10}{seconds:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
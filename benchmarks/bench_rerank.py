@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+基準測試：cross-encoder 重新排序在不同候選數下的延遲與檢索品質
+
+用法：python benchmarks/bench_rerank.py [--candidates 10,20,40] [--top-k 5] [--backend onnx --onnx-file onnx/model_qint8_avx512.onnx]
+以暫存的 ChromaDB 集合與 BM25 索引建立合成筆記，每個查詢只對應一個含有答案的片段；
+比較未重新排序與各候選數下的 recall@k、MRR 以及重新排序階段的 p50/p95 延遲。
+需要嵌入模型與 RERANK_MODEL（首次執行時下載）。
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import chromadb
+from chromadb.config import Settings
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.config import Config
+from src.bm25_index import BM25Index
+from src.document_catalog import DocumentCatalog
+from src.reranker import Reranker
+from src.vector_store import VectorStore
+
+TOPICS = ['線性代數', '微積分', '機率與統計', '資料結構', '演算法', '作業系統', '計算機網路', '訊號與系統']
+FACTS = [
+    ('矩陣的秩', '矩陣的秩等於其列空間的維度，也等於非零奇異值的個數。'),
+    ('洛必達法則', '洛必達法則適用於零比零或無限比無限的不定型極限。'),
+    ('貝氏定理', '貝氏定理以先驗機率與似然函數計算後驗機率。'),
+    ('紅黑樹', '紅黑樹透過節點著色與旋轉維持近似平衡，搜尋時間為對數級。'),
+    ('動態規劃', '動態規劃將問題拆成重疊子問題並記錄子問題的解以避免重複計算。'),
+    ('分頁', '分頁將虛擬記憶體切成固定大小的頁面，並以頁表對應實體頁框。'),
+    ('三向交握', 'TCP 以三向交握建立連線：SYN、SYN-ACK、ACK。'),
+    ('取樣定理', '取樣頻率需大於訊號最高頻率的兩倍，才能無失真地重建訊號。'),
+]
+
+
+def build_store(path, docs, model):
+    store = VectorStore(
+        client=chromadb.PersistentClient(path=path, settings=Settings(anonymized_telemetry=False)),
+        embedding_model=model,
+        catalog=DocumentCatalog(db_path=os.path.join(path, 'catalog.db')),
+        bm25_index=BM25Index(db_path=os.path.join(path, 'bm25.db'))
+    )
+    for d in range(docs):
+        topic = TOPICS[d % len(TOPICS)]
+        term, fact = FACTS[d % len(FACTS)]
+        # 同主題的干擾段落大量重複關鍵詞，答案只出現在其中一段
+        paragraphs = [f"{topic}第{i}節提到{term}的歷史與相關名詞，本節並未說明其內容。" * 6 for i in range(40)]
+        paragraphs.insert(20, f"{topic}重點整理：{fact}" * 3)
+        store.add_document('\n'.join(paragraphs), f"note{d}.pdf")
+    return store
+
+
+def evaluate(ranked_lists, relevant, top_k):
+    """回傳 (recall@k, MRR)"""
+    hits, reciprocal = 0, 0.0
+    for docs, answer in zip(ranked_lists, relevant):
+        contents = [doc['content'] for doc in docs[:top_k]]
+        rank = next((i for i, content in enumerate(contents) if answer in content), None)
+        if rank is not None:
+            hits += 1
+            reciprocal += 1 / (rank + 1)
+    return hits / len(relevant), reciprocal / len(relevant)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure cross-encoder rerank latency and quality by candidate count')
+    parser.add_argument('--docs', type=int, default=16)
+    parser.add_argument('--candidates', default='10,20,40')
+    parser.add_argument('--top-k', type=int, default=Config.TOP_K)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--backend', default=Config.RERANK_BACKEND)
+    parser.add_argument('--onnx-file', default=Config.RERANK_ONNX_FILE)
+    args = parser.parse_args()
+
+    Config.RERANK_BACKEND = args.backend
+    Config.RERANK_ONNX_FILE = args.onnx_file
+    from src.services import get_embedding_model, get_reranker_model
+    reranker = Reranker(model=get_reranker_model())
+
+    questions = [f"{term}是什麼？" for term, _ in FACTS]
+    relevant = [fact for _, fact in FACTS]
+
+    with tempfile.TemporaryDirectory() as path:
+        store = build_store(path, args.docs, get_embedding_model())
+        print(f"Indexed {store.get_chunk_count()} chunks from {args.docs} documents, "
+              f"{len(questions)} questions, reranker {Config.RERANK_MODEL} ({args.backend})")
+        levels = [int(level) for level in args.candidates.split(',')]
+        candidate_lists = store.hybrid_search_many(questions, max(levels))
+
+        recall, mrr = evaluate(candidate_lists, relevant, args.top_k)
+        print(f"{'candidates':<12}{'recall@' + str(args.top_k):>10}{'MRR':>8}{'p50 (ms)':>11}{'p95 (ms)':>11}")
+        print(f"{'no rerank':<12}{recall:>10.2f}{mrr:>8.2f}{'-':>11}{'-':>11}")
+
+        for level in levels:
+            candidates = [docs[:level] for docs in candidate_lists]
+            timings = []
+            for _ in range(args.rounds):
+                start = time.perf_counter()
+                reranked = reranker.rerank_many(questions, candidates, [args.top_k] * len(questions))
+                timings.append((time.perf_counter() - start) * 1000)
+            recall, mrr = evaluate(reranked, relevant, args.top_k)
+            timings.sort()
+            p95 = timings[min(len(timings) - 1, int(round(0.95 * (len(timings) - 1))))]
+            print(f"{level:<12}{recall:>10.2f}{mrr:>8.2f}{statistics.median(timings):>11.1f}{p95:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+基準測試：限定文檔範圍的檢索與全集合檢索的延遲，以及結果中屬於目標文檔的比例
+
+用法：python benchmarks/bench_scoped_retrieval.py [--documents 200] [--chunks 50] [--backend chroma|local] [--fake-model]
+建立 documents 份、每份約 chunks 個片段的暫存集合，對單一文檔提問：
+全集合檢索要取到同樣多的目標片段需要加大 top_k（over-fetch），限定範圍時 where 條件直接交給向量資料庫過濾。
+"""
+
+import argparse
+import hashlib
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.bm25_index import BM25Index
+from src.document_catalog import DocumentCatalog
+from src.local_vector_index import LocalVectorCollection
+from src.vector_store import VectorStore
+
+TOPICS = ['線性代數', '機率論', '演算法', '作業系統', '計算機網路', '資料庫', '微積分', '統計學']
+
+
+class HashEmbeddingModel:
+    """以字元雜湊累加產生向量的替身模型：共用字詞越多的文字向量越接近"""
+
+    def encode(self, texts, **kwargs):
+        vectors = np.zeros((len(texts), 384), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for char in text:
+                vectors[i, int(hashlib.md5(char.encode('utf-8')).hexdigest()[:6], 16) % 384] += 1
+        return vectors
+
+
+def make_document(index, chunks, rng):
+    topic = TOPICS[index % len(TOPICS)]
+    paragraphs = [
+        f"第{index}份講義第{c}節：{topic}的重點{rng.randint(0, 9999)}，" + f"說明{topic}中的定義、例題與證明。" * 30
+        for c in range(chunks)
+    ]
+    return '\n\n'.join(paragraphs)
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q) * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare scoped and unscoped retrieval latency and precision')
+    parser.add_argument('--documents', type=int, default=200)
+    parser.add_argument('--chunks', type=int, default=50)
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--backend', choices=['chroma', 'local'], default='chroma')
+    parser.add_argument('--fake-model', action='store_true')
+    args = parser.parse_args()
+
+    if args.fake_model:
+        model = HashEmbeddingModel()
+    else:
+        from src.services import get_embedding_model
+        model = get_embedding_model()
+
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as path:
+        if args.backend == 'local':
+            backend = {'collection': LocalVectorCollection(os.path.join(path, 'vectors'))}
+        else:
+            import chromadb
+            from chromadb.config import Settings
+            backend = {'client': chromadb.PersistentClient(path=path, settings=Settings(anonymized_telemetry=False))}
+        store = VectorStore(
+            embedding_model=model,
+            catalog=DocumentCatalog(db_path=os.path.join(path, 'catalog.db')),
+            bm25_index=BM25Index(db_path=os.path.join(path, 'bm25.db')),
+            **backend
+        )
+        start = time.perf_counter()
+        for d in range(args.documents):
+            store.add_document(make_document(d, args.chunks, rng), f"lecture{d}.pdf")
+        print(f"{args.backend}: {args.documents} documents, {store.get_chunk_count()} chunks "
+              f"(indexed in {time.perf_counter() - start:.1f}s), top_k={args.top_k}")
+
+        targets = [rng.randrange(args.documents) for _ in range(args.queries)]
+        questions = [f"{TOPICS[t % len(TOPICS)]}的定義與例題" for t in targets]
+        store.hybrid_search_many(questions[:1], args.top_k)  # 預熱嵌入快取與 BM25
+
+        print(f"{'mode':<22}{'top_k':>7}{'p50 ms':>9}{'p95 ms':>9}{'in target':>11}{'target hits':>13}")
+        modes = [
+            ('unscoped', args.top_k, False),
+            ('unscoped over-fetch', args.top_k * 10, False),
+            ('scoped (where)', args.top_k, True),
+        ]
+        for name, top_k, scoped in modes:
+            latencies, in_target, hits = [], 0, 0
+            for question, target in zip(questions, targets):
+                filename = f"lecture{target}.pdf"
+                filenames = store.catalog.resolve_scope({'filenames': [filename]}) if scoped else None
+                start = time.perf_counter()
+                results = store.hybrid_search(question, top_k, filenames)
+                latencies.append(time.perf_counter() - start)
+                matched = sum(doc['metadata'].get('filename') == filename for doc in results)
+                in_target += matched / max(len(results), 1)
+                hits += matched
+            print(f"{name:<22}{top_k:>7}{percentile(latencies, 50):>9.2f}{percentile(latencies, 95):>9.2f}"
+                  f"{in_target / len(questions):>11.1%}{hits / len(questions):>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+基準測試：各服務各自建立 VectorStore 與共用單一實例的啟動時間與記憶體
+
+用法：python benchmarks/bench_shared_services.py
+每種模式在獨立的子程序中執行，以取得乾淨的啟動時間與峰值 RSS。
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODE_SCRIPT = r'''
+import json, resource, sys, time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+from src.config import Config
+from src.vector_store import VectorStore
+from src.smart_retrieval import SmartRetrievalService
+if {mode!r} == 'separate':
+    # 舊行為：app 與 SmartRetrievalService 各自載入模型並開啟 PersistentClient
+    import chromadb
+    from sentence_transformers import SentenceTransformer
+    def own_store():
+        return VectorStore(
+            client=chromadb.PersistentClient(path=Config.VECTOR_STORE_DIR),
+            embedding_model=SentenceTransformer(Config.LOCAL_EMBEDDING_MODEL)
+        )
+    app_store = own_store()
+    retrieval = SmartRetrievalService(own_store())
+else:
+    from src.services import get_vector_store
+    app_store = get_vector_store()
+    retrieval = SmartRetrievalService()
+# 模型為延遲載入，強制載入以量測完整啟動成本
+for store in (app_store, retrieval.vector_store):
+    store.embedding_model
+    store.collection
+elapsed = time.perf_counter() - start
+scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+print(json.dumps({{
+    'seconds': round(elapsed, 2),
+    'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+    'shared_model': app_store.embedding_model is retrieval.vector_store.embedding_model
+}}))
+'''
+
+
+def run_mode(mode):
+    script = MODE_SCRIPT.format(root=ROOT_DIR, mode=mode)
+    output = subprocess.run(
+        [sys.executable, '-c', script], cwd=ROOT_DIR,
+        capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    results = {mode: run_mode(mode) for mode in ('separate', 'shared')}
+    print(f"{'mode':<10}{'startup (s)':>14}{'peak RSS (MB)':>16}{'shared model':>15}")
+    for mode, result in results.items():
+        print(f"{mode:<10}{result['seconds']:>14}{result['peak_rss_mb']:>16}{str(result['shared_model']):>15}")
+    saved_seconds = results['separate']['seconds'] - results['shared']['seconds']
+    saved_rss = results['separate']['peak_rss_mb'] - results['shared']['peak_rss_mb']
+    print(f"\nShared services save {saved_seconds:.2f}s startup and {saved_rss:.1f} MB peak RSS")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+基準測試：所有 tenant 共用單一集合與每個 tenant 獨立集合的查詢延遲、刪除成本與開啟成本
+
+用法：python benchmarks/bench_tenants.py [--large-documents 100] [--small-documents 5] [--chunks 20] [--backend chroma|local] [--fake-model]
+一個大 tenant（large-documents 份文檔）與一個小 tenant（small-documents 份）：
+共用集合（舊做法，檔名加上 tenant 前綴避免衝突）分別以不過濾與 where 過濾該 tenant 的檔名查詢小 tenant 的問題，
+獨立集合則只查詢小 tenant 自己的集合；刪除成本為刪除小 tenant 每份文檔的平均時間。
+"""
+
+import argparse
+import hashlib
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src import services
+from src.bm25_index import BM25Index
+from src.config import Config
+from src.document_catalog import DocumentCatalog
+from src.local_vector_index import LocalVectorCollection
+from src.tenants import TenantRegistry
+from src.vector_store import VectorStore
+
+TOPICS = ['線性代數', '機率論', '演算法', '作業系統', '計算機網路', '資料庫', '微積分', '統計學']
+
+
+class HashEmbeddingModel:
+    """以字元雜湊累加產生向量的替身模型：共用字詞越多的文字向量越接近"""
+
+    def encode(self, texts, **kwargs):
+        vectors = np.zeros((len(texts), 384), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for char in text:
+                vectors[i, int(hashlib.md5(char.encode('utf-8')).hexdigest()[:6], 16) % 384] += 1
+        return vectors
+
+
+def make_document(index, chunks, rng):
+    topic = TOPICS[index % len(TOPICS)]
+    paragraphs = [
+        f"第{index}份講義第{c}節：{topic}的重點{rng.randint(0, 9999)}，" + f"說明{topic}中的定義、例題與證明。" * 30
+        for c in range(chunks)
+    ]
+    return '\n\n'.join(paragraphs)
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q) * 1000)
+
+
+def timed_queries(store, questions, top_k, filenames=None):
+    """回傳每次查詢的延遲與所有結果的檔名"""
+    latencies, result_filenames = [], []
+    for question in questions:
+        start = time.perf_counter()
+        results = store.hybrid_search(question, top_k, filenames)
+        latencies.append(time.perf_counter() - start)
+        result_filenames.extend(doc['metadata'].get('filename') for doc in results)
+    return latencies, result_filenames
+
+
+def timed_deletes(store, filenames):
+    start = time.perf_counter()
+    for filename in filenames:
+        store.delete_document(filename)
+    return (time.perf_counter() - start) / len(filenames) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare a shared collection with per-tenant collections')
+    parser.add_argument('--large-documents', type=int, default=100)
+    parser.add_argument('--small-documents', type=int, default=5)
+    parser.add_argument('--chunks', type=int, default=20)
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--backend', choices=['chroma', 'local'], default='chroma')
+    parser.add_argument('--fake-model', action='store_true')
+    args = parser.parse_args()
+
+    if args.fake_model:
+        services.register('embedding_model', HashEmbeddingModel())
+    Config.VECTOR_BACKEND = args.backend
+
+    rng = random.Random(0)
+    corpus = {
+        'big': [make_document(d, args.chunks, rng) for d in range(args.large_documents)],
+        'small': [make_document(d, args.chunks, rng) for d in range(args.small_documents)],
+    }
+    questions = [f"{TOPICS[rng.randrange(args.small_documents) % len(TOPICS)]}的定義與例題" for _ in range(args.queries)]
+    small_filenames = [f"lecture{d}.pdf" for d in range(args.small_documents)]
+
+    with tempfile.TemporaryDirectory() as path:
+        # 共用集合：所有 tenant 的片段在同一個集合，檔名加上 tenant 前綴
+        if args.backend == 'local':
+            backend = {'collection': LocalVectorCollection(os.path.join(path, 'shared', 'vectors'))}
+        else:
+            backend = {'client': services.create_chroma_client(os.path.join(path, 'shared'))}
+        shared = VectorStore(
+            catalog=DocumentCatalog(db_path=os.path.join(path, 'shared', 'catalog.db')),
+            bm25_index=BM25Index(db_path=os.path.join(path, 'shared', 'bm25.db')),
+            **backend
+        )
+        # 獨立集合：TenantRegistry 依需要開啟各 tenant 的資料目錄
+        Config.TENANTS_DIR = os.path.join(path, 'tenants')
+        registry = TenantRegistry(max_open=2)
+
+        start = time.perf_counter()
+        for tenant_id, documents in corpus.items():
+            with registry.use(tenant_id) as tenant:
+                for d, text in enumerate(documents):
+                    shared.add_document(text, f"{tenant_id}/lecture{d}.pdf")
+                    tenant.vector_store.add_document(text, f"lecture{d}.pdf")
+        print(f"{args.backend}: big tenant {args.large_documents} documents, small tenant {args.small_documents} documents, "
+              f"{shared.get_chunk_count()} chunks in the shared collection (indexed in {time.perf_counter() - start:.1f}s)")
+
+        with registry.use('small') as tenant:
+            small = tenant.vector_store
+            small.hybrid_search_many(questions[:1], args.top_k)
+            shared.hybrid_search_many(questions[:1], args.top_k)  # 預熱嵌入快取與 BM25
+
+            print(f"{'small tenant query':<28}{'p50 ms':>9}{'p95 ms':>9}{'own results':>13}")
+            modes = [
+                ('shared, unfiltered', shared, None),
+                ('shared, where tenant', shared, [f"small/{name}" for name in small_filenames]),
+                ('per-tenant collection', small, None),
+            ]
+            for name, store, filenames in modes:
+                latencies, result_filenames = timed_queries(store, questions, args.top_k, filenames)
+                own = sum(
+                    filename.startswith('small/') if store is shared else True for filename in result_filenames
+                ) / max(len(result_filenames), 1)
+                print(f"{name:<28}{percentile(latencies, 50):>9.2f}{percentile(latencies, 95):>9.2f}{own:>13.1%}")
+
+            print(f"{'delete small tenant docs':<28}{'ms/doc':>9}")
+            print(f"{'shared collection':<28}{timed_deletes(shared, [f'small/{name}' for name in small_filenames]):>9.1f}")
+            print(f"{'per-tenant collection':<28}{timed_deletes(small, small_filenames):>9.1f}")
+
+        # 冷開啟：關閉後重新開啟大 tenant 並完成第一次查詢
+        registry.close_all()
+        start = time.perf_counter()
+        with registry.use('big') as tenant:
+            tenant.vector_store.hybrid_search(questions[0], args.top_k)
+        print(f"open big tenant + first query: {(time.perf_counter() - start) * 1000:.0f} ms")
+        registry.close_all()
+
+
+if __name__ == "__main__":
+    main()
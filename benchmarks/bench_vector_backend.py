@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+基準測試：ChromaDB 與本機向量後端（精確 / HNSW）的查詢延遲、記憶體（RSS）與冷啟動時間
+
+用法：python benchmarks/bench_vector_backend.py [--sizes 1000,10000,50000] [--dim 384] [--queries 200]
+以分群的隨機向量（模擬嵌入向量的主題結構）建立暫存集合；每個後端的建立與查詢各在獨立的子程序執行，
+冷啟動 = 開啟既有集合並完成第一次查詢的時間，RSS 為查詢子程序的最大常駐記憶體（+RSS 為載入模組後、開啟集合並查詢的增量），
+recall@10 以 NumPy 精確檢索的結果為準（由父程序預先算好，不計入子程序的記憶體）。
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BACKENDS = ['chroma', 'local-exact', 'local-hnsw']
+TOP_K = 10
+
+
+def make_vectors(count, dim, seed, corpus_size):
+    """以群中心加上雜訊產生向量；群中心只由 corpus_size 決定，不同 seed 取樣同一分布的不同點"""
+    centers = np.random.default_rng(0).standard_normal((max(1, corpus_size // 50), dim))
+    rng = np.random.default_rng(seed + 1)
+    points = centers[rng.integers(0, len(centers), count)] + rng.standard_normal((count, dim))
+    return points.astype(np.float32)
+
+
+def rss_mb():
+    """目前與最大常駐記憶體（MB）；/proc 的 VmHWM 不受 fork 前父程序記憶體影響"""
+    values = {}
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key in ('VmRSS', 'VmHWM'):
+                    values[key] = int(value.split()[0]) / 1024
+    except OSError:
+        # 非 Linux：ru_maxrss 在 macOS 以 bytes 計
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        values['VmHWM'] = values['VmRSS'] = peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+    return values['VmRSS'], values['VmHWM']
+
+
+def chunk_id(i):
+    return f"doc{i // 100}.pdf_chunk_{i % 100}"
+
+
+def ground_truth(path, size, dim, count):
+    """精確檢索的 top-k，寫入 path 供查詢子程序比對"""
+    vectors = make_vectors(size, dim, seed=0, corpus_size=size)
+    queries = make_vectors(count, dim, seed=1, corpus_size=size)
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    similarities = queries @ normalized.T
+    np.save(path, np.argsort(-similarities, axis=1)[:, :TOP_K])
+
+
+def open_collection(backend, path):
+    if backend == 'chroma':
+        import chromadb
+        from chromadb.config import Settings
+        client = chromadb.PersistentClient(path=path, settings=Settings(anonymized_telemetry=False))
+        collection = client.get_or_create_collection(name="pdf_documents", metadata={"hnsw:space": "cosine"})
+        return collection, client.get_max_batch_size()
+    from src.local_vector_index import LocalVectorCollection
+    threshold = 0 if backend == 'local-hnsw' else 10 ** 12
+    return LocalVectorCollection(path, hnsw_threshold=threshold), 5000
+
+
+def build(backend, path, size, dim):
+    """建立集合並寫入 size 個向量（以 VectorStore 的 metadata 格式）"""
+    vectors = make_vectors(size, dim, seed=0, corpus_size=size)
+    collection, batch_size = open_collection(backend, path)
+    start = time.perf_counter()
+    for batch_start in range(0, size, batch_size):
+        batch = range(batch_start, min(size, batch_start + batch_size))
+        collection.upsert(
+            ids=[chunk_id(i) for i in batch],
+            embeddings=vectors[batch.start:batch.stop],
+            documents=[f"chunk {i}" for i in batch],
+            metadatas=[{'filename': f"doc{i // 100}.pdf", 'chunk_id': i % 100} for i in batch]
+        )
+    if backend == 'local-hnsw':
+        # HNSW 索引在第一次查詢時建立並寫回磁碟，計入建立時間
+        collection.query(query_embeddings=vectors[:1].tolist(), n_results=TOP_K)
+    return {'build_s': time.perf_counter() - start}
+
+
+def run_queries(backend, path, size, dim, count):
+    """開啟既有集合並查詢，回傳冷啟動、延遲、RSS 與 recall"""
+    queries = make_vectors(count, dim, seed=1, corpus_size=size)
+    exact = np.load(os.path.join(path, 'ground_truth.npy'))
+    if backend == 'chroma':
+        import chromadb  # 模組載入不計入 +RSS
+    else:
+        import src.local_vector_index
+    rss_before, _ = rss_mb()
+
+    start = time.perf_counter()
+    collection, _ = open_collection(backend, path)
+    collection.query(query_embeddings=queries[:1].tolist(), n_results=TOP_K)
+    cold_start = time.perf_counter() - start
+
+    latencies, hits = [], 0
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        results = collection.query(query_embeddings=[query.tolist()], n_results=TOP_K)
+        latencies.append(time.perf_counter() - start)
+        expected = {chunk_id(j) for j in exact[i]}
+        hits += len(expected & set(results['ids'][0]))
+
+    rss, peak = rss_mb()
+    return {
+        'cold_start_s': cold_start,
+        'p50_ms': float(np.percentile(latencies, 50) * 1000),
+        'p95_ms': float(np.percentile(latencies, 95) * 1000),
+        'recall': hits / (count * TOP_K),
+        'rss_mb': peak,
+        # 開啟集合並查詢後增加的常駐記憶體（不含模組載入）；記憶體映射的向量頁面也計入
+        'rss_delta_mb': rss - rss_before,
+    }
+
+
+def child(args):
+    path, size, dim = args.child_path, args.child_size, args.dim
+    if args.child == 'build':
+        result = build(args.backend, path, size, dim)
+    else:
+        result = run_queries(args.backend, path, size, dim, args.queries)
+    print(json.dumps(result))
+
+
+def spawn(stage, backend, path, size, args):
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child', stage, '--backend', backend,
+         '--child-path', path, '--child-size', str(size), '--dim', str(args.dim), '--queries', str(args.queries)],
+        check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare vector backends on latency, RSS and cold start')
+    parser.add_argument('--sizes', default='1000,10000,50000')
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--backends', default=','.join(BACKENDS))
+    parser.add_argument('--child', choices=['build', 'query'])
+    parser.add_argument('--backend')
+    parser.add_argument('--child-path')
+    parser.add_argument('--child-size', type=int)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+        return
+
+    print(f"dim={args.dim}, queries={args.queries}, top_k={TOP_K}")
+    print(f"{'size':>8}  {'backend':<13}{'build s':>9}{'cold s':>9}{'p50 ms':>9}{'p95 ms':>9}"
+          f"{'RSS MB':>9}{'+RSS MB':>9}{'recall':>8}")
+    for size in [int(value) for value in args.sizes.split(',')]:
+        for backend in args.backends.split(','):
+            with tempfile.TemporaryDirectory() as path:
+                ground_truth(os.path.join(path, 'ground_truth.npy'), size, args.dim, args.queries)
+                built = spawn('build', backend, path, size, args)
+                queried = spawn('query', backend, path, size, args)
+            print(f"{size:>8}  {backend:<13}{built['build_s']:>9.2f}{queried['cold_start_s']:>9.3f}"
+                  f"{queried['p50_ms']:>9.2f}{queried['p95_ms']:>9.2f}{queried['rss_mb']:>9.0f}"
+                  f"{queried['rss_delta_mb']:>9.0f}{queried['recall']:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+問答快取 - 以問題嵌入向量的相似度查找先前的回答，命中時不必重新檢索與呼叫 LLM
+
+快取鍵包含嵌入模型名稱與文檔版本（DocumentCatalog.version()），新增或刪除文檔後版本改變，
+舊的回答自然失效。正式環境以 Redis 儲存（多個 worker 共用），未設定 REDIS_URL 時使用程序內快取。
+"""
+
+import hashlib
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+from src.config import Config
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+class InMemoryAnswerCacheBackend:
+    """程序內後端：只保留目前版本的項目，依插入順序淘汰"""
+
+    def __init__(self):
+        self._namespace = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_entries(self, namespace: str) -> List[Dict]:
+        with self._lock:
+            if namespace != self._namespace:
+                return []
+            return list(self._entries.values())
+
+    def add(self, namespace: str, entry_id: str, entry: Dict, max_size: int, ttl: int):
+        with self._lock:
+            if namespace != self._namespace:
+                # 文檔版本改變：舊版本的回答全部失效
+                self._namespace = namespace
+                self._entries.clear()
+            self._entries[entry_id] = entry
+            while len(self._entries) > max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def size(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+class RedisAnswerCacheBackend:
+    """Redis 後端：每個版本一個 hash（欄位為項目 ID），整個 hash 以 TTL 過期"""
+
+    def __init__(self, url: str, prefix: str = 'answer_cache'):
+        if redis is None:
+            raise ImportError("redis package is not installed")
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def _key(self, namespace: str) -> str:
+        return f"{self.prefix}:{namespace}"
+
+    def get_entries(self, namespace: str) -> List[Dict]:
+        values = self.client.hvals(self._key(namespace))
+        return [json.loads(value) for value in values]
+
+    def add(self, namespace: str, entry_id: str, entry: Dict, max_size: int, ttl: int):
+        key = self._key(namespace)
+        pipe = self.client.pipeline()
+        pipe.hset(key, entry_id, json.dumps(entry, ensure_ascii=False))
+        pipe.expire(key, ttl)
+        pipe.hlen(key)
+        size = pipe.execute()[-1]
+        if size > max_size:
+            # 超過上限時刪除最舊的項目
+            entries = self.client.hgetall(key)
+            by_age = sorted(entries.items(), key=lambda item: json.loads(item[1])['created_at'])
+            self.client.hdel(key, *[field for field, _ in by_age[:size - max_size]])
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=f"{self.prefix}:*"))
+        if keys:
+            self.client.delete(*keys)
+
+    def size(self) -> int:
+        return sum(self.client.hlen(key) for key in self.client.scan_iter(match=f"{self.prefix}:*"))
+
+
+class AnswerCache:
+    def __init__(self, backend=None, similarity_threshold: float = None, ttl: int = None, max_size: int = None):
+        self.backend = backend or InMemoryAnswerCacheBackend()
+        self.similarity_threshold = (
+            Config.ANSWER_CACHE_SIMILARITY if similarity_threshold is None else similarity_threshold
+        )
+        self.ttl = Config.ANSWER_CACHE_TTL if ttl is None else ttl
+        self.max_size = Config.ANSWER_CACHE_MAX_SIZE if max_size is None else max_size
+        # 多個請求執行緒同時查詢，命中與未命中次數以鎖保護（+= 不是原子操作）
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def namespace(model_name: str, corpus_version: str, tenant_id: str = '') -> str:
+        """以嵌入模型與文檔版本（及 tenant）組成快取命名空間；Redis 後端由多個 tenant 共用時不會互相命中"""
+        key = f"{model_name}:{corpus_version}" + (f":{tenant_id}" if tenant_id else '')
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+
+    @staticmethod
+    def scope_key(filenames: Optional[List[str]]) -> str:
+        """檢索範圍的鍵：未限定範圍為空字串，否則為檔名集合的雜湊（不同範圍的回答互不共用）"""
+        if filenames is None:
+            return ''
+        return hashlib.sha1("\0".join(sorted(filenames)).encode('utf-8')).hexdigest()[:16]
+
+    def lookup(self, namespace: str, embedding: np.ndarray, scope: str = '') -> Optional[Dict]:
+        """回傳同一檢索範圍內相似度最高且未過期的回答，沒有則回傳 None"""
+        now = time.time()
+        entries = [
+            entry for entry in self.backend.get_entries(namespace)
+            if now - entry['created_at'] < self.ttl and entry.get('scope', '') == scope
+        ]
+        best = None
+        if entries:
+            matrix = np.asarray([entry['embedding'] for entry in entries], dtype=np.float32)
+            norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(embedding) or 1.0)
+            similarities = matrix @ embedding / np.where(norms == 0, 1.0, norms)
+            index = int(np.argmax(similarities))
+            if similarities[index] >= self.similarity_threshold:
+                best = dict(entries[index]['result'])
+                best['cache_similarity'] = round(float(similarities[index]), 3)
+
+        with self._lock:
+            if best is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return best
+
+    def store(self, namespace: str, question: str, embedding: np.ndarray, result: Dict, scope: str = ''):
+        if self.max_size <= 0:
+            return
+        entry = {
+            'question': question,
+            'embedding': [float(value) for value in embedding],
+            'result': result,
+            'scope': scope,
+            'created_at': time.time()
+        }
+        self.backend.add(namespace, uuid.uuid4().hex, entry, self.max_size, self.ttl)
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        try:
+            size = self.backend.size()
+        except Exception as e:
+            print(f"Error reading answer cache size: {str(e)}")
+            size = None
+        return {
+            'backend': 'redis' if isinstance(self.backend, RedisAnswerCacheBackend) else 'memory',
+            'size': size,
+            'max_size': self.max_size,
+            'ttl': self.ttl,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / total, 3) if total else 0.0
+        }
+
+
+def create_answer_cache() -> Optional[AnswerCache]:
+    """依設定建立問答快取：停用時回傳 None，有 REDIS_URL 時使用 Redis，失敗則退回程序內快取"""
+    if not Config.ANSWER_CACHE_ENABLED:
+        return None
+    if Config.REDIS_URL:
+        try:
+            backend = RedisAnswerCacheBackend(Config.REDIS_URL)
+            backend.client.ping()
+            print("Answer cache using Redis backend")
+            return AnswerCache(backend)
+        except Exception as e:
+            print(f"Redis unavailable for answer cache, falling back to in-process cache: {str(e)}")
+    return AnswerCache()
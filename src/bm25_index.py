@@ -0,0 +1,211 @@
+"""
+BM25 倒排索引 - 以 SQLite 持久化，與 ChromaDB 集合同步維護，提供關鍵字檢索
+
+中日韓文字以單字與相鄰雙字（bigram）切分，英數字以完整詞切分（保留課程代碼、公式名稱等）；
+查詢時略過「的」「是」等虛詞單字，避免幾乎所有片段都被視為關鍵字命中。
+"""
+
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from typing import Dict, List, Tuple
+from src.config import Config
+
+# 一次掃描同時擷取英數詞與中日韓文字連續段
+TOKEN_PATTERN = re.compile(
+    r'[A-Za-z0-9]+(?:[._\-][A-Za-z0-9]+)*'
+    r'|[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af]+'
+)
+
+# 查詢時忽略的中文虛詞單字：幾乎每個片段都有，只命中這些字不算關鍵字命中（雙字詞仍保留）
+QUERY_STOPWORDS = frozenset('的了是在和與及或而也都就還又之其這那此個些們嗎呢吧啊呀麼什何哪怎請把被讓從對向於為以有')
+
+
+def tokenize(text: str) -> List[str]:
+    """將文字切分為 BM25 詞彙"""
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(text):
+        token = match.group()
+        if token.isascii():
+            tokens.append(token.lower())
+            continue
+        # 中日韓文字：單字 + 雙字
+        tokens.extend(token)
+        tokens.extend(token[i:i + 2] for i in range(len(token) - 1))
+    return tokens
+
+
+class BM25Index:
+    def __init__(self, db_path: str = None):
+        self.db_path = db_path or Config.BM25_DB_PATH
+        self._lock = threading.Lock()
+        self._stats = None  # (文件數, 平均長度) 的快取，寫入時清除
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _init_db(self):
+        """建立倒排索引資料表"""
+        with self._lock:
+            conn = self._connect()
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS chunks (
+                        chunk_id TEXT PRIMARY KEY,
+                        filename TEXT NOT NULL,
+                        length INTEGER NOT NULL
+                    )
+                """)
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS postings (
+                        term TEXT NOT NULL,
+                        chunk_id TEXT NOT NULL,
+                        tf INTEGER NOT NULL,
+                        PRIMARY KEY (term, chunk_id)
+                    ) WITHOUT ROWID
+                """)
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_filename ON chunks (filename)")
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_postings_chunk ON postings (chunk_id)")
+            finally:
+                conn.close()
+
+    def add_chunks(self, filename: str, chunk_ids: List[str], texts: List[str]):
+        """新增（或覆寫）片段的索引"""
+        with self._lock:
+            conn = self._connect()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                for chunk_id, text in zip(chunk_ids, texts):
+                    counts = Counter(tokenize(text))
+                    conn.execute("DELETE FROM postings WHERE chunk_id = ?", (chunk_id,))
+                    conn.execute(
+                        "INSERT OR REPLACE INTO chunks (chunk_id, filename, length) VALUES (?, ?, ?)",
+                        (chunk_id, filename, sum(counts.values()))
+                    )
+                    conn.executemany(
+                        "INSERT INTO postings (term, chunk_id, tf) VALUES (?, ?, ?)",
+                        [(term, chunk_id, tf) for term, tf in counts.items()]
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            finally:
+                conn.close()
+            self._stats = None
+
+    def delete_chunks(self, chunk_ids: List[str]):
+        """刪除指定片段的索引"""
+        self._delete("chunk_id IN ({})".format(",".join("?" * len(chunk_ids))), tuple(chunk_ids))
+
+    def delete_document(self, filename: str):
+        """刪除整份文檔的索引"""
+        self._delete("filename = ?", (filename,))
+
+    def _delete(self, where: str, params: tuple):
+        if not params:
+            return
+        with self._lock:
+            conn = self._connect()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute(
+                    f"DELETE FROM postings WHERE chunk_id IN (SELECT chunk_id FROM chunks WHERE {where})", params
+                )
+                conn.execute(f"DELETE FROM chunks WHERE {where}", params)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            finally:
+                conn.close()
+            self._stats = None
+
+    def _corpus_stats(self, conn: sqlite3.Connection) -> Tuple[int, float]:
+        stats = self._stats
+        if stats is None:
+            row = conn.execute("SELECT COUNT(*), COALESCE(AVG(length), 0) FROM chunks").fetchone()
+            stats = (row[0], row[1] or 0.0)
+            self._stats = stats
+        return stats
+
+    def is_empty(self) -> bool:
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT 1 FROM chunks LIMIT 1").fetchone() is None
+        finally:
+            conn.close()
+
+    def search(self, query: str, top_k: int = None, filenames: List[str] = None) -> List[Tuple[str, float]]:
+        """以 BM25 搜索，回傳 [(chunk_id, score), ...]（分數由高到低）
+
+        傳入 filenames 時只對這些文檔的片段評分（IDF 仍以整個索引計算，分數與未限定範圍時一致）。
+        """
+        if top_k is None:
+            top_k = Config.TOP_K
+        terms = set(tokenize(query)) - QUERY_STOPWORDS
+        if not terms or filenames == []:
+            return []
+
+        k1, b = Config.BM25_K1, Config.BM25_B
+        conn = self._connect()
+        try:
+            total, avg_length = self._corpus_stats(conn)
+            if total == 0:
+                return []
+            scores: Dict[str, float] = {}
+            if filenames is not None:
+                placeholders = ','.join('?' * len(filenames))
+                scoped_chunks = conn.execute(
+                    f"SELECT COUNT(*) FROM chunks WHERE filename IN ({placeholders})", filenames
+                ).fetchone()[0]
+            for term in terms:
+                if filenames is None:
+                    rows = conn.execute(
+                        "SELECT p.chunk_id, p.tf, c.length FROM postings p JOIN chunks c ON c.chunk_id = p.chunk_id "
+                        "WHERE p.term = ?", (term,)
+                    ).fetchall()
+                    document_frequency = len(rows)
+                else:
+                    document_frequency = conn.execute(
+                        "SELECT COUNT(*) FROM postings WHERE term = ?", (term,)
+                    ).fetchone()[0]
+                    if document_frequency == 0 or scoped_chunks == 0:
+                        continue
+                    if scoped_chunks < document_frequency:
+                        # 範圍內的片段比含此詞的片段少：從範圍內的片段逐一查詢 postings
+                        sql = ("SELECT p.chunk_id, p.tf, c.length FROM chunks c CROSS JOIN postings p "
+                               f"ON p.term = ? AND p.chunk_id = c.chunk_id WHERE c.filename IN ({placeholders})")
+                    else:
+                        sql = ("SELECT p.chunk_id, p.tf, c.length FROM postings p JOIN chunks c ON c.chunk_id = p.chunk_id "
+                               f"WHERE p.term = ? AND c.filename IN ({placeholders})")
+                    rows = conn.execute(sql, (term, *filenames)).fetchall()
+                if not rows:
+                    continue
+                idf = math.log(1 + (total - document_frequency + 0.5) / (document_frequency + 0.5))
+                for row in rows:
+                    norm = k1 * (1 - b + b * row['length'] / avg_length) if avg_length else k1
+                    scores[row['chunk_id']] = scores.get(row['chunk_id'], 0.0) + idf * row['tf'] * (k1 + 1) / (row['tf'] + norm)
+        finally:
+            conn.close()
+
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = None) -> List[Tuple[str, float]]:
+    """以 Reciprocal Rank Fusion 合併多個排序結果，回傳 [(id, score), ...]"""
+    if k is None:
+        k = Config.RRF_K
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking, start=1):
+            scores[item_id] = scores.get(item_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
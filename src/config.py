@@ -14,6 +14,8 @@ class Config:
     OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
     OPENAI_MODEL = os.getenv('OPENAI_MODEL', 'gpt-3.5-turbo')
     EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', 'text-embedding-ada-002')
+    # 本地向量檢索使用的 SentenceTransformer 模型
+    LOCAL_EMBEDDING_MODEL = os.getenv('LOCAL_EMBEDDING_MODEL', 'all-MiniLM-L6-v2')
 
     # 檔案路徑設定
     BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -22,14 +24,64 @@ class Config:
     OCR_DIR = os.path.join(DATA_DIR, 'ocr_texts')
     SUMMARY_DIR = os.path.join(DATA_DIR, 'summaries')
     VECTOR_STORE_DIR = os.path.join(DATA_DIR, 'vector_store')
+    LOCAL_VECTOR_DIR = os.path.join(DATA_DIR, 'local_vectors')
+    BM25_DB_PATH = os.path.join(DATA_DIR, 'bm25_index.db')
+    JOB_DB_PATH = os.path.join(DATA_DIR, 'jobs.db')
+    CATALOG_DB_PATH = os.path.join(DATA_DIR, 'catalog.db')
+    CONTENT_CACHE_DIR = os.path.join(DATA_DIR, 'content_cache')
+    CONTENT_CACHE_DB = os.path.join(CONTENT_CACHE_DIR, 'refs.db')
+    TENANTS_DIR = os.path.join(DATA_DIR, 'tenants')  # 非預設 tenant 的資料目錄：TENANTS_DIR/<tenant_id>/
+    WRITER_LOCK_PATH = os.path.join(DATA_DIR, 'writer.lock')  # Web 應用與批次匯入 CLI 互斥寫入資料目錄的鎖檔
+
+    # 多租戶設定
+    DEFAULT_TENANT = os.getenv('DEFAULT_TENANT', 'default')  # 未指定 tenant 的請求所屬的 tenant（沿用 DATA_DIR 下的既有路徑）
+    TENANT_HEADER = os.getenv('TENANT_HEADER', 'X-Tenant-ID')  # 指定 tenant 的請求標頭（應由驗證身分的反向代理設定）
+    # 是否採用 TENANT_HEADER 標頭；只在反向代理會移除客戶端自帶的值、並依驗證後的身分設定標頭時開啟
+    TRUST_TENANT_HEADER = os.getenv('TRUST_TENANT_HEADER', 'false').lower() == 'true'
+    MAX_OPEN_TENANTS = int(os.getenv('MAX_OPEN_TENANTS', 16))  # 同時開啟的 tenant 上限，超過時關閉最久未使用的
+
+    # 背景處理設定
+    INGEST_WORKERS = int(os.getenv('INGEST_WORKERS', 2))  # 背景處理 worker 數量
+    JOB_POLL_INTERVAL = 1.0     # worker 閒置時輪詢佇列的間隔（秒）
+    JOB_LEASE_SECONDS = float(os.getenv('JOB_LEASE_SECONDS', 60))  # 執行中工作的租約（秒），worker 定期續約，逾期視為中斷
+
+    # OCR 設定
+    OCR_DPI = int(os.getenv('OCR_DPI', 200))
+    OCR_LANG = os.getenv('OCR_LANG', 'chi_tra+eng')
+    OCR_WORKERS = int(os.getenv('OCR_WORKERS', 0))  # 所有文件共用的 OCR 程序數量，0 表示依本程序可用的 CPU 數
+    OCR_WINDOW_SIZE = int(os.getenv('OCR_WINDOW_SIZE', 4))  # 每次轉換為圖片的頁數（決定記憶體上限）
+    OCR_MIN_PAGE_CHARS = int(os.getenv('OCR_MIN_PAGE_CHARS', 20))  # 頁面文字層少於此字數時改用 OCR
+    OCR_PAGE_TIMEOUT = int(os.getenv('OCR_PAGE_TIMEOUT', 120))  # 單頁 OCR 逾時（秒），0 表示不限制
+
+    # 摘要設定
+    SUMMARY_CONCURRENCY = int(os.getenv('SUMMARY_CONCURRENCY', 4))  # 分段摘要同時呼叫 LLM 的上限
+    SUMMARY_MAX_RETRIES = int(os.getenv('SUMMARY_MAX_RETRIES', 5))  # 遇到速率限制時的重試次數
+    SUMMARY_RETRY_BASE_DELAY = float(os.getenv('SUMMARY_RETRY_BASE_DELAY', 2.0))  # 指數退避的起始秒數
+    SUMMARY_REDUCE_MAX_CHARS = int(os.getenv('SUMMARY_REDUCE_MAX_CHARS', 12000))  # 單次整合 prompt 的摘要總長上限
+
+    # 啟動設定
+    WARMUP_ON_START = os.getenv('WARMUP_ON_START', 'true').lower() == 'true'  # 啟動後於背景預先載入模型
+    ASYNC_RETRIEVAL_WORKERS = int(os.getenv('ASYNC_RETRIEVAL_WORKERS', 8))  # ASGI 模式下執行檢索的執行緒數
 
     # 文本處理設定
     CHUNK_SIZE = int(os.getenv('CHUNK_SIZE', 1000))
     CHUNK_OVERLAP = int(os.getenv('CHUNK_OVERLAP', 200))
+    CHUNK_UNIT = os.getenv('CHUNK_UNIT', 'chars')  # chars：CHUNK_SIZE/CHUNK_OVERLAP 以字元計；tokens：以 token 計
+    SUMMARY_CHUNK_SIZE = int(os.getenv('SUMMARY_CHUNK_SIZE', 6000))  # 長文分段摘要每段的字元數
+    EMBEDDING_BATCH_SIZE = int(os.getenv('EMBEDDING_BATCH_SIZE', 64))  # 每批嵌入並寫入的片段數
 
     # 檢索設定
     TOP_K = 5
     
+    QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv('QUERY_EMBEDDING_CACHE_SIZE', 1024))  # 查詢嵌入 LRU 快取容量，0 表示停用
+
+    # 問答快取設定
+    ANSWER_CACHE_ENABLED = os.getenv('ANSWER_CACHE_ENABLED', 'true').lower() == 'true'
+    ANSWER_CACHE_TTL = int(os.getenv('ANSWER_CACHE_TTL', 3600))  # 回答保留秒數
+    ANSWER_CACHE_MAX_SIZE = int(os.getenv('ANSWER_CACHE_MAX_SIZE', 512))  # 每個文檔版本保留的回答數上限
+    ANSWER_CACHE_SIMILARITY = float(os.getenv('ANSWER_CACHE_SIMILARITY', 0.95))  # 視為同一問題的餘弦相似度
+    REDIS_URL = os.getenv('REDIS_URL', '')  # 設定後問答快取改用 Redis（多個 worker 共用）
+
     # 智能檢索設定
     ADAPTIVE_RETRIEVAL = True
     MIN_TOP_K = 3              # 最少檢索數量
@@ -37,8 +89,35 @@ class Config:
     SIMILARITY_THRESHOLD = 0.7  # 相似度閾值
     CONTEXT_EXPANSION = True    # 啟用上下文擴展
     
+    # 混合檢索設定（向量 + BM25）
+    HYBRID_RETRIEVAL = os.getenv('HYBRID_RETRIEVAL', 'true').lower() == 'true'
+    HYBRID_CANDIDATE_MULTIPLIER = 2  # 兩種檢索各取 top_k 的倍數作為融合候選
+    RRF_K = 60                  # Reciprocal Rank Fusion 常數
+    BM25_KEEP_TOP_RANK = 3      # BM25 排名前幾名的片段視為強關鍵字命中，不受相似度閾值過濾
+    BM25_K1 = 1.5
+    BM25_B = 0.75
+
+    # 向量後端設定
+    VECTOR_BACKEND = os.getenv('VECTOR_BACKEND', 'chroma')  # chroma：ChromaDB；local：記憶體映射向量檔 + 精確/HNSW 檢索
+    LOCAL_HNSW_THRESHOLD = int(os.getenv('LOCAL_HNSW_THRESHOLD', 20000))  # local 後端超過此向量數時改用 HNSW 近似檢索
+    HNSW_M = int(os.getenv('HNSW_M', 32))  # HNSW 每個節點的鄰居數
+    HNSW_EF_SEARCH = int(os.getenv('HNSW_EF_SEARCH', 64))  # 查詢時的候選數（越大越準、越慢）
+    HNSW_EF_CONSTRUCTION = int(os.getenv('HNSW_EF_CONSTRUCTION', 80))  # 建立索引時的候選數
+
+    # 重新排序設定（本機 cross-encoder）
+    RERANK_ENABLED = os.getenv('RERANK_ENABLED', 'false').lower() == 'true'
+    RERANK_MODEL = os.getenv('RERANK_MODEL', 'cross-encoder/mmarco-mMiniLMv2-L12-H384-v1')  # 支援中文的多語模型
+    RERANK_CANDIDATES = int(os.getenv('RERANK_CANDIDATES', 20))  # 每個問題送入 cross-encoder 的候選數
+    RERANK_BATCH_SIZE = int(os.getenv('RERANK_BATCH_SIZE', 32))
+    RERANK_BACKEND = os.getenv('RERANK_BACKEND', 'torch')  # torch / onnx / openvino
+    RERANK_ONNX_FILE = os.getenv('RERANK_ONNX_FILE', '')  # 例如 onnx/model_qint8_avx512.onnx（量化模型）
+    RERANK_MAX_LENGTH = int(os.getenv('RERANK_MAX_LENGTH', 512))  # 問題加片段的最大 token 長度
+
     # Token 預算管理
     MAX_CONTEXT_TOKENS = 4000   # 給 LLM 的最大 context token
+    TOKEN_COUNTER = os.getenv('TOKEN_COUNTER', 'auto')  # auto / tiktoken / heuristic
+    TOKEN_COUNT_CACHE_SIZE = 4096  # token 計數的 LRU 快取容量
+    CONTEXT_PACKING = os.getenv('CONTEXT_PACKING', 'relevance')  # relevance：依每 token 相關度挑選；greedy：依檢索順序
     QUESTION_COMPLEXITY_THRESHOLD = 50  # 問題複雜度判斷閾值（字符數）
     
     # 問題分析設定
@@ -52,7 +131,8 @@ class Config:
         """確保所有必要的目錄都存在"""
         directories = [
             cls.DATA_DIR, cls.PDF_DIR, cls.OCR_DIR, 
-            cls.SUMMARY_DIR, cls.VECTOR_STORE_DIR
+            cls.SUMMARY_DIR, cls.VECTOR_STORE_DIR, cls.LOCAL_VECTOR_DIR, cls.CONTENT_CACHE_DIR,
+            cls.TENANTS_DIR
         ]
         for directory in directories:
             os.makedirs(directory, exist_ok=True)
\ No newline at end of file
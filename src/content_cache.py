@@ -0,0 +1,174 @@
+"""
+內容定址快取 - 以 PDF 內容的 SHA-256 共用 OCR 文字、摘要與向量嵌入
+"""
+
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+from src.config import Config
+
+
+def file_sha256(path: str, block_size: int = 1024 * 1024) -> str:
+    """計算檔案內容的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _copy_file(src: str, dst: str):
+    """複製檔案（先寫入暫存檔再取代，讀取端不會看到寫到一半的內容）
+
+    不使用硬連結：OCR 與摘要檔會被原地改寫（重新 OCR、修正文字後重新索引），
+    共用 inode 會讓同內容的其他檔名與快取產物一起被改掉。
+    """
+    tmp_path = f"{dst}.tmp"
+    shutil.copyfile(src, tmp_path)
+    os.replace(tmp_path, dst)
+
+
+class ContentCache:
+    """
+    快取的產物存放於 CACHE_DIR/<hash>/，並複製到各檔名的 OCR_DIR 與 SUMMARY_DIR 檔案。
+    每個引用該內容的檔名算一次引用，引用數歸零時才移除快取產物。
+    """
+
+    OCR_BLOB = 'ocr.txt'
+    SUMMARY_BLOB = 'summary.txt'
+
+    def __init__(self, db_path: str = None, cache_dir: str = None, ocr_dir: str = None, summary_dir: str = None):
+        self.db_path = db_path or Config.CONTENT_CACHE_DB
+        self.cache_dir = cache_dir or Config.CONTENT_CACHE_DIR
+        self.ocr_dir = ocr_dir or Config.OCR_DIR
+        self.summary_dir = summary_dir or Config.SUMMARY_DIR
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _init_db(self):
+        """建立引用資料表"""
+        with self._lock:
+            conn = self._connect()
+            try:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS content_refs (
+                        filename TEXT PRIMARY KEY,
+                        content_hash TEXT NOT NULL,
+                        created_at REAL NOT NULL
+                    )
+                """)
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_content_refs_hash ON content_refs (content_hash)")
+            finally:
+                conn.close()
+
+    def _blob_path(self, content_hash: str, blob: str) -> str:
+        return os.path.join(self.cache_dir, content_hash, blob)
+
+    def has_artifacts(self, content_hash: str) -> bool:
+        """該內容是否已有完整的 OCR 與摘要快取"""
+        return all(
+            os.path.exists(self._blob_path(content_hash, blob))
+            for blob in (self.OCR_BLOB, self.SUMMARY_BLOB)
+        )
+
+    def read_ocr_text(self, content_hash: str) -> str:
+        with open(self._blob_path(content_hash, self.OCR_BLOB), 'r', encoding='utf-8') as f:
+            return f.read()
+
+    def get_hash(self, filename: str) -> Optional[str]:
+        """取得檔名對應的內容雜湊"""
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT content_hash FROM content_refs WHERE filename = ?", (filename,)
+            ).fetchone()
+        finally:
+            conn.close()
+        return row['content_hash'] if row else None
+
+    def get_filenames(self, content_hash: str) -> List[str]:
+        """取得引用同一內容的所有檔名（依引用時間排序）"""
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT filename FROM content_refs WHERE content_hash = ? ORDER BY created_at",
+                (content_hash,)
+            ).fetchall()
+        finally:
+            conn.close()
+        return [row['filename'] for row in rows]
+
+    def ref_count(self, content_hash: str) -> int:
+        return len(self.get_filenames(content_hash))
+
+    def store(self, content_hash: str, filename: str, ocr_path: str, summary_path: str):
+        """將剛處理完成的產物存入快取並登記引用"""
+        os.makedirs(os.path.join(self.cache_dir, content_hash), exist_ok=True)
+        _copy_file(ocr_path, self._blob_path(content_hash, self.OCR_BLOB))
+        _copy_file(summary_path, self._blob_path(content_hash, self.SUMMARY_BLOB))
+        self._add_ref(content_hash, filename)
+
+    def link(self, content_hash: str, filename: str):
+        """將快取產物複製到新檔名的 OCR 與摘要檔，回傳 (ocr_path, summary_path)"""
+        base_name = os.path.splitext(filename)[0] + '.txt'
+        ocr_path = os.path.join(self.ocr_dir, base_name)
+        summary_path = os.path.join(self.summary_dir, base_name)
+        _copy_file(self._blob_path(content_hash, self.OCR_BLOB), ocr_path)
+        _copy_file(self._blob_path(content_hash, self.SUMMARY_BLOB), summary_path)
+        self._add_ref(content_hash, filename)
+        return ocr_path, summary_path
+
+    def release(self, filename: str) -> bool:
+        """移除檔名的引用，引用數歸零時清除快取產物；回傳是否已清除"""
+        with self._lock:
+            conn = self._connect()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                row = conn.execute(
+                    "SELECT content_hash FROM content_refs WHERE filename = ?", (filename,)
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return False
+                content_hash = row['content_hash']
+                conn.execute("DELETE FROM content_refs WHERE filename = ?", (filename,))
+                remaining = conn.execute(
+                    "SELECT COUNT(*) FROM content_refs WHERE content_hash = ?", (content_hash,)
+                ).fetchone()[0]
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            finally:
+                conn.close()
+
+            if remaining == 0:
+                shutil.rmtree(os.path.join(self.cache_dir, content_hash), ignore_errors=True)
+                print(f"Evicted cached artifacts for {content_hash[:12]}")
+                return True
+        return False
+
+    def _add_ref(self, content_hash: str, filename: str):
+        previous_hash = self.get_hash(filename)
+        if previous_hash and previous_hash != content_hash:
+            self.release(filename)
+        with self._lock:
+            conn = self._connect()
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO content_refs (filename, content_hash, created_at) VALUES (?, ?, ?)",
+                    (filename, content_hash, time.time())
+                )
+            finally:
+                conn.close()
@@ -0,0 +1,282 @@
+"""
+文檔目錄 - 以 SQLite 記錄向量資料庫中每份文檔的檔名、片段數、內容雜湊與處理狀態
+
+文檔清單與統計只需查詢此目錄（O(文檔數)），不必掃描整個 ChromaDB 集合。
+另記錄上傳時間與標籤，問答時可依檔名、上傳日期與標籤限定檢索範圍（見 resolve_scope）。
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+from src.config import Config
+
+# 文檔狀態
+STATUS_INDEXING = 'indexing'
+STATUS_READY = 'ready'
+STATUS_DELETING = 'deleting'
+
+
+class DocumentCatalog:
+    def __init__(self, db_path: str = None):
+        self.db_path = db_path or Config.CATALOG_DB_PATH
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _init_db(self):
+        """建立文檔資料表"""
+        with self._lock:
+            conn = self._connect()
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS documents (
+                        filename TEXT PRIMARY KEY,
+                        chunk_count INTEGER NOT NULL DEFAULT 0,
+                        content_hash TEXT,
+                        status TEXT NOT NULL,
+                        updated_at REAL NOT NULL,
+                        uploaded_at REAL,
+                        tags TEXT NOT NULL DEFAULT '[]'
+                    )
+                """)
+                # 舊版資料表補上上傳時間與標籤欄位（既有文檔的上傳時間以最後更新時間代替）
+                columns = {row['name'] for row in conn.execute("PRAGMA table_info(documents)")}
+                if 'uploaded_at' not in columns:
+                    conn.execute("ALTER TABLE documents ADD COLUMN uploaded_at REAL")
+                    conn.execute("UPDATE documents SET uploaded_at = updated_at")
+                if 'tags' not in columns:
+                    conn.execute("ALTER TABLE documents ADD COLUMN tags TEXT NOT NULL DEFAULT '[]'")
+            finally:
+                conn.close()
+
+    def _execute(self, sql: str, params: tuple = ()):
+        with self._lock:
+            conn = self._connect()
+            try:
+                conn.execute(sql, params)
+            finally:
+                conn.close()
+
+    def begin_indexing(self, filename: str, chunk_count: int, content_hash: str = None):
+        """標記文檔開始寫入向量資料庫（重新索引時保留原本的上傳時間與標籤）"""
+        now = time.time()
+        self._execute(
+            "INSERT INTO documents (filename, chunk_count, content_hash, status, updated_at, uploaded_at) "
+            "VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(filename) DO UPDATE SET chunk_count = excluded.chunk_count, "
+            "content_hash = excluded.content_hash, status = excluded.status, updated_at = excluded.updated_at",
+            (filename, chunk_count, content_hash, STATUS_INDEXING, now, now)
+        )
+
+    def mark_ready(self, filename: str, chunk_count: int = None):
+        """標記文檔已完成寫入，可供檢索"""
+        if chunk_count is None:
+            self._execute(
+                "UPDATE documents SET status = ?, updated_at = ? WHERE filename = ?",
+                (STATUS_READY, time.time(), filename)
+            )
+        else:
+            self._execute(
+                "UPDATE documents SET status = ?, chunk_count = ?, updated_at = ? WHERE filename = ?",
+                (STATUS_READY, chunk_count, time.time(), filename)
+            )
+
+    def restore(self, entry: Dict):
+        """重新索引失敗時還原文檔先前的狀態、片段數與內容雜湊（保留上傳時間與標籤）
+
+        更新時間仍設為現在：集合內的片段可能已部分改寫，依版本指紋快取的回答應失效。
+        """
+        self._execute(
+            "UPDATE documents SET status = ?, chunk_count = ?, content_hash = ?, updated_at = ? WHERE filename = ?",
+            (entry['status'], entry['chunk_count'], entry['content_hash'], time.time(), entry['filename'])
+        )
+
+    def mark_deleting(self, filename: str):
+        """標記文檔正在刪除（不再出現在文檔清單中）"""
+        self._execute(
+            "UPDATE documents SET status = ?, updated_at = ? WHERE filename = ?",
+            (STATUS_DELETING, time.time(), filename)
+        )
+
+    def set_tags(self, filename: str, tags: List[str]) -> bool:
+        """設定文檔的標籤（取代原有標籤），文檔不存在時回傳 False"""
+        tags = sorted({str(tag).strip() for tag in tags if str(tag).strip()})
+        with self._lock:
+            conn = self._connect()
+            try:
+                cursor = conn.execute(
+                    "UPDATE documents SET tags = ? WHERE filename = ?",
+                    (json.dumps(tags, ensure_ascii=False), filename)
+                )
+            finally:
+                conn.close()
+        return cursor.rowcount > 0
+
+    def resolve_scope(self, scope: Optional[Dict]) -> Optional[List[str]]:
+        """將檢索範圍（檔名、上傳時間區間、標籤）轉為符合條件的可檢索檔名；未限定範圍時回傳 None
+
+        scope 的欄位皆為選填：filenames（檔名清單）、uploaded_after / uploaded_before（Unix 時間，含端點）、
+        tags（至少符合其中一個標籤）。各欄位之間為 AND。
+        """
+        if not scope:
+            return None
+        conditions, params = ["status = ?"], [STATUS_READY]
+        if scope.get('filenames') is not None:
+            filenames = list(scope['filenames'])
+            if not filenames:
+                return []
+            conditions.append(f"filename IN ({','.join('?' * len(filenames))})")
+            params.extend(filenames)
+        if scope.get('uploaded_after') is not None:
+            conditions.append("COALESCE(uploaded_at, updated_at) >= ?")
+            params.append(scope['uploaded_after'])
+        if scope.get('uploaded_before') is not None:
+            conditions.append("COALESCE(uploaded_at, updated_at) <= ?")
+            params.append(scope['uploaded_before'])
+
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                f"SELECT filename, tags FROM documents WHERE {' AND '.join(conditions)} ORDER BY filename", params
+            ).fetchall()
+        finally:
+            conn.close()
+        if scope.get('tags'):
+            wanted = set(scope['tags'])
+            rows = [row for row in rows if wanted & set(json.loads(row['tags'] or '[]'))]
+        return [row['filename'] for row in rows]
+
+    def remove(self, filename: str):
+        """移除文檔紀錄"""
+        self._execute("DELETE FROM documents WHERE filename = ?", (filename,))
+
+    def get(self, filename: str) -> Optional[Dict]:
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT * FROM documents WHERE filename = ?", (filename,)).fetchone()
+        finally:
+            conn.close()
+        return self._row_to_dict(row) if row else None
+
+    def list_documents(self, status: str = STATUS_READY) -> List[Dict]:
+        """列出指定狀態的文檔（預設為可檢索的文檔）"""
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT * FROM documents WHERE status = ? ORDER BY filename", (status,)
+            ).fetchall()
+        finally:
+            conn.close()
+        return [self._row_to_dict(row) for row in rows]
+
+    @staticmethod
+    def _row_to_dict(row: sqlite3.Row) -> Dict:
+        entry = dict(row)
+        entry['tags'] = json.loads(entry.get('tags') or '[]')
+        return entry
+
+    def get_filenames(self) -> List[str]:
+        return [row['filename'] for row in self.list_documents()]
+
+    def total_chunks(self) -> int:
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT COALESCE(SUM(chunk_count), 0) FROM documents WHERE status = ?", (STATUS_READY,)
+            ).fetchone()
+        finally:
+            conn.close()
+        return row[0]
+
+    def version(self) -> str:
+        """可檢索文檔集合的版本指紋，任何文檔新增、重新索引或刪除後都會改變"""
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT filename, updated_at FROM documents WHERE status = ? ORDER BY filename", (STATUS_READY,)
+            ).fetchall()
+        finally:
+            conn.close()
+        digest = hashlib.sha1()
+        for row in rows:
+            digest.update(f"{row['filename']}\0{row['updated_at']!r}\n".encode('utf-8'))
+        return digest.hexdigest()
+
+    def is_empty(self) -> bool:
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT 1 FROM documents LIMIT 1").fetchone()
+        finally:
+            conn.close()
+        return row is None
+
+    def rebuild(self, chunk_counts: Dict[str, int]):
+        """以既有集合的統計重建目錄（用於升級前已存在的向量資料庫）"""
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute("DELETE FROM documents")
+                conn.executemany(
+                    "INSERT INTO documents (filename, chunk_count, content_hash, status, updated_at, uploaded_at) "
+                    "VALUES (?, ?, NULL, ?, ?, ?)",
+                    [(filename, count, STATUS_READY, now, now) for filename, count in chunk_counts.items()]
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            finally:
+                conn.close()
+
+
+def parse_scope(data: Optional[Dict]) -> Optional[Dict]:
+    """檢查並正規化 API 傳入的檢索範圍；日期可為 Unix 時間或 ISO 格式（YYYY-MM-DD 等），格式錯誤時拋出 ValueError"""
+    if not data:
+        return None
+    if not isinstance(data, dict):
+        raise ValueError("scope must be an object")
+    unknown = set(data) - {'filenames', 'uploaded_after', 'uploaded_before', 'tags'}
+    if unknown:
+        raise ValueError(f"unknown scope fields: {', '.join(sorted(unknown))}")
+
+    scope = {}
+    for key in ('filenames', 'tags'):
+        value = data.get(key)
+        if value is None:
+            continue
+        if isinstance(value, str):
+            value = [value]
+        if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+            raise ValueError(f"scope.{key} must be a list of strings")
+        scope[key] = value
+    for key in ('uploaded_after', 'uploaded_before'):
+        value = data.get(key)
+        if value is None:
+            continue
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            scope[key] = float(value)
+        elif isinstance(value, str):
+            try:
+                parsed = datetime.fromisoformat(value)
+            except ValueError:
+                raise ValueError(f"scope.{key} must be a Unix timestamp or ISO date")
+            # 只給日期時，uploaded_before 包含當天整天
+            if key == 'uploaded_before' and len(value) == 10:
+                parsed = parsed.replace(hour=23, minute=59, second=59, microsecond=999999)
+            scope[key] = parsed.timestamp()
+        else:
+            raise ValueError(f"scope.{key} must be a Unix timestamp or ISO date")
+    return scope or None
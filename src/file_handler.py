@@ -2,11 +2,20 @@ import os
 import shutil
 from werkzeug.utils import secure_filename
 from src.config import Config
+from src.content_cache import ContentCache
 
 class FileHandler:
-    def __init__(self):
+    def __init__(self, pdf_dir: str = None, ocr_dir: str = None, summary_dir: str = None,
+                 content_cache: ContentCache = None):
+        # 未指定目錄時使用 Config 的預設路徑（各 tenant 傳入自己的目錄）
         Config.ensure_directories()
+        self.pdf_dir = pdf_dir or Config.PDF_DIR
+        self.ocr_dir = ocr_dir or Config.OCR_DIR
+        self.summary_dir = summary_dir or Config.SUMMARY_DIR
+        for directory in (self.pdf_dir, self.ocr_dir, self.summary_dir):
+            os.makedirs(directory, exist_ok=True)
         self.allowed_extensions = {'pdf'}
+        self.content_cache = content_cache or ContentCache()
     
     def allowed_file(self, filename):
         """檢查檔案副檔名是否被允許"""
@@ -17,14 +26,14 @@ class FileHandler:
         """儲存上傳的 PDF 檔案"""
         if file and self.allowed_file(file.filename):
             filename = secure_filename(file.filename)
-            file_path = os.path.join(Config.PDF_DIR, filename)
+            file_path = os.path.join(self.pdf_dir, filename)
             
             # 如果檔案已存在，產生新的檔名
             counter = 1
             original_name, extension = os.path.splitext(filename)
             while os.path.exists(file_path):
                 new_filename = f"{original_name}_{counter}{extension}"
-                file_path = os.path.join(Config.PDF_DIR, new_filename)
+                file_path = os.path.join(self.pdf_dir, new_filename)
                 filename = new_filename
                 counter += 1
             
@@ -35,8 +44,8 @@ class FileHandler:
     def get_pdf_list(self):
         """取得所有已上傳的 PDF 檔案清單"""
         pdf_files = []
-        if os.path.exists(Config.PDF_DIR):
-            for filename in os.listdir(Config.PDF_DIR):
+        if os.path.exists(self.pdf_dir):
+            for filename in os.listdir(self.pdf_dir):
                 if filename.lower().endswith('.pdf'):
                     pdf_files.append(filename)
         return pdf_files
@@ -45,20 +54,28 @@ class FileHandler:
         """刪除 PDF 檔案及其相關資料"""
         try:
             # 刪除 PDF
-            pdf_path = os.path.join(Config.PDF_DIR, filename)
+            pdf_path = os.path.join(self.pdf_dir, filename)
             if os.path.exists(pdf_path):
                 os.remove(pdf_path)
             
             # 刪除對應的 OCR 文字檔
             ocr_filename = os.path.splitext(filename)[0] + '.txt'
-            ocr_path = os.path.join(Config.OCR_DIR, ocr_filename)
+            ocr_path = os.path.join(self.ocr_dir, ocr_filename)
             if os.path.exists(ocr_path):
                 os.remove(ocr_path)
+
+            # 刪除對應的逐頁來源紀錄
+            provenance_path = os.path.splitext(ocr_path)[0] + '.provenance.json'
+            if os.path.exists(provenance_path):
+                os.remove(provenance_path)
             
             # 刪除對應的摘要檔
-            summary_path = os.path.join(Config.SUMMARY_DIR, ocr_filename)
+            summary_path = os.path.join(self.summary_dir, ocr_filename)
             if os.path.exists(summary_path):
                 os.remove(summary_path)
+
+            # 釋放內容快取的引用（引用數歸零時才清除快取產物）
+            self.content_cache.release(filename)
             
             return True
         except Exception as e:
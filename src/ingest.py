@@ -0,0 +1,269 @@
+"""
+批次匯入 - 將整個目錄的 PDF 以管線方式匯入（文字擷取 → 摘要 → 向量化）
+
+用法：python -m src.ingest <目錄> [--recursive] [--ocr-workers N] [--summary-workers N] [--embed-workers N] [--tenant ID]
+
+三個階段各自擁有獨立的 worker pool，一份文件完成擷取後立即進入摘要階段，
+不必等待整批文件。重新執行時會依已存在的產物（OCR 文字、摘要、文檔目錄）續跑。
+PDF 完成索引後才放入 tenant 的 PDF 目錄；匯入期間持有資料目錄的寫入者鎖，Web 應用執行中時無法匯入。
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from src.config import Config
+from src.content_cache import file_sha256
+from src.document_catalog import STATUS_READY
+from src.ocr_reader import OCRReader
+from src.summarizer import Summarizer
+from src.tenants import Tenant, validate_tenant_id
+from src.writer_lock import WriterLock
+
+STAGES = ['extract', 'summary', 'embedding']
+
+
+class IngestPipeline:
+    def __init__(self, ocr_workers: int = 1, summary_workers: int = None, embed_workers: int = 1,
+                 tenant_id: str = None):
+        # 匯入到指定 tenant 的資料目錄與集合（未指定時為預設 tenant）
+        self.tenant = Tenant(tenant_id or Config.DEFAULT_TENANT)
+        self.paths = self.tenant.paths
+        self.file_handler = self.tenant.file_handler
+        self.content_cache = self.file_handler.content_cache
+        self.ocr_reader = OCRReader()
+        self.summarizer = Summarizer()
+        self.vector_store = self.tenant.vector_store
+        self.executors = {
+            'extract': ThreadPoolExecutor(max_workers=ocr_workers, thread_name_prefix='ingest-extract'),
+            'summary': ThreadPoolExecutor(
+                max_workers=summary_workers or Config.SUMMARY_CONCURRENCY, thread_name_prefix='ingest-summary'
+            ),
+            'embedding': ThreadPoolExecutor(max_workers=embed_workers, thread_name_prefix='ingest-embedding'),
+        }
+        self._lock = threading.Lock()
+        self._place_lock = threading.Lock()
+        self._reserved = {}  # 本次匯入已決定的檔名 → 內容雜湊
+        self._done = threading.Event()
+        self._remaining = 0
+        self.stage_stats = {stage: {'count': 0, 'seconds': 0.0} for stage in STAGES}
+        self.results = {'completed': [], 'resumed': [], 'cached': [], 'failed': []}
+
+    def run(self, pdf_paths: List[str]) -> Dict:
+        """匯入所有 PDF，回傳結果統計"""
+        start_time = time.perf_counter()
+        self._remaining = len(pdf_paths)
+        if not pdf_paths:
+            self._done.set()
+        for pdf_path in pdf_paths:
+            self._submit('extract', self._extract, {'source_path': pdf_path})
+        try:
+            self._done.wait()
+        finally:
+            for executor in self.executors.values():
+                executor.shutdown(wait=True, cancel_futures=True)
+        self.results['wall_seconds'] = time.perf_counter() - start_time
+        return self.results
+
+    def _submit(self, stage: str, func, item: Dict):
+        future = self.executors[stage].submit(self._run_stage, stage, func, item)
+        future.add_done_callback(lambda f: self._advance(stage, item, f))
+
+    def _run_stage(self, stage: str, func, item: Dict):
+        start = time.perf_counter()
+        try:
+            return func(item)
+        finally:
+            with self._lock:
+                self.stage_stats[stage]['count'] += 1
+                self.stage_stats[stage]['seconds'] += time.perf_counter() - start
+
+    def _advance(self, stage: str, item: Dict, future):
+        """階段完成後送往下一個階段，或記錄最終結果"""
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            print(f"[{stage}] {item.get('filename') or item['source_path']} failed: {str(error)}")
+            self._finish(item, 'failed')
+            return
+        next_stage = future.result()
+        if next_stage == 'summary':
+            self._submit('summary', self._summarize, item)
+        elif next_stage == 'embedding':
+            self._submit('embedding', self._embed, item)
+        else:
+            self._finish(item, next_stage)
+
+    def _finish(self, item: Dict, outcome: str):
+        with self._lock:
+            self.results[outcome].append(item.get('filename') or item['source_path'])
+            self._remaining -= 1
+            if self._remaining == 0:
+                self._done.set()
+
+    def _extract(self, item: Dict) -> str:
+        """文字擷取階段；回傳下一個階段名稱或最終結果"""
+        item['content_hash'] = file_sha256(item['source_path'])
+        with self._place_lock:
+            item['filename'] = self._choose_filename(item['source_path'], item['content_hash'])
+        item['pdf_path'] = os.path.join(self.paths.pdf_dir, item['filename'])
+        base_name = os.path.splitext(item['filename'])[0] + '.txt'
+        item['ocr_path'] = os.path.join(self.paths.ocr_dir, base_name)
+        item['summary_path'] = os.path.join(self.paths.summary_dir, base_name)
+
+        # 已完整匯入：直接略過
+        entry = self.vector_store.catalog.get(item['filename'])
+        if entry and entry['status'] == STATUS_READY:
+            self._publish_pdf(item)
+            return 'resumed'
+
+        # 相同內容已在其他檔名處理過：連結既有產物
+        if not os.path.exists(item['ocr_path']) and self.content_cache.has_artifacts(item['content_hash']):
+            self.content_cache.link(item['content_hash'], item['filename'])
+            item['cached'] = True
+
+        # 中斷後續跑：沿用已存在的 OCR 文字
+        if os.path.exists(item['ocr_path']):
+            with open(item['ocr_path'], 'r', encoding='utf-8') as f:
+                item['text'] = f.read()
+        else:
+            # 直接讀取來源檔：PDF 在完成索引前不放入 PDF 目錄
+            _, item['text'] = self.ocr_reader.process_pdf(
+                item['source_path'], item['filename'], output_dir=self.paths.ocr_dir
+            )
+            if not item['text']:
+                raise Exception('OCR 文字提取失敗')
+        return 'embedding' if item.get('cached') else 'summary'
+
+    def _summarize(self, item: Dict) -> str:
+        """摘要階段"""
+        if not os.path.exists(item['summary_path']):
+            summary_path, summary = self.summarizer.create_summary(
+                item['text'], item['filename'], output_dir=self.paths.summary_dir
+            )
+            if not summary:
+                raise Exception('摘要生成失敗')
+        return 'embedding'
+
+    def _embed(self, item: Dict) -> str:
+        """向量化階段"""
+        filename = item['filename']
+        if item.get('cached'):
+            sources = [name for name in self.content_cache.get_filenames(item['content_hash']) if name != filename]
+            if any(self.vector_store.copy_document(source, filename) for source in sources):
+                self._publish_pdf(item)
+                return 'cached'
+        if not self.vector_store.add_document(item['text'], filename, content_hash=item['content_hash']):
+            raise Exception('向量資料庫處理失敗')
+        try:
+            self.content_cache.store(item['content_hash'], filename, item['ocr_path'], item['summary_path'])
+        except Exception as e:
+            print(f"Error storing {filename} in content cache: {str(e)}")
+        self._publish_pdf(item)
+        return 'cached' if item.get('cached') else 'completed'
+
+    def _choose_filename(self, source_path: str, content_hash: str) -> str:
+        """決定 PDF 在 tenant 中的檔名（須持有 _place_lock）；同名且內容相同時沿用，同名但內容不同時改用新檔名"""
+        source_path = os.path.abspath(source_path)
+        original_name, extension = os.path.splitext(os.path.basename(source_path))
+        filename = original_name + extension
+        counter = 1
+        while True:
+            target_path = os.path.join(self.paths.pdf_dir, filename)
+            if os.path.abspath(target_path) == source_path:
+                return filename
+            # 本次匯入已保留的檔名尚未放入 PDF 目錄，以保留時的內容比對
+            reserved_hash = self._reserved.get(filename)
+            if reserved_hash is None and os.path.exists(target_path):
+                reserved_hash = file_sha256(target_path)
+            if reserved_hash is None or reserved_hash == content_hash:
+                self._reserved[filename] = content_hash
+                return filename
+            filename = f"{original_name}_{counter}{extension}"
+            counter += 1
+
+    def _publish_pdf(self, item: Dict):
+        """完成索引後才將 PDF 放入 PDF 目錄，Web 應用不會把匯入中的檔案當成未處理而重複排入佇列"""
+        if os.path.exists(item['pdf_path']):
+            return
+        tmp_path = f"{item['pdf_path']}.part"
+        shutil.copyfile(item['source_path'], tmp_path)
+        os.replace(tmp_path, item['pdf_path'])
+
+
+def find_pdfs(directory: str, recursive: bool = False) -> List[str]:
+    """列出目錄中的 PDF 檔案（依路徑排序）"""
+    pdf_paths = []
+    if recursive:
+        for root, _, filenames in os.walk(directory):
+            pdf_paths.extend(os.path.join(root, name) for name in filenames if name.lower().endswith('.pdf'))
+    else:
+        pdf_paths = [
+            os.path.join(directory, name) for name in os.listdir(directory)
+            if name.lower().endswith('.pdf') and os.path.isfile(os.path.join(directory, name))
+        ]
+    return sorted(pdf_paths)
+
+
+def print_report(results: Dict, stage_stats: Dict):
+    """輸出吞吐量報告"""
+    wall = results['wall_seconds']
+    processed = len(results['completed']) + len(results['cached'])
+    print("\n=== Ingestion report ===")
+    print(f"Completed: {len(results['completed'])}  Linked from cache: {len(results['cached'])}  "
+          f"Already ingested: {len(results['resumed'])}  Failed: {len(results['failed'])}")
+    print(f"Wall time: {wall:.1f}s  Throughput: {processed / wall * 60 if wall else 0:.1f} documents/min")
+    print(f"{'stage':<12}{'runs':>8}{'busy (s)':>12}{'avg (s)':>10}")
+    for stage, stats in stage_stats.items():
+        average = stats['seconds'] / stats['count'] if stats['count'] else 0
+        print(f"{stage:<12}{stats['count']:>8}{stats['seconds']:>12.1f}{average:>10.2f}")
+    for filename in results['failed']:
+        print(f"FAILED: {filename}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Bulk-ingest a directory of PDFs')
+    parser.add_argument('directory', help='包含 PDF 檔案的目錄')
+    parser.add_argument('--recursive', action='store_true', help='包含子目錄')
+    parser.add_argument('--ocr-workers', type=int, default=1,
+                        help='同時擷取文字的文件數（OCR 由所有文件共用的 OCR_WORKERS 個程序處理）')
+    parser.add_argument('--summary-workers', type=int, default=Config.SUMMARY_CONCURRENCY,
+                        help='同時產生摘要的文件數')
+    parser.add_argument('--embed-workers', type=int, default=1, help='同時向量化的文件數')
+    parser.add_argument('--tenant', default=Config.DEFAULT_TENANT, help='匯入到指定的 tenant')
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.directory):
+        parser.error(f"{args.directory} is not a directory")
+    if args.tenant != Config.DEFAULT_TENANT:
+        try:
+            validate_tenant_id(args.tenant)
+        except ValueError as e:
+            parser.error(str(e))
+
+    Config.ensure_directories()
+    # Web 應用與 CLI 會寫入同一組向量集合與索引，不能同時執行
+    writer_lock = WriterLock()
+    if not writer_lock.acquire():
+        print(f"Another process is writing to {Config.DATA_DIR} (is the web app running?); stop it before ingesting")
+        return 2
+    try:
+        pdf_paths = find_pdfs(args.directory, args.recursive)
+        print(f"Found {len(pdf_paths)} PDF files in {args.directory}")
+
+        pipeline = IngestPipeline(args.ocr_workers, args.summary_workers, args.embed_workers, args.tenant)
+        results = pipeline.run(pdf_paths)
+        print_report(results, pipeline.stage_stats)
+        return 1 if results['failed'] else 0
+    finally:
+        writer_lock.release()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,377 @@
+"""
+背景處理工作佇列 - 以 SQLite 持久化的文件處理工作與 worker pool
+
+多個程序（多個 web worker、命令列工具）可共用同一個佇列：取出工作時記錄擁有者與租約到期時間，
+執行期間定期續約；只有租約逾期（擁有者已中斷）的執行中工作才會被重新排隊。
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional
+from src.config import Config
+
+
+# 文件處理的各個階段（依序執行）
+INGESTION_STAGES = ['ocr', 'summary', 'embedding']
+
+# 工作類型：完整處理新上傳的文件，或以目前的 OCR 文字重新索引
+JOB_INGEST = 'ingest'
+JOB_REINDEX = 'reindex'
+REINDEX_STAGES = ['embedding']
+
+# 工作狀態
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_COMPLETED = 'completed'
+STATUS_FAILED = 'failed'
+ACTIVE_STATUSES = (STATUS_QUEUED, STATUS_RUNNING)
+
+
+class JobQueue:
+    def __init__(self, db_path: str = None, stages: List[str] = None):
+        self.db_path = db_path or Config.JOB_DB_PATH
+        self.stages = list(stages or INGESTION_STAGES)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._stop = threading.Event()
+        self._start_lock = threading.Lock()
+        self._workers: List[threading.Thread] = []
+        # 此佇列實例的識別（主機:程序:隨機碼），記錄在取出的工作上
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _init_db(self):
+        """建立工作資料表"""
+        with self._lock:
+            conn = self._connect()
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS jobs (
+                        id TEXT PRIMARY KEY,
+                        tenant_id TEXT,
+                        kind TEXT NOT NULL DEFAULT 'ingest',
+                        filename TEXT NOT NULL,
+                        file_path TEXT NOT NULL,
+                        status TEXT NOT NULL,
+                        current_stage TEXT,
+                        stages TEXT NOT NULL,
+                        error TEXT,
+                        owner TEXT,
+                        lease_expires_at REAL,
+                        created_at REAL NOT NULL,
+                        updated_at REAL NOT NULL
+                    )
+                """)
+                # 舊版資料表沒有 tenant_id：既有工作歸入預設 tenant
+                columns = {row['name'] for row in conn.execute("PRAGMA table_info(jobs)")}
+                if 'tenant_id' not in columns:
+                    conn.execute("ALTER TABLE jobs ADD COLUMN tenant_id TEXT")
+                if 'kind' not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN kind TEXT NOT NULL DEFAULT '{JOB_INGEST}'")
+                # 舊版資料表沒有租約欄位：既有的執行中工作沒有租約，視為已逾期
+                if 'owner' not in columns:
+                    conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+                if 'lease_expires_at' not in columns:
+                    conn.execute("ALTER TABLE jobs ADD COLUMN lease_expires_at REAL")
+                conn.execute("UPDATE jobs SET tenant_id = ? WHERE tenant_id IS NULL", (Config.DEFAULT_TENANT,))
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+                conn.execute("DROP INDEX IF EXISTS idx_jobs_filename")
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_tenant_filename ON jobs (tenant_id, filename)")
+            finally:
+                conn.close()
+
+    def enqueue(self, filename: str, file_path: str, tenant_id: str = None, kind: str = JOB_INGEST) -> str:
+        """新增一個處理工作，立即回傳工作 ID（tenant_id 未指定時為預設 tenant）
+
+        kind 為 JOB_REINDEX 時只有向量化階段，file_path 為要重新索引的 OCR 文字檔。
+        """
+        tenant_id = tenant_id or Config.DEFAULT_TENANT
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        stages = {stage: 'pending' for stage in (REINDEX_STAGES if kind == JOB_REINDEX else self.stages)}
+        with self._wakeup:
+            conn = self._connect()
+            try:
+                conn.execute(
+                    "INSERT INTO jobs (id, tenant_id, kind, filename, file_path, status, current_stage, stages, error, "
+                    "created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, NULL, ?, NULL, ?, ?)",
+                    (job_id, tenant_id, kind, filename, file_path, STATUS_QUEUED, json.dumps(stages), now, now)
+                )
+            finally:
+                conn.close()
+            self._wakeup.notify()
+        print(f"Queued {kind} job {job_id} for {filename}")
+        return job_id
+
+    def enqueue_if_absent(self, filename: str, file_path: str, tenant_id: str = None) -> Optional[str]:
+        """若該檔案沒有排隊中或執行中的工作才新增，否則回傳既有工作 ID
+
+        最近一次處理失敗的檔案不會自動重新排隊（避免反覆重跑 OCR 與 LLM 摘要），回傳失敗的工作 ID，
+        須由使用者明確重試（直接呼叫 enqueue）。
+        """
+        active = self.get_active_job(filename, tenant_id)
+        if active:
+            return active['id']
+        latest = self.get_latest_jobs(tenant_id, [filename]).get(filename)
+        if latest and latest['status'] == STATUS_FAILED:
+            return latest['id']
+        return self.enqueue(filename, file_path, tenant_id)
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        """取得單一工作的狀態"""
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        finally:
+            conn.close()
+        return self._row_to_dict(row) if row else None
+
+    def get_active_job(self, filename: str, tenant_id: str = None) -> Optional[Dict]:
+        """取得 tenant 中該檔案目前排隊中或執行中的工作"""
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE tenant_id = ? AND filename = ? AND status IN (?, ?) "
+                "ORDER BY created_at DESC LIMIT 1",
+                (tenant_id or Config.DEFAULT_TENANT, filename, *ACTIVE_STATUSES)
+            ).fetchone()
+        finally:
+            conn.close()
+        return self._row_to_dict(row) if row else None
+
+    def get_latest_jobs(self, tenant_id: str = None, filenames: List[str] = None) -> Dict[str, Dict]:
+        """取得 tenant 中各檔案最近一次的處理工作（不含重新索引），回傳 {filename: job}"""
+        query = "SELECT * FROM jobs WHERE tenant_id = ? AND kind = ?"
+        params = [tenant_id or Config.DEFAULT_TENANT, JOB_INGEST]
+        if filenames is not None:
+            if not filenames:
+                return {}
+            query += f" AND filename IN ({', '.join('?' * len(filenames))})"
+            params.extend(filenames)
+        conn = self._connect()
+        try:
+            rows = conn.execute(query + " ORDER BY created_at", params).fetchall()
+        finally:
+            conn.close()
+        return {row['filename']: self._row_to_dict(row) for row in rows}
+
+    def list_jobs(self, limit: int = 50) -> List[Dict]:
+        """列出最近的工作"""
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        finally:
+            conn.close()
+        return [self._row_to_dict(row) for row in rows]
+
+    def claim_next(self) -> Optional[Dict]:
+        """原子性地取出下一個排隊中（或租約已逾期）的工作，標記為執行中並取得租約"""
+        with self._lock:
+            conn = self._connect()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                now = time.time()
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE status = ? "
+                    "OR (status = ? AND (lease_expires_at IS NULL OR lease_expires_at < ?)) "
+                    "ORDER BY created_at LIMIT 1",
+                    (STATUS_QUEUED, STATUS_RUNNING, now)
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                conn.execute(
+                    "UPDATE jobs SET status = ?, owner = ?, lease_expires_at = ?, updated_at = ? WHERE id = ?",
+                    (STATUS_RUNNING, self.owner, now + Config.JOB_LEASE_SECONDS, now, row['id'])
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            finally:
+                conn.close()
+        if row['status'] == STATUS_RUNNING:
+            print(f"Reclaimed ingestion job {row['id']} from {row['owner']} (lease expired)")
+        job = self._row_to_dict(row)
+        job['status'] = STATUS_RUNNING
+        return job
+
+    def renew_lease(self, job_id: str) -> bool:
+        """延長此佇列持有的工作租約；工作已不屬於此佇列（租約逾期後被其他 worker 取走）時回傳 False"""
+        with self._lock:
+            conn = self._connect()
+            try:
+                cursor = conn.execute(
+                    "UPDATE jobs SET lease_expires_at = ? WHERE id = ? AND owner = ? AND status = ?",
+                    (time.time() + Config.JOB_LEASE_SECONDS, job_id, self.owner, STATUS_RUNNING)
+                )
+            finally:
+                conn.close()
+        return cursor.rowcount > 0
+
+    def update_stage(self, job_id: str, stage: str, stage_status: str):
+        """更新某個階段的進度（pending / running / done / failed）"""
+        with self._lock:
+            conn = self._connect()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                row = conn.execute(
+                    "SELECT stages FROM jobs WHERE id = ? AND owner = ?", (job_id, self.owner)
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return
+                stages = json.loads(row['stages'])
+                stages[stage] = stage_status
+                conn.execute(
+                    "UPDATE jobs SET stages = ?, current_stage = ?, updated_at = ? WHERE id = ?",
+                    (json.dumps(stages), stage, time.time(), job_id)
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            finally:
+                conn.close()
+
+    def finish(self, job_id: str, error: str = None):
+        """標記工作完成或失敗（工作已被其他 worker 取走時不覆寫）"""
+        status = STATUS_FAILED if error else STATUS_COMPLETED
+        with self._lock:
+            conn = self._connect()
+            try:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, error = ?, lease_expires_at = NULL, updated_at = ? "
+                    "WHERE id = ? AND owner = ?",
+                    (status, error, time.time(), job_id, self.owner)
+                )
+            finally:
+                conn.close()
+
+    def requeue_interrupted(self) -> int:
+        """將租約已逾期（擁有者已中斷）的執行中工作重新排隊；其他程序仍在執行的工作不受影響"""
+        with self._lock:
+            conn = self._connect()
+            try:
+                now = time.time()
+                cursor = conn.execute(
+                    "UPDATE jobs SET status = ?, owner = NULL, lease_expires_at = NULL, updated_at = ? "
+                    "WHERE status = ? AND (lease_expires_at IS NULL OR lease_expires_at < ?)",
+                    (STATUS_QUEUED, now, STATUS_RUNNING, now)
+                )
+                count = cursor.rowcount
+            finally:
+                conn.close()
+        if count:
+            print(f"Requeued {count} interrupted ingestion jobs")
+        return count
+
+    def run_job(self, job: Dict, handler: Callable[[Dict, Callable[[str], None]], None]):
+        """執行單一工作，handler 以 stage(name) 回報目前進入的階段"""
+        job_id = job['id']
+        state = {'stage': None}
+        # 執行期間定期續約，避免長時間的階段（OCR、摘要）被其他程序誤判為中斷
+        done = threading.Event()
+        heartbeat = threading.Thread(
+            target=self._heartbeat, args=(job_id, done), name=f"job-heartbeat-{job_id[:8]}", daemon=True
+        )
+        heartbeat.start()
+
+        def stage(name: str):
+            if state['stage']:
+                self.update_stage(job_id, state['stage'], 'done')
+            state['stage'] = name
+            self.update_stage(job_id, name, 'running')
+
+        try:
+            handler(job, stage)
+            if state['stage']:
+                self.update_stage(job_id, state['stage'], 'done')
+            self.finish(job_id)
+            print(f"Ingestion job {job_id} ({job['filename']}) completed")
+        except Exception as e:
+            if state['stage']:
+                self.update_stage(job_id, state['stage'], 'failed')
+            self.finish(job_id, error=str(e))
+            print(f"Ingestion job {job_id} ({job['filename']}) failed: {str(e)}")
+        finally:
+            done.set()
+            heartbeat.join()
+
+    def _heartbeat(self, job_id: str, done: threading.Event):
+        while not done.wait(Config.JOB_LEASE_SECONDS / 3):
+            try:
+                if not self.renew_lease(job_id):
+                    print(f"Lost the lease on ingestion job {job_id}")
+                    return
+            except Exception as e:
+                print(f"Error renewing lease on ingestion job {job_id}: {str(e)}")
+
+    def start(self, handler: Callable[[Dict, Callable[[str], None]], None], num_workers: int = None):
+        """啟動背景 worker pool（重複呼叫不會重複啟動）"""
+        with self._start_lock:
+            if self._workers:
+                return
+            self.requeue_interrupted()
+            self._stop.clear()
+            num_workers = num_workers or Config.INGEST_WORKERS
+            for i in range(num_workers):
+                worker = threading.Thread(
+                    target=self._worker_loop, args=(handler,),
+                    name=f"ingest-worker-{i}", daemon=True
+                )
+                worker.start()
+                self._workers.append(worker)
+        print(f"Started {num_workers} ingestion workers")
+
+    def stop(self, timeout: float = None):
+        """停止 worker pool（等待執行中的工作結束）"""
+        self._stop.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+        for worker in self._workers:
+            worker.join(timeout)
+        self._workers = []
+
+    def _worker_loop(self, handler):
+        while not self._stop.is_set():
+            try:
+                job = self.claim_next()
+            except Exception as e:
+                print(f"Error claiming ingestion job: {str(e)}")
+                job = None
+            if job is None:
+                with self._wakeup:
+                    self._wakeup.wait(timeout=Config.JOB_POLL_INTERVAL)
+                continue
+            self.run_job(job, handler)
+
+    def _row_to_dict(self, row: sqlite3.Row) -> Dict:
+        stages = json.loads(row['stages'])
+        done = sum(1 for status in stages.values() if status == 'done')
+        return {
+            'id': row['id'],
+            'tenant_id': row['tenant_id'],
+            'kind': row['kind'],
+            'filename': row['filename'],
+            'file_path': row['file_path'],
+            'status': row['status'],
+            'current_stage': row['current_stage'],
+            'stages': stages,
+            'progress': round(done / len(stages), 2) if stages else 1.0,
+            'error': row['error'],
+            'created_at': row['created_at'],
+            'updated_at': row['updated_at']
+        }
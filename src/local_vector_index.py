@@ -0,0 +1,529 @@
+"""
+本機向量集合 - 不依賴 ChromaDB 的程序內向量檢索後端
+
+向量以正規化後的 float32 存放在記憶體映射的 .npy 檔（內積即餘弦相似度），片段內容與 metadata 存放在 SQLite。
+向量數少於 LOCAL_HNSW_THRESHOLD 時以 NumPy 矩陣乘法做精確檢索，超過時改用 faiss 的 HNSW 索引（近似檢索）。
+提供 VectorStore 使用到的 ChromaDB collection 介面子集：upsert / update / delete / get / query / count。
+
+向量檔的每一列（slot）寫入後不再修改：覆寫或刪除片段只會把舊列標記為失效，
+失效列超過一定比例時才壓縮成新的向量檔。單一程序使用；多個 worker 程序請各自使用獨立的目錄。
+"""
+
+import glob
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+import numpy as np
+from src.config import Config
+
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+DB_FILE = 'chunks.db'
+INITIAL_CAPACITY = 1024
+COMPACT_RATIO = 0.25  # 失效列超過此比例時壓縮向量檔
+SQLITE_MAX_PARAMS = 900
+
+# ChromaDB where 語法的比較運算子
+OPERATORS = {
+    '$eq': lambda value, operand: value == operand,
+    '$ne': lambda value, operand: value != operand,
+    '$gt': lambda value, operand: value > operand,
+    '$gte': lambda value, operand: value >= operand,
+    '$lt': lambda value, operand: value < operand,
+    '$lte': lambda value, operand: value <= operand,
+    '$in': lambda value, operand: value in operand,
+    '$nin': lambda value, operand: value not in operand,
+}
+
+
+def matches_where(metadata: Dict, where: Optional[Dict]) -> bool:
+    """以 ChromaDB 的 where 語法比對 metadata（支援 $and、$or 與 $eq/$ne/$gt/$gte/$lt/$lte/$in/$nin）"""
+    if not where:
+        return True
+    for key, condition in where.items():
+        if key == '$and':
+            if not all(matches_where(metadata, sub) for sub in condition):
+                return False
+        elif key == '$or':
+            if not any(matches_where(metadata, sub) for sub in condition):
+                return False
+        else:
+            if not isinstance(condition, dict):
+                condition = {'$eq': condition}
+            value = metadata.get(key)
+            for operator, operand in condition.items():
+                if value is None and operator not in ('$ne', '$nin'):
+                    return False
+                try:
+                    if not OPERATORS[operator](value, operand):
+                        return False
+                except TypeError:
+                    return False
+    return True
+
+
+def _normalize(vectors) -> np.ndarray:
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class LocalVectorCollection:
+    def __init__(self, path: str = None, hnsw_threshold: int = None):
+        self.path = path or Config.LOCAL_VECTOR_DIR
+        self.hnsw_threshold = Config.LOCAL_HNSW_THRESHOLD if hnsw_threshold is None else hnsw_threshold
+        self.db_path = os.path.join(self.path, DB_FILE)
+        self._lock = threading.RLock()
+        os.makedirs(self.path, exist_ok=True)
+        self._init_db()
+        self._load()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _init_db(self):
+        """建立片段與狀態資料表"""
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS chunks (
+                    id TEXT PRIMARY KEY,
+                    slot INTEGER NOT NULL,
+                    document TEXT,
+                    metadata TEXT NOT NULL
+                )
+            """)
+            conn.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        finally:
+            conn.close()
+
+    def _load(self):
+        """載入 slot 對應與 metadata，並以記憶體映射開啟向量檔（內容不會整份讀進記憶體）"""
+        conn = self._connect()
+        try:
+            state = {row['key']: row['value'] for row in conn.execute("SELECT key, value FROM state")}
+            rows = conn.execute("SELECT id, slot, metadata FROM chunks").fetchall()
+        finally:
+            conn.close()
+
+        self._size = state.get('size', 0)          # 已使用的列數（含失效列）
+        self._generation = state.get('generation', 0)  # 向量檔版本：擴充或壓縮時遞增
+        self._epoch = state.get('epoch', 0)        # slot 編號版本：壓縮時遞增，HNSW 索引依此判斷是否可用
+        self._slots = {row['id']: row['slot'] for row in rows}
+        self._metadatas = {}
+        self._ids_by_filename = {}  # filename → 片段 ID，where 以檔名過濾時不必逐一比對 metadata
+        for row in rows:
+            self._set_metadata(row['id'], json.loads(row['metadata']))
+        self._ids_by_slot = {slot: chunk_id for chunk_id, slot in self._slots.items()}
+
+        vectors_path = self._vectors_path(self._generation)
+        self._vectors = np.load(vectors_path, mmap_mode='r+') if os.path.exists(vectors_path) else None
+        capacity = 0 if self._vectors is None else self._vectors.shape[0]
+        self._live = np.zeros(capacity, dtype=bool)
+        if self._slots:
+            self._live[list(self._slots.values())] = True
+
+        self._hnsw = None
+        self._hnsw_saved = True
+        hnsw_path = self._hnsw_path(self._epoch)
+        if faiss is not None and os.path.exists(hnsw_path):
+            index = faiss.read_index(hnsw_path)
+            # 索引涵蓋的列超過向量檔時（例如寫入中斷）捨棄，查詢時重建
+            if index.ntotal <= self._size:
+                self._hnsw = index
+        self._remove_stale_files()
+
+    def _vectors_path(self, generation: int) -> str:
+        return os.path.join(self.path, f"vectors-{generation}.npy")
+
+    def _hnsw_path(self, epoch: int) -> str:
+        return os.path.join(self.path, f"hnsw-{epoch}.index")
+
+    def _remove_stale_files(self):
+        """刪除中斷或已被取代的向量檔與索引檔"""
+        current = {self._vectors_path(self._generation), self._hnsw_path(self._epoch)}
+        for path in glob.glob(os.path.join(self.path, 'vectors-*.npy')) + glob.glob(os.path.join(self.path, 'hnsw-*.index')):
+            if path not in current:
+                os.remove(path)
+
+    def count(self) -> int:
+        return len(self._slots)
+
+    def close(self):
+        """寫回尚未儲存的 HNSW 索引並釋放記憶體映射；之後不可再使用此物件"""
+        with self._lock:
+            if self._hnsw is not None and not self._hnsw_saved:
+                faiss.write_index(self._hnsw, self._hnsw_path(self._epoch))
+                self._hnsw_saved = True
+            self._hnsw = None
+            self._vectors = None
+
+    def upsert(self, ids: List[str], embeddings, documents: List[str] = None, metadatas: List[Dict] = None):
+        """寫入片段：向量附加到新的列，覆寫的片段其舊列標記為失效"""
+        vectors = _normalize(embeddings)
+        documents = documents if documents is not None else [None] * len(ids)
+        metadatas = metadatas if metadatas is not None else [{}] * len(ids)
+        with self._lock:
+            self._ensure_capacity(self._size + len(ids), vectors.shape[1])
+            slots = list(range(self._size, self._size + len(ids)))
+            self._vectors[slots] = vectors
+            self._vectors.flush()
+
+            conn = self._connect()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.executemany(
+                    "INSERT OR REPLACE INTO chunks (id, slot, document, metadata) VALUES (?, ?, ?, ?)",
+                    [
+                        (chunk_id, slot, document, json.dumps(metadata or {}, ensure_ascii=False))
+                        for chunk_id, slot, document, metadata in zip(ids, slots, documents, metadatas)
+                    ]
+                )
+                self._set_state(conn, size=self._size + len(ids))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            finally:
+                conn.close()
+
+            for chunk_id, slot, metadata in zip(ids, slots, metadatas):
+                old_slot = self._slots.get(chunk_id)
+                if old_slot is not None:
+                    self._live[old_slot] = False
+                    self._ids_by_slot.pop(old_slot, None)
+                self._slots[chunk_id] = slot
+                self._ids_by_slot[slot] = chunk_id
+                self._set_metadata(chunk_id, dict(metadata or {}))
+                self._live[slot] = True
+            self._size += len(ids)
+            self._maybe_compact()
+
+    # ChromaDB 的 add 在此等同 upsert
+    add = upsert
+
+    def update(self, ids: List[str], metadatas: List[Dict] = None, documents: List[str] = None, embeddings=None):
+        """更新既有片段的 metadata（與原有欄位合併）或內容；提供向量時改以 upsert 寫入新列"""
+        with self._lock:
+            ids = [chunk_id for chunk_id in ids if chunk_id in self._slots]
+            if not ids:
+                return
+            if embeddings is not None:
+                current = self.get(ids=ids, include=['documents', 'metadatas'])
+                by_id = dict(zip(current['ids'], zip(current['documents'], current['metadatas'])))
+                self.upsert(
+                    ids=ids,
+                    embeddings=embeddings,
+                    documents=documents or [by_id[chunk_id][0] for chunk_id in ids],
+                    metadatas=[
+                        dict(by_id[chunk_id][1], **(metadatas[i] if metadatas else {}))
+                        for i, chunk_id in enumerate(ids)
+                    ]
+                )
+                return
+            conn = self._connect()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                for i, chunk_id in enumerate(ids):
+                    if metadatas is not None:
+                        self._set_metadata(chunk_id, dict(self._metadatas[chunk_id], **metadatas[i]))
+                        conn.execute(
+                            "UPDATE chunks SET metadata = ? WHERE id = ?",
+                            (json.dumps(self._metadatas[chunk_id], ensure_ascii=False), chunk_id)
+                        )
+                    if documents is not None:
+                        conn.execute("UPDATE chunks SET document = ? WHERE id = ?", (documents[i], chunk_id))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            finally:
+                conn.close()
+
+    def delete(self, ids: List[str] = None, where: Dict = None):
+        """刪除片段（向量列標記為失效）"""
+        with self._lock:
+            targets = self._select_ids(ids, where)
+            if not targets:
+                return
+            conn = self._connect()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                for start in range(0, len(targets), SQLITE_MAX_PARAMS):
+                    batch = targets[start:start + SQLITE_MAX_PARAMS]
+                    conn.execute(f"DELETE FROM chunks WHERE id IN ({','.join('?' * len(batch))})", batch)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            finally:
+                conn.close()
+            for chunk_id in targets:
+                slot = self._slots.pop(chunk_id)
+                self._live[slot] = False
+                self._ids_by_slot.pop(slot, None)
+                self._drop_metadata(chunk_id)
+            self._maybe_compact()
+
+    def get(self, ids: List[str] = None, where: Dict = None, include: List[str] = None, limit: int = None) -> Dict:
+        """取得片段（回傳格式與 ChromaDB collection.get 相同）"""
+        include = ['documents', 'metadatas'] if include is None else include
+        with self._lock:
+            selected = self._select_ids(ids, where)
+            if limit is not None:
+                selected = selected[:limit]
+            result = {'ids': selected, 'documents': None, 'metadatas': None, 'embeddings': None}
+            if 'documents' in include:
+                documents = self._get_documents(selected)
+                result['documents'] = [documents.get(chunk_id) for chunk_id in selected]
+            if 'metadatas' in include:
+                result['metadatas'] = [dict(self._metadatas[chunk_id]) for chunk_id in selected]
+            if 'embeddings' in include:
+                dim = 0 if self._vectors is None else self._vectors.shape[1]
+                slots = [self._slots[chunk_id] for chunk_id in selected]
+                result['embeddings'] = (
+                    np.array(self._vectors[slots]) if slots else np.zeros((0, dim), dtype=np.float32)
+                )
+            return result
+
+    def query(self, query_embeddings, n_results: int = 10, where: Dict = None, include: List[str] = None) -> Dict:
+        """以餘弦距離搜尋最近的片段（回傳格式與 ChromaDB collection.query 相同）"""
+        include = ['documents', 'metadatas', 'distances'] if include is None else include
+        queries = _normalize(query_embeddings)
+        with self._lock:
+            mask = self._candidate_mask(where)
+            candidates = int(mask.sum()) if mask is not None else 0
+            if candidates == 0:
+                hits = [([], []) for _ in queries]
+            elif self._use_hnsw() and candidates > self.hnsw_threshold:
+                hits = self._search_hnsw(queries, n_results, mask)
+            else:
+                hits = self._search_exact(queries, n_results, mask)
+
+            result = {'ids': [], 'documents': None, 'metadatas': None, 'distances': None}
+            all_ids = [chunk_id for ids, _ in hits for chunk_id in ids]
+            documents = self._get_documents(all_ids) if 'documents' in include else {}
+            if 'documents' in include:
+                result['documents'] = []
+            if 'metadatas' in include:
+                result['metadatas'] = []
+            if 'distances' in include:
+                result['distances'] = []
+            for ids, similarities in hits:
+                result['ids'].append(ids)
+                if 'documents' in include:
+                    result['documents'].append([documents.get(chunk_id) for chunk_id in ids])
+                if 'metadatas' in include:
+                    result['metadatas'].append([dict(self._metadatas[chunk_id]) for chunk_id in ids])
+                if 'distances' in include:
+                    result['distances'].append([float(1 - similarity) for similarity in similarities])
+            return result
+
+    def _set_metadata(self, chunk_id: str, metadata: Dict):
+        self._drop_metadata(chunk_id)
+        self._metadatas[chunk_id] = metadata
+        self._ids_by_filename.setdefault(metadata.get('filename'), set()).add(chunk_id)
+
+    def _drop_metadata(self, chunk_id: str):
+        metadata = self._metadatas.pop(chunk_id, None)
+        if metadata is not None:
+            filename = metadata.get('filename')
+            ids = self._ids_by_filename.get(filename)
+            if ids is not None:
+                ids.discard(chunk_id)
+                if not ids:
+                    del self._ids_by_filename[filename]
+
+    def _ids_for_filenames(self, where: Dict):
+        """where 含檔名條件（相等或 $in，可在 $and 內）時，以檔名索引取得候選 ID；否則回傳 None"""
+        candidates = None
+        for key, condition in where.items():
+            if key == '$and':
+                for sub in condition:
+                    ids = self._ids_for_filenames(sub)
+                    if ids is not None:
+                        candidates = ids if candidates is None else candidates & ids
+            elif key == 'filename':
+                if isinstance(condition, dict) and set(condition) == {'$in'}:
+                    filenames = condition['$in']
+                elif isinstance(condition, dict) and set(condition) == {'$eq'}:
+                    filenames = [condition['$eq']]
+                elif not isinstance(condition, dict):
+                    filenames = [condition]
+                else:
+                    continue
+                ids = set().union(*(self._ids_by_filename.get(filename, ()) for filename in filenames))
+                candidates = ids if candidates is None else candidates & ids
+        return candidates
+
+    def _select_ids(self, ids: List[str] = None, where: Dict = None) -> List[str]:
+        if ids is not None:
+            selected = list(dict.fromkeys(chunk_id for chunk_id in ids if chunk_id in self._slots))
+        else:
+            candidates = self._ids_for_filenames(where) if where else None
+            selected = list(self._slots) if candidates is None else sorted(candidates, key=self._slots.get)
+        if where:
+            selected = [chunk_id for chunk_id in selected if matches_where(self._metadatas[chunk_id], where)]
+        return selected
+
+    def _get_documents(self, ids: List[str]) -> Dict[str, str]:
+        documents = {}
+        if not ids:
+            return documents
+        unique_ids = list(dict.fromkeys(ids))
+        conn = self._connect()
+        try:
+            for start in range(0, len(unique_ids), SQLITE_MAX_PARAMS):
+                batch = unique_ids[start:start + SQLITE_MAX_PARAMS]
+                rows = conn.execute(
+                    f"SELECT id, document FROM chunks WHERE id IN ({','.join('?' * len(batch))})", batch
+                )
+                documents.update((row['id'], row['document']) for row in rows)
+        finally:
+            conn.close()
+        return documents
+
+    def _candidate_mask(self, where: Dict = None) -> Optional[np.ndarray]:
+        """可被搜尋到的列（有效且符合 where 條件）"""
+        if self._vectors is None:
+            return None
+        if not where:
+            return self._live[:self._size]
+        mask = np.zeros(self._size, dtype=bool)
+        slots = [self._slots[chunk_id] for chunk_id in self._select_ids(where=where)]
+        if slots:
+            mask[slots] = True
+        return mask
+
+    def _search_exact(self, queries: np.ndarray, n_results: int, mask: np.ndarray):
+        """精確檢索：所有候選列與查詢做一次矩陣乘法"""
+        if mask.all():
+            slots = None
+            similarities = queries @ self._vectors[:self._size].T
+        else:
+            slots = np.flatnonzero(mask)
+            similarities = queries @ self._vectors[slots].T
+        k = min(n_results, similarities.shape[1])
+        hits = []
+        for row in similarities:
+            top = np.argpartition(-row, k - 1)[:k] if k < len(row) else np.arange(len(row))
+            top = top[np.argsort(-row[top])]
+            row_slots = top if slots is None else slots[top]
+            hits.append(([self._ids_by_slot[int(slot)] for slot in row_slots], row[top].tolist()))
+        return hits
+
+    def _use_hnsw(self) -> bool:
+        return faiss is not None and self._size > self.hnsw_threshold
+
+    def _search_hnsw(self, queries: np.ndarray, n_results: int, mask: np.ndarray):
+        """HNSW 近似檢索：索引包含所有列，失效或不符合條件的列在結果中過濾，不足時加大搜尋數量"""
+        index = self._ensure_hnsw()
+        candidates = int(mask.sum())
+        k = min(n_results, candidates)
+        hits = []
+        for query in queries:
+            fetch = min(self._size, max(k * 2, Config.HNSW_EF_SEARCH))
+            while True:
+                index.hnsw.efSearch = max(Config.HNSW_EF_SEARCH, fetch)
+                similarities, slots = index.search(query[None, :], fetch)
+                found = [(slot, similarity) for slot, similarity in zip(slots[0], similarities[0])
+                         if slot >= 0 and mask[slot]]
+                if len(found) >= k or fetch >= self._size:
+                    break
+                fetch = min(self._size, fetch * 4)
+            found = found[:k]
+            hits.append(([self._ids_by_slot[int(slot)] for slot, _ in found], [float(s) for _, s in found]))
+        return hits
+
+    def _ensure_hnsw(self):
+        """建立或延伸 HNSW 索引（id 即 slot 編號），有變動時寫回磁碟"""
+        if self._hnsw is None:
+            dim = self._vectors.shape[1]
+            self._hnsw = faiss.IndexHNSWFlat(dim, Config.HNSW_M, faiss.METRIC_INNER_PRODUCT)
+            self._hnsw.hnsw.efConstruction = Config.HNSW_EF_CONSTRUCTION
+            self._hnsw_saved = False
+        if self._hnsw.ntotal < self._size:
+            self._hnsw.add(np.ascontiguousarray(self._vectors[self._hnsw.ntotal:self._size]))
+            self._hnsw_saved = False
+        if not self._hnsw_saved:
+            faiss.write_index(self._hnsw, self._hnsw_path(self._epoch))
+            self._hnsw_saved = True
+        return self._hnsw
+
+    def _ensure_capacity(self, required: int, dim: int):
+        """向量檔容量不足時以兩倍容量建立新版本（slot 編號不變）"""
+        if self._vectors is not None:
+            if self._vectors.shape[1] != dim:
+                raise ValueError(f"embedding dimension {dim} does not match collection dimension {self._vectors.shape[1]}")
+            if required <= self._vectors.shape[0]:
+                return
+        capacity = max(INITIAL_CAPACITY, required, 2 * (0 if self._vectors is None else self._vectors.shape[0]))
+        self._rewrite(list(range(self._size)), capacity, dim, compact=False)
+
+    def _maybe_compact(self):
+        dead = self._size - len(self._slots)
+        if self._size >= INITIAL_CAPACITY and dead > self._size * COMPACT_RATIO:
+            self._compact()
+
+    def _compact(self):
+        """只保留有效列寫成新的向量檔，重新編號 slot；HNSW 索引捨棄，下次查詢時重建"""
+        live_ids = sorted(self._slots, key=self._slots.get)
+        old_slots = [self._slots[chunk_id] for chunk_id in live_ids]
+        capacity = max(INITIAL_CAPACITY, 2 * len(live_ids))
+        self._rewrite(old_slots, capacity, self._vectors.shape[1], compact=True, live_ids=live_ids)
+
+    def _rewrite(self, old_slots: List[int], capacity: int, dim: int, compact: bool, live_ids: List[str] = None):
+        """將指定的列依序寫入新版本的向量檔，並在同一個交易中切換版本"""
+        generation = self._generation + 1
+        epoch = self._epoch + 1 if compact else self._epoch
+        vectors = np.lib.format.open_memmap(
+            self._vectors_path(generation), mode='w+', dtype=np.float32, shape=(capacity, dim)
+        )
+        if old_slots:
+            vectors[:len(old_slots)] = self._vectors[old_slots]
+        vectors.flush()
+
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            if compact:
+                conn.executemany(
+                    "UPDATE chunks SET slot = ? WHERE id = ?",
+                    [(slot, chunk_id) for slot, chunk_id in enumerate(live_ids)]
+                )
+            self._set_state(conn, size=len(old_slots), generation=generation, epoch=epoch)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            del vectors
+            os.remove(self._vectors_path(generation))
+            raise
+        finally:
+            conn.close()
+
+        self._vectors = vectors
+        self._generation = generation
+        self._size = len(old_slots)
+        live = np.zeros(capacity, dtype=bool)
+        live[:self._size] = self._live[old_slots] if not compact else True
+        self._live = live
+        if compact:
+            self._epoch = epoch
+            self._slots = {chunk_id: slot for slot, chunk_id in enumerate(live_ids)}
+            self._ids_by_slot = dict(enumerate(live_ids))
+            self._hnsw = None
+        self._remove_stale_files()
+
+    @staticmethod
+    def _set_state(conn: sqlite3.Connection, **values):
+        conn.executemany(
+            "INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", list(values.items())
+        )
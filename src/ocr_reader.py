@@ -1,10 +1,119 @@
+import json
+import math
+import multiprocessing
 import os
+import sys
+import threading
+import time
 import PyPDF2
 import pytesseract
-from pdf2image import convert_from_path
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pdf2image import convert_from_path, pdfinfo_from_path
 from PIL import Image
 from src.config import Config
 
+# resource 僅在 Unix 平台提供，用於記錄峰值記憶體
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def _ocr_page_window(pdf_path, first_page, last_page, dpi, lang, timeout):
+    """在子程序中轉換並辨識一個頁面視窗，辨識完即釋放圖片（記憶體上限取決於視窗大小）"""
+    page_texts = []
+    try:
+        images = convert_from_path(pdf_path, dpi=dpi, first_page=first_page, last_page=last_page)
+    except Exception as e:
+        print(f"Error rasterizing pages {first_page}-{last_page}: {str(e)}")
+        return [""] * (last_page - first_page + 1)
+
+    for offset in range(last_page - first_page + 1):
+        page_number = first_page + offset
+        if offset >= len(images):
+            page_texts.append("")
+            continue
+        image = images[offset]
+        images[offset] = None
+        try:
+            page_texts.append(pytesseract.image_to_string(image, lang=lang, timeout=timeout))
+        except RuntimeError as e:
+            # pytesseract 逾時會終止 tesseract 並拋出 RuntimeError
+            print(f"OCR timed out on page {page_number}: {str(e)}")
+            page_texts.append("")
+        except Exception as e:
+            print(f"Error in OCR on page {page_number}: {str(e)}")
+            page_texts.append("")
+        finally:
+            image.close()
+    return page_texts
+
+
+def _peak_rss_mb():
+    """回傳 (本程序的峰值 RSS, 單一子程序的最大峰值 RSS)（MB），不支援的平台回傳 None
+
+    RUSAGE_CHILDREN 的 ru_maxrss 是已結束子程序中峰值最大的那一個，不是 worker pool 的總和；
+    整個 OCR 的記憶體上限約為此值乘以同時執行的 worker 數。
+    """
+    if resource is None:
+        return None, None
+    # Linux 上 ru_maxrss 單位為 KB，macOS 為 bytes
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+    return round(own, 1), round(children, 1)
+
+
+def available_cpus():
+    """本程序實際可使用的 CPU 數：考慮 CPU affinity（cpuset）與 cgroup v2 的 CPU 配額（容器的 --cpus）"""
+    if hasattr(os, 'process_cpu_count'):  # Python 3.13+
+        cpus = os.process_cpu_count() or 1
+    elif hasattr(os, 'sched_getaffinity'):
+        cpus = len(os.sched_getaffinity(0)) or 1
+    else:
+        cpus = os.cpu_count() or 1
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()[:2]
+        if quota != 'max':
+            cpus = min(cpus, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+def ocr_pool_size():
+    """OCR 程序數量：OCR_WORKERS，未設定時為可用的 CPU 數"""
+    return Config.OCR_WORKERS if Config.OCR_WORKERS > 0 else available_cpus()
+
+
+# 所有文件（背景 worker、批次匯入的多個擷取執行緒）共用一個 OCR 程序池，程序總數不超過 ocr_pool_size()
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_ocr_pool():
+    """取得共用的 OCR 程序池（第一次使用時建立）
+
+    以 spawn 啟動子程序：呼叫端是多執行緒的 worker，fork 會複製其他執行緒持有中的鎖而可能卡死。
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=ocr_pool_size(), mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def _reset_ocr_pool(pool):
+    """子程序異常結束（例如記憶體不足被終止）後程序池無法再使用，丟棄後下次重新建立"""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False)
+
+
 class OCRReader:
     def __init__(self):
         # 設定 Tesseract 路徑（Windows 用戶可能需要）
@@ -12,71 +121,160 @@ class OCRReader:
         pass
     
     def extract_text_from_pdf(self, pdf_path):
-        """從 PDF 中提取文字，先嘗試直接提取，再使用 OCR"""
+        """從 PDF 中提取文字：有文字層的頁面直接提取，純圖片頁面才使用 OCR"""
+        text, _ = self.extract_text_with_provenance(pdf_path)
+        return text
+
+    def extract_text_with_provenance(self, pdf_path):
+        """逐頁判斷文字來源並提取文字，回傳 (文字, 每頁來源紀錄)"""
         try:
-            # 方法1：嘗試直接從 PDF 提取文字
-            text = self._extract_text_directly(pdf_path)
-            
-            # 如果直接提取的文字太少，使用 OCR
-            if len(text.strip()) < 100:
-                print(f"Direct extraction yielded little text, using OCR...")
-                text = self._extract_text_with_ocr(pdf_path)
-            
-            return text
+            # 方法1：嘗試直接從 PDF 逐頁提取文字
+            page_texts = self._extract_text_directly(pdf_path)
+            if not page_texts:
+                page_texts = [""] * pdfinfo_from_path(pdf_path)['Pages']
+
+            # 文字太少的頁面視為圖片頁，交給 OCR
+            ocr_pages = [
+                page_number for page_number, page_text in enumerate(page_texts, start=1)
+                if len(page_text.strip()) < Config.OCR_MIN_PAGE_CHARS
+            ]
+            ocr_seconds = 0.0
+            if ocr_pages:
+                print(f"{len(ocr_pages)}/{len(page_texts)} pages have no text layer, using OCR...")
+                ocr_start = time.perf_counter()
+                ocr_texts = self._ocr_pages(pdf_path, ocr_pages)
+                ocr_seconds = time.perf_counter() - ocr_start
+                for page_number, page_text in ocr_texts.items():
+                    page_texts[page_number - 1] = page_text
+
+            ocr_page_set = set(ocr_pages)
+            text = ""
+            pages = []
+            for page_number, page_text in enumerate(page_texts, start=1):
+                text += f"\n--- Page {page_number} ---\n{page_text}\n"
+                pages.append({
+                    'page': page_number,
+                    'source': 'ocr' if page_number in ocr_page_set else 'text',
+                    'chars': len(page_text.strip())
+                })
+
+            # 以實測的每頁 OCR 時間估算直接提取節省的時間
+            seconds_per_page = ocr_seconds / len(ocr_pages) if ocr_pages else None
+            provenance = {
+                'total_pages': len(page_texts),
+                'text_pages': len(page_texts) - len(ocr_pages),
+                'ocr_pages': len(ocr_pages),
+                'ocr_seconds': round(ocr_seconds, 2),
+                'estimated_ocr_seconds_saved': (
+                    round(seconds_per_page * (len(page_texts) - len(ocr_pages)), 2)
+                    if seconds_per_page is not None else None
+                ),
+                'pages': pages
+            }
+            return text, provenance
         except Exception as e:
             print(f"Error extracting text from PDF: {str(e)}")
-            return ""
-    
+            return "", None
+
     def _extract_text_directly(self, pdf_path):
-        """直接從 PDF 提取文字"""
-        text = ""
+        """直接從 PDF 逐頁提取文字，回傳每頁文字的清單"""
+        page_texts = []
         try:
             with open(pdf_path, 'rb') as file:
                 pdf_reader = PyPDF2.PdfReader(file)
-                for page_num in range(len(pdf_reader.pages)):
-                    page = pdf_reader.pages[page_num]
-                    text += page.extract_text() + "\n"
+                for page in pdf_reader.pages:
+                    try:
+                        page_texts.append(page.extract_text() or "")
+                    except Exception as e:
+                        print(f"Error extracting text from page {len(page_texts) + 1}: {str(e)}")
+                        page_texts.append("")
         except Exception as e:
             print(f"Error in direct text extraction: {str(e)}")
-        return text
-    
+        return page_texts
+
     def _extract_text_with_ocr(self, pdf_path):
-        """使用 OCR 從 PDF 提取文字"""
+        """使用 OCR 從整份 PDF 提取文字"""
         text = ""
         try:
-            # 將 PDF 轉換為圖片
-            pages = convert_from_path(pdf_path, dpi=200)
-            
-            for i, page in enumerate(pages):
-                print(f"Processing page {i+1}/{len(pages)} with OCR...")
-                # 使用 Tesseract 進行 OCR
-                page_text = pytesseract.image_to_string(page, lang='chi_tra+eng')
-                text += f"\n--- Page {i+1} ---\n{page_text}\n"
-                
+            page_count = pdfinfo_from_path(pdf_path)['Pages']
+            ocr_texts = self._ocr_pages(pdf_path, list(range(1, page_count + 1)))
+            for page_number in range(1, page_count + 1):
+                text += f"\n--- Page {page_number} ---\n{ocr_texts.get(page_number, '')}\n"
         except Exception as e:
             print(f"Error in OCR extraction: {str(e)}")
-        
         return text
-    
-    def process_pdf(self, pdf_path, filename):
-        """處理 PDF 並儲存提取的文字"""
+
+    def _ocr_pages(self, pdf_path, page_numbers):
+        """對指定頁面執行 OCR（以頁面視窗串流轉換，交給共用的程序池平行處理），回傳 {頁碼: 文字}"""
+        windows = self._build_windows(page_numbers, max(1, Config.OCR_WINDOW_SIZE))
+        pool_size = ocr_pool_size()
+        print(f"Running OCR on {len(page_numbers)} pages in {len(windows)} windows "
+              f"(shared pool of {pool_size} workers)...")
+
+        args = (Config.OCR_DPI, Config.OCR_LANG, Config.OCR_PAGE_TIMEOUT)
+        # 單一視窗也交給程序池：同時處理多份文件時，OCR 程序總數仍以程序池大小為上限
+        pool = _get_ocr_pool()
+        # map 依提交順序回傳結果，確保頁序正確
+        window_texts = pool.map(
+            _ocr_page_window,
+            [pdf_path] * len(windows),
+            [first for first, _ in windows],
+            [last for _, last in windows],
+            *[[arg] * len(windows) for arg in args]
+        )
+
+        results = {}
+        try:
+            for (first, _), page_texts in zip(windows, window_texts):
+                for offset, page_text in enumerate(page_texts):
+                    results[first + offset] = page_text
+        except BrokenProcessPool:
+            _reset_ocr_pool(pool)
+            raise
+        return results
+
+    def _build_windows(self, page_numbers, window):
+        """將頁碼切成連續且不超過視窗大小的區段 [(first, last), ...]"""
+        windows = []
+        for page_number in sorted(page_numbers):
+            if windows:
+                first, last = windows[-1]
+                if page_number == last + 1 and last - first + 1 < window:
+                    windows[-1] = (first, page_number)
+                    continue
+            windows.append((page_number, page_number))
+        return windows
+
+    def process_pdf(self, pdf_path, filename, output_dir=None):
+        """處理 PDF 並儲存提取的文字（預設存到 Config.OCR_DIR）"""
         try:
             print(f"Starting OCR processing for {filename}...")
             
-            # 提取文字
-            text = self.extract_text_from_pdf(pdf_path)
+            # 提取文字（逐頁記錄來源）
+            text, provenance = self.extract_text_with_provenance(pdf_path)
             
             if not text.strip():
                 raise Exception("No text could be extracted from the PDF")
             
             # 儲存提取的文字
             ocr_filename = os.path.splitext(filename)[0] + '.txt'
-            ocr_path = os.path.join(Config.OCR_DIR, ocr_filename)
+            ocr_path = os.path.join(output_dir or Config.OCR_DIR, ocr_filename)
             
             with open(ocr_path, 'w', encoding='utf-8') as f:
                 f.write(text)
             
             print(f"OCR processing completed. Text saved to {ocr_path}")
+
+            # 儲存每頁來源紀錄，用於評估 OCR 節省的時間
+            if provenance:
+                provenance_path = os.path.splitext(ocr_path)[0] + '.provenance.json'
+                with open(provenance_path, 'w', encoding='utf-8') as f:
+                    json.dump(provenance, f, ensure_ascii=False, indent=2)
+                print(f"Pages: {provenance['text_pages']} direct text, {provenance['ocr_pages']} OCR "
+                      f"({provenance['ocr_seconds']}s OCR, ~{provenance['estimated_ocr_seconds_saved']}s saved)")
+            peak_rss, peak_children_rss = _peak_rss_mb()
+            if peak_rss is not None:
+                print(f"Peak RSS after OCR of {filename}: {peak_rss} MB (largest single OCR worker: {peak_children_rss} MB)")
             return ocr_path, text
             
         except Exception as e:
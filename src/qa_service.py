@@ -1,8 +1,14 @@
 
-from typing import List, Dict
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Dict, Iterator, List, Tuple
 from src.config import Config
 from src.vector_store import VectorStore
 from src.smart_retrieval import SmartRetrievalService
+from src.services import get_vector_store
+from src.answer_cache import AnswerCache, create_answer_cache
 
 # Gemini
 import google.generativeai as genai
@@ -13,53 +19,253 @@ try:
 except ImportError:
     openai = None
 
- 
+# 找不到相關文檔時的回應
+NO_RESULT_ANSWER = {
+    'answer': '抱歉，我找不到相關的資訊來回答您的問題。請確認您已上傳相關的 PDF 文件，或嘗試重新表述您的問題。',
+    'sources': [],
+    'confidence': 0.0
+}
+
+# 指定的檢索範圍沒有任何可檢索文檔時的回應
+NO_SCOPE_ANSWER = {
+    'answer': '指定的範圍內沒有可檢索的文檔，請確認檔名、上傳日期或標籤條件。',
+    'sources': [],
+    'confidence': 0.0
+}
+
+
+class AnswerGenerationError(Exception):
+    """LLM 生成回答失敗；訊息為回傳給使用者的錯誤說明，這類回答不寫入問答快取"""
+
+
+class QAService:
+    def __init__(self, vector_store: VectorStore = None, smart_retrieval: SmartRetrievalService = None,
+                 answer_cache: AnswerCache = None, tenant_id: str = '', executor: ThreadPoolExecutor = None):
+        if Config.PROVIDER == 'gemini':
+            genai.configure(api_key=Config.GEMINI_API_KEY)
+        if openai and Config.PROVIDER == 'openai':
+            openai.api_key = Config.OPENAI_API_KEY
+
+        # 與智能檢索共用同一個向量資料庫（預設為程序內的共用實例）
+        self.vector_store = vector_store or get_vector_store()
+        self.smart_retrieval = smart_retrieval or SmartRetrievalService(self.vector_store)
+        # 所屬 tenant（預設 tenant 為空字串），併入問答快取的命名空間
+        self.tenant_id = tenant_id
+        # 問答快取：相同或近似的問題在文檔未變動時直接回傳先前的回答
+        self.answer_cache = answer_cache if answer_cache is not None else create_answer_cache()
+        # 非同步模式下執行檢索等阻塞工作的執行緒池（第一次使用時建立；多個 tenant 可共用同一個）
+        self._executor = executor
+        self._executor_lock = threading.Lock()
+        # OpenAI（openai>=1.0）的同步與非同步客戶端（第一次使用時建立，之後重複使用連線）
+        self._openai = None
+        self._async_openai = None
+
+    def answer_question(self, question: str, scope: Dict = None) -> Dict:
+        """回答使用者問題，優先使用問答快取
+
+        scope 限定檢索範圍（filenames、uploaded_after、uploaded_before、tags，見 DocumentCatalog.resolve_scope），
+        檢索只在符合條件的文檔中進行。
+        """
+        filenames = self._resolve_scope(scope)
+        if filenames == []:
+            return dict(NO_SCOPE_ANSWER)
+        cached, cache_key = self._lookup_cached_answer(question, filenames)
+        if cached is not None:
+            return cached
+
+        result, generated = self._answer_question(question, filenames)
+        if generated:
+            self._store_cached_answer(cache_key, question, result)
+        return result
+
+    def answer_question_stream(self, question: str, scope: Dict = None) -> Iterator[Tuple[str, Dict]]:
+        """以串流方式回答：先產生 ('sources', ...)，接著逐段產生 ('token', ...)，最後產生 ('done', ...)"""
+        filenames = self._resolve_scope(scope)
+        if filenames == []:
+            yield from self._yield_answer(dict(NO_SCOPE_ANSWER), cached=False)
+            return
+        cached, cache_key = self._lookup_cached_answer(question, filenames)
+        if cached is not None:
+            yield from self._yield_answer(cached, cached=True)
+            return
+
+        try:
+            print(f"Processing question (stream): {question}")
+            plan = self._plan_answer(question, filenames)
+            if plan is None:
+                yield from self._yield_answer(dict(NO_RESULT_ANSWER), cached=False)
+                return
+
+            result = self._result_metadata(plan)
+            yield 'sources', dict(result)
+
+            pieces = []
+            try:
+                for piece in self._stream_answer(plan):
+                    pieces.append(piece)
+                    yield 'token', {'text': piece}
+            except AnswerGenerationError as e:
+                yield 'token', {'text': str(e)}
+                yield 'done', {'cached': False}
+                return
+
+            result['answer'] = ''.join(pieces).strip()
+            self._store_cached_answer(cache_key, question, result)
+            yield 'done', {'cached': False}
+
+        except Exception as e:
+            print(f"Error in QA service (stream): {str(e)}")
+            yield 'error', {'error': f'處理問題時發生錯誤：{str(e)}'}
+
+    async def answer_question_async(self, question: str, scope: Dict = None) -> Dict:
+        """answer_question 的非同步版本：檢索在執行緒池執行，LLM 以非同步客戶端呼叫"""
+        filenames = await self._run_blocking(self._resolve_scope, scope)
+        if filenames == []:
+            return dict(NO_SCOPE_ANSWER)
+        cached, cache_key = await self._run_blocking(self._lookup_cached_answer, question, filenames)
+        if cached is not None:
+            return cached
 
-    def answer_question(self, question: str) -> Dict:
-        """回答使用者問題（使用智能檢索策略）"""
+        try:
+            print(f"Processing question (async): {question}")
+            plan = await self._run_blocking(self._plan_answer, question, filenames)
+            if plan is None:
+                return dict(NO_RESULT_ANSWER)
+            result = self._result_metadata(plan)
+            try:
+                result['answer'] = await self._agenerate_answer(plan)
+            except AnswerGenerationError as e:
+                result['answer'] = str(e).strip()
+                return result
+        except Exception as e:
+            print(f"Error in QA service (async): {str(e)}")
+            return {
+                'answer': f'處理問題時發生錯誤：{str(e)}',
+                'sources': [],
+                'confidence': 0.0
+            }
+
+        await self._run_blocking(self._store_cached_answer, cache_key, question, result)
+        return result
+
+    async def answer_question_stream_async(self, question: str, scope: Dict = None) -> AsyncIterator[Tuple[str, Dict]]:
+        """answer_question_stream 的非同步版本，事件格式相同"""
+        filenames = await self._run_blocking(self._resolve_scope, scope)
+        if filenames == []:
+            for event in self._yield_answer(dict(NO_SCOPE_ANSWER), cached=False):
+                yield event
+            return
+        cached, cache_key = await self._run_blocking(self._lookup_cached_answer, question, filenames)
+        if cached is not None:
+            for event in self._yield_answer(cached, cached=True):
+                yield event
+            return
+
+        try:
+            print(f"Processing question (async stream): {question}")
+            plan = await self._run_blocking(self._plan_answer, question, filenames)
+            if plan is None:
+                for event in self._yield_answer(dict(NO_RESULT_ANSWER), cached=False):
+                    yield event
+                return
+
+            result = self._result_metadata(plan)
+            yield 'sources', dict(result)
+
+            pieces = []
+            try:
+                async for piece in self._astream_answer(plan):
+                    pieces.append(piece)
+                    yield 'token', {'text': piece}
+            except AnswerGenerationError as e:
+                yield 'token', {'text': str(e)}
+                yield 'done', {'cached': False}
+                return
+
+            result['answer'] = ''.join(pieces).strip()
+            await self._run_blocking(self._store_cached_answer, cache_key, question, result)
+            yield 'done', {'cached': False}
+
+        except Exception as e:
+            print(f"Error in QA service (async stream): {str(e)}")
+            yield 'error', {'error': f'處理問題時發生錯誤：{str(e)}'}
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=Config.ASYNC_RETRIEVAL_WORKERS, thread_name_prefix='qa-retrieval'
+                    )
+        return self._executor
+
+    def _run_blocking(self, func, *args):
+        """在執行緒池執行阻塞工作（嵌入、向量檢索、SQLite），不佔用事件迴圈"""
+        return asyncio.get_running_loop().run_in_executor(self.executor, functools.partial(func, *args))
+
+    def _resolve_scope(self, scope: Dict = None):
+        """將檢索範圍轉為檔名清單（未限定範圍時為 None）"""
+        if not scope:
+            return None
+        filenames = self.vector_store.catalog.resolve_scope(scope)
+        if filenames is not None:
+            print(f"Retrieval scope: {len(filenames)} document(s)")
+        return filenames
+
+    def _yield_answer(self, result: Dict, cached: bool) -> Iterator[Tuple[str, Dict]]:
+        """以串流事件格式輸出完整的回答"""
+        yield 'sources', self._result_metadata(result)
+        yield 'token', {'text': result['answer']}
+        yield 'done', {'cached': cached}
+
+    def _lookup_cached_answer(self, question: str, filenames: List[str] = None):
+        """查詢問答快取，回傳 (快取的回答或 None, 寫入快取用的鍵)"""
+        if self.answer_cache is None:
+            return None, None
+        try:
+            # 版本在生成前取得：生成期間有文檔變動時，回答歸入舊版本而不會被新版本誤用
+            namespace = AnswerCache.namespace(
+                Config.LOCAL_EMBEDDING_MODEL, self.vector_store.catalog.version(), self.tenant_id
+            )
+            scope = AnswerCache.scope_key(filenames)
+            embedding = self.vector_store.embed_query(question)
+            cached = self.answer_cache.lookup(namespace, embedding, scope)
+            if cached is not None:
+                print(f"Answer cache hit (similarity {cached['cache_similarity']})")
+                cached['cached'] = True
+                return cached, None
+            return None, (namespace, embedding, scope)
+        except Exception as e:
+            print(f"Error reading answer cache: {str(e)}")
+            return None, None
+
+    def _store_cached_answer(self, cache_key, question: str, result: Dict):
+        # 只快取成功檢索到來源的回答
+        if cache_key is None or not result.get('sources'):
+            return
+        try:
+            self.answer_cache.store(cache_key[0], question, cache_key[1], result, cache_key[2])
+        except Exception as e:
+            print(f"Error writing answer cache: {str(e)}")
+
+    def _answer_question(self, question: str, filenames: List[str] = None) -> Tuple[Dict, bool]:
+        """回答使用者問題（使用智能檢索策略），回傳 (回答, 是否由 LLM 成功生成)"""
         try:
             print(f"Processing question: {question}")
             
-            # 1. 分析問題複雜度
-            question_analysis = self.smart_retrieval.analyze_question_complexity(question)
-            print(f"Question analysis: {question_analysis}")
-            
-            # 2. 處理廣泛性問題
-            if question_analysis['is_broad']:
-                return self._handle_broad_question(question)
-            
-            # 3. 使用自適應檢索
-            relevant_docs = self.smart_retrieval.adaptive_retrieval(question)
-            
-            if not relevant_docs:
-                return {
-                    'answer': '抱歉，我找不到相關的資訊來回答您的問題。請確認您已上傳相關的 PDF 文件，或嘗試重新表述您的問題。',
-                    'sources': [],
-                    'confidence': 0.0
-                }
-            
-            # 4. 準備智能上下文
-            context = self._prepare_smart_context(relevant_docs, question)
-            
-            # 5. 生成回答
-            if Config.PROVIDER == 'gemini':
-                answer = self._generate_answer_gemini(question, context, question_analysis)
-            else:
-                answer = self._generate_answer_openai(question, context, question_analysis)
-            
-            # 6. 準備來源資訊
-            sources = self._prepare_sources(relevant_docs)
+            plan = self._plan_answer(question, filenames)
+            if plan is None:
+                return dict(NO_RESULT_ANSWER), False
             
-            # 7. 計算信心分數
-            confidence = self._calculate_enhanced_confidence(relevant_docs, question_analysis)
-            
-            return {
-                'answer': answer,
-                'sources': sources,
-                'confidence': confidence,
-                'retrieved_docs': len(relevant_docs),
-                'question_analysis': question_analysis
-            }
+            # 生成回答並附上來源與信心分數
+            result = self._result_metadata(plan)
+            try:
+                result['answer'] = self._generate_answer(plan)
+            except AnswerGenerationError as e:
+                result['answer'] = str(e)
+                return result, False
+            return result, True
             
         except Exception as e:
             print(f"Error in QA service: {str(e)}")
@@ -67,9 +273,32 @@ except ImportError:
                 'answer': f'處理問題時發生錯誤：{str(e)}',
                 'sources': [],
                 'confidence': 0.0
-            }
+            }, False
+    
+    def _plan_answer(self, question: str, filenames: List[str] = None):
+        """檢索並準備上下文（filenames 為檢索範圍）；找不到相關文檔時回傳 None"""
+        # 1. 分析問題複雜度
+        question_analysis = self.smart_retrieval.analyze_question_complexity(question)
+        print(f"Question analysis: {question_analysis}")
+        
+        # 2. 處理廣泛性問題
+        if question_analysis['is_broad']:
+            return self._plan_broad_question(question, filenames)
+        
+        # 3. 使用自適應檢索
+        relevant_docs = self.smart_retrieval.adaptive_retrieval(question, filenames)
+        if not relevant_docs:
+            return None
+        
+        # 4. 準備智能上下文
+        return {
+            'question': question,
+            'docs': relevant_docs,
+            'context': self._prepare_smart_context(relevant_docs, question),
+            'question_analysis': question_analysis
+        }
     
-    def _handle_broad_question(self, question: str) -> Dict:
+    def _plan_broad_question(self, question: str, filenames: List[str] = None) -> Dict:
         """處理廣泛性問題"""
         print("Handling broad question with decomposition strategy...")
         
@@ -77,11 +306,12 @@ except ImportError:
         sub_questions = self.smart_retrieval.decompose_broad_question(question)
         print(f"Decomposed into {len(sub_questions)} sub-questions")
         
-        # 收集所有相關文檔
-        all_relevant_docs = []
-        for sub_q in sub_questions:
-            docs = self.smart_retrieval.adaptive_retrieval(sub_q)
-            all_relevant_docs.extend(docs)
+        # 收集所有相關文檔（子問題一次批次嵌入並以單次多查詢檢索）
+        all_relevant_docs = [
+            doc
+            for docs in self.smart_retrieval.adaptive_retrieval_many(sub_questions, filenames)
+            for doc in docs
+        ]
         
         # 去重但保留順序
         seen_ids = set()
@@ -97,37 +327,172 @@ except ImportError:
             unique_docs = unique_docs[:Config.MAX_TOP_K]
         
         # 準備綜合上下文
-        context = self._prepare_comprehensive_context(unique_docs, question)
-        
-        # 生成綜合回答
-        question_analysis = {'is_broad': True, 'complexity_score': 10}
-        if Config.PROVIDER == 'gemini':
-            answer = self._generate_comprehensive_answer_gemini(question, context, sub_questions)
-        else:
-            answer = self._generate_comprehensive_answer_openai(question, context, sub_questions)
-        
         return {
-            'answer': answer,
-            'sources': self._prepare_sources(unique_docs),
-            'confidence': self._calculate_enhanced_confidence(unique_docs, question_analysis),
-            'retrieved_docs': len(unique_docs),
+            'question': question,
+            'docs': unique_docs,
+            'context': self._prepare_comprehensive_context(unique_docs, question),
             'sub_questions': sub_questions
         }
     
+    def _result_metadata(self, plan: Dict) -> Dict:
+        """回答以外的回應欄位（來源、信心分數、問題分析）"""
+        if 'docs' not in plan:
+            # 快取或無結果的回應：沿用既有欄位
+            return {key: value for key, value in plan.items() if key != 'answer'}
+        docs = plan['docs']
+        if 'sub_questions' in plan:
+            question_analysis = {'is_broad': True, 'complexity_score': 10}
+        else:
+            question_analysis = plan['question_analysis']
+        result = {
+            'sources': self._prepare_sources(docs),
+            'confidence': self._calculate_enhanced_confidence(docs, question_analysis),
+            'retrieved_docs': len(docs)
+        }
+        if 'sub_questions' in plan:
+            result['sub_questions'] = plan['sub_questions']
+        else:
+            result['question_analysis'] = question_analysis
+        return result
+    
+    def _generate_answer(self, plan: Dict) -> str:
+        """依 LLM 提供者與問題類型生成完整回答；失敗時拋出 AnswerGenerationError"""
+        question, context = plan['question'], plan['context']
+        if 'sub_questions' in plan:
+            if Config.PROVIDER == 'gemini':
+                return self._generate_comprehensive_answer_gemini(question, context, plan['sub_questions'])
+            return self._generate_comprehensive_answer_openai(question, context, plan['sub_questions'])
+        if Config.PROVIDER == 'gemini':
+            return self._generate_answer_gemini(question, context, plan['question_analysis'])
+        return self._generate_answer_openai(question, context, plan['question_analysis'])
+    
+    def _llm_request(self, plan: Dict) -> Tuple[str, str, int]:
+        """依 LLM 提供者與問題類型組出 (system message, prompt, max_tokens)；Gemini 不使用 system message"""
+        question, context = plan['question'], plan['context']
+        if Config.PROVIDER == 'gemini':
+            if 'sub_questions' in plan:
+                return None, self._comprehensive_prompt_gemini(question, context, plan['sub_questions']), None
+            return None, self._answer_prompt_gemini(question, context, plan['question_analysis']), None
+        if 'sub_questions' in plan:
+            system_message, prompt = self._comprehensive_prompt_openai(question, context, plan['sub_questions'])
+            return system_message, prompt, 2500
+        system_message, prompt = self._answer_prompt_openai(question, context, plan['question_analysis'])
+        return system_message, prompt, 2000
+    
+    def _stream_answer(self, plan: Dict) -> Iterator[str]:
+        """依 LLM 提供者與問題類型串流生成回答，逐段產生文字；失敗時拋出 AnswerGenerationError"""
+        system_message, prompt, max_tokens = self._llm_request(plan)
+        if Config.PROVIDER == 'gemini':
+            return self._stream_gemini(prompt)
+        return self._stream_openai(system_message, prompt, max_tokens)
+    
+    def _stream_gemini(self, prompt: str) -> Iterator[str]:
+        try:
+            model = genai.GenerativeModel(Config.GEMINI_MODEL)
+            for chunk in model.generate_content(prompt, stream=True):
+                if chunk.parts:
+                    yield chunk.text
+        except Exception as e:
+            print(f"Error streaming answer (Gemini): {str(e)}")
+            raise AnswerGenerationError("\n\n抱歉，生成回答時發生錯誤（Gemini）。請稍後再試。") from e
+    
+    def _openai_client(self):
+        """同步的 OpenAI 客戶端（第一次使用時建立）"""
+        if self._openai is None:
+            self._openai = openai.OpenAI(api_key=Config.OPENAI_API_KEY)
+        return self._openai
+    
+    def _stream_openai(self, system_message: str, prompt: str, max_tokens: int) -> Iterator[str]:
+        if not openai:
+            raise AnswerGenerationError("本系統未安裝 openai 套件，請改用 Gemini 或安裝 openai。")
+        try:
+            response = self._openai_client().chat.completions.create(
+                model=Config.OPENAI_MODEL,
+                messages=[
+                    {"role": "system", "content": system_message},
+                    {"role": "user", "content": prompt}
+                ],
+                max_tokens=max_tokens,
+                temperature=0.3,
+                stream=True
+            )
+            for chunk in response:
+                content = chunk.choices[0].delta.content if chunk.choices else None
+                if content:
+                    yield content
+        except Exception as e:
+            print(f"Error streaming answer (OpenAI): {str(e)}")
+            raise AnswerGenerationError("\n\n抱歉，生成回答時發生錯誤（OpenAI）。請稍後再試。") from e
+    
+    async def _agenerate_answer(self, plan: Dict) -> str:
+        """以非同步 LLM 客戶端生成完整回答"""
+        pieces = [piece async for piece in self._astream_answer(plan)]
+        return ''.join(pieces).strip()
+    
+    def _astream_answer(self, plan: Dict) -> AsyncIterator[str]:
+        """_stream_answer 的非同步版本"""
+        system_message, prompt, max_tokens = self._llm_request(plan)
+        if Config.PROVIDER == 'gemini':
+            return self._astream_gemini(prompt)
+        return self._astream_openai(system_message, prompt, max_tokens)
+    
+    async def _astream_gemini(self, prompt: str) -> AsyncIterator[str]:
+        try:
+            model = genai.GenerativeModel(Config.GEMINI_MODEL)
+            response = await model.generate_content_async(prompt, stream=True)
+            async for chunk in response:
+                if chunk.parts:
+                    yield chunk.text
+        except Exception as e:
+            print(f"Error streaming answer (Gemini, async): {str(e)}")
+            raise AnswerGenerationError("\n\n抱歉，生成回答時發生錯誤（Gemini）。請稍後再試。") from e
+    
+    async def _astream_openai(self, system_message: str, prompt: str, max_tokens: int) -> AsyncIterator[str]:
+        if not openai:
+            raise AnswerGenerationError("本系統未安裝 openai 套件，請改用 Gemini 或安裝 openai。")
+        try:
+            if self._async_openai is None:
+                self._async_openai = openai.AsyncOpenAI(api_key=Config.OPENAI_API_KEY)
+            response = await self._async_openai.chat.completions.create(
+                model=Config.OPENAI_MODEL,
+                messages=[
+                    {"role": "system", "content": system_message},
+                    {"role": "user", "content": prompt}
+                ],
+                max_tokens=max_tokens,
+                temperature=0.3,
+                stream=True
+            )
+            async for chunk in response:
+                content = chunk.choices[0].delta.content if chunk.choices else None
+                if content:
+                    yield content
+        except Exception as e:
+            print(f"Error streaming answer (OpenAI, async): {str(e)}")
+            raise AnswerGenerationError("\n\n抱歉，生成回答時發生錯誤（OpenAI）。請稍後再試。") from e
+    
     def _prepare_smart_context(self, relevant_docs: List[Dict], question: str) -> str:
         """準備智能上下文（含Token預算管理）"""
         context_parts = []
+        token_counts = []
+        scores = []
         
         for i, doc in enumerate(relevant_docs):
             source_info = f"來源：{doc['metadata'].get('filename', '未知檔案')}"
             chunk_info = f"片段 {doc['metadata'].get('chunk_index', 0) + 1}"
-            confidence_info = f"相似度：{1 - doc.get('distance', 1):.2f}"
+            similarity = 1 - doc.get('distance', 1)
+            confidence_info = f"相似度：{similarity:.2f}"
             
-            content = doc['content']
-            context_parts.append(f"[{chunk_info}] {source_info} ({confidence_info})\n{content}")
+            header = f"[{chunk_info}] {source_info} ({confidence_info})\n"
+            context_parts.append(header + doc['content'])
+            # 片段內容的 token 數於寫入時已記錄，只需計算標頭
+            token_counts.append(
+                self.smart_retrieval.token_counter.count(header) + self.smart_retrieval.chunk_token_count(doc)
+            )
+            scores.append(self.smart_retrieval.relevance_score(doc))
         
         # 使用Token預算管理
-        managed_context = self.smart_retrieval.manage_token_budget(context_parts, question)
+        managed_context = self.smart_retrieval.manage_token_budget(context_parts, question, token_counts, scores)
         return managed_context
     
     def _prepare_comprehensive_context(self, docs: List[Dict], question: str) -> str:
@@ -140,7 +505,10 @@ except ImportError:
                 docs_by_file[filename] = []
             docs_by_file[filename].append(doc)
         
+        counter = self.smart_retrieval.token_counter
         context_parts = []
+        token_counts = []
+        scores = []
         for filename, file_docs in docs_by_file.items():
             # 每個檔案的內容
             file_content = []
@@ -148,13 +516,20 @@ except ImportError:
                 file_content.append(doc['content'])
             
             combined_content = "\n".join(file_content)
-            context_parts.append(f"=== 檔案：{filename} ===\n{combined_content}")
+            header = f"=== 檔案：{filename} ===\n"
+            context_parts.append(header + combined_content)
+            token_counts.append(
+                counter.count(header)
+                + sum(self.smart_retrieval.chunk_token_count(doc) for doc in file_docs)
+                + counter.count("\n") * (len(file_docs) - 1)
+            )
+            scores.append(max(self.smart_retrieval.relevance_score(doc) for doc in file_docs))
         
         # Token預算管理
-        return self.smart_retrieval.manage_token_budget(context_parts, question)
+        return self.smart_retrieval.manage_token_budget(context_parts, question, token_counts, scores)
     
-    def _generate_answer_gemini(self, question: str, context: str, question_analysis: Dict = None) -> str:
-        """使用 Gemini 生成回答（增強版）"""
+    def _answer_prompt_gemini(self, question: str, context: str, question_analysis: Dict = None) -> str:
+        """Gemini 回答的 prompt"""
         # 根據問題複雜度調整 prompt
         if question_analysis and question_analysis.get('is_broad'):
             prompt = f"""
@@ -194,6 +569,11 @@ except ImportError:
 
 請提供詳細且準確的回答：
 """
+        return prompt
+    
+    def _generate_answer_gemini(self, question: str, context: str, question_analysis: Dict = None) -> str:
+        """使用 Gemini 生成回答（增強版）"""
+        prompt = self._answer_prompt_gemini(question, context, question_analysis)
         
         try:
             model = genai.GenerativeModel(Config.GEMINI_MODEL)
@@ -201,10 +581,10 @@ except ImportError:
             return response.text.strip()
         except Exception as e:
             print(f"Error generating answer (Gemini): {str(e)}")
-            return "抱歉，生成回答時發生錯誤（Gemini）。請稍後再試。"
+            raise AnswerGenerationError("抱歉，生成回答時發生錯誤（Gemini）。請稍後再試。") from e
     
-    def _generate_comprehensive_answer_gemini(self, question: str, context: str, sub_questions: List[str]) -> str:
-        """為廣泛問題生成綜合回答（Gemini）"""
+    def _comprehensive_prompt_gemini(self, question: str, context: str, sub_questions: List[str]) -> str:
+        """Gemini 綜合回答的 prompt"""
         prompt = f"""
 你是一個專業的文檔問答助手。用戶提出了一個廣泛性問題，我已經將其分解為多個子問題並收集了相關資訊。
 
@@ -226,6 +606,11 @@ except ImportError:
 
 請提供詳細的綜合回答：
 """
+        return prompt
+    
+    def _generate_comprehensive_answer_gemini(self, question: str, context: str, sub_questions: List[str]) -> str:
+        """為廣泛問題生成綜合回答（Gemini）"""
+        prompt = self._comprehensive_prompt_gemini(question, context, sub_questions)
         
         try:
             model = genai.GenerativeModel(Config.GEMINI_MODEL)
@@ -233,13 +618,10 @@ except ImportError:
             return response.text.strip()
         except Exception as e:
             print(f"Error generating comprehensive answer (Gemini): {str(e)}")
-            return "抱歉，生成綜合回答時發生錯誤（Gemini）。請稍後再試。"
+            raise AnswerGenerationError("抱歉，生成綜合回答時發生錯誤（Gemini）。請稍後再試。") from e
 
-    def _generate_answer_openai(self, question: str, context: str, question_analysis: Dict = None) -> str:
-        """使用 OpenAI 生成回答（增強版）"""
-        if not openai:
-            return "本系統未安裝 openai 套件，請改用 Gemini 或安裝 openai。"
-        
+    def _answer_prompt_openai(self, question: str, context: str, question_analysis: Dict = None) -> Tuple[str, str]:
+        """OpenAI 回答的 system message 與 prompt"""
         # 根據問題複雜度調整 prompt
         if question_analysis and question_analysis.get('is_broad'):
             system_message = "你是一個專業的文檔問答助手，擅長處理廣泛性問題並提供全面、結構化的回答。"
@@ -271,9 +653,17 @@ except ImportError:
 
 請提供準確且有幫助的回答：
 """
+        return system_message, prompt
+    
+    def _generate_answer_openai(self, question: str, context: str, question_analysis: Dict = None) -> str:
+        """使用 OpenAI 生成回答（增強版）"""
+        if not openai:
+            raise AnswerGenerationError("本系統未安裝 openai 套件，請改用 Gemini 或安裝 openai。")
+        
+        system_message, prompt = self._answer_prompt_openai(question, context, question_analysis)
         
         try:
-            response = openai.ChatCompletion.create(
+            response = self._openai_client().chat.completions.create(
                 model=Config.OPENAI_MODEL,
                 messages=[
                     {"role": "system", "content": system_message},
@@ -285,13 +675,11 @@ except ImportError:
             return response.choices[0].message.content.strip()
         except Exception as e:
             print(f"Error generating answer (OpenAI): {str(e)}")
-            return "抱歉，生成回答時發生錯誤（OpenAI）。請稍後再試。"
+            raise AnswerGenerationError("抱歉，生成回答時發生錯誤（OpenAI）。請稍後再試。") from e
     
-    def _generate_comprehensive_answer_openai(self, question: str, context: str, sub_questions: List[str]) -> str:
-        """為廣泛問題生成綜合回答（OpenAI）"""
-        if not openai:
-            return "本系統未安裝 openai 套件，請改用 Gemini 或安裝 openai。"
-        
+    def _comprehensive_prompt_openai(self, question: str, context: str, sub_questions: List[str]) -> Tuple[str, str]:
+        """OpenAI 綜合回答的 system message 與 prompt"""
+        system_message = "你是一個專業的文檔問答助手，擅長處理廣泛性問題並提供全面、結構化的回答。"
         prompt = f"""
 原始問題：{question}
 
@@ -303,15 +691,20 @@ except ImportError:
 
 請提供一個全面且結構化的回答，包括概述、詳細說明和總結。使用 Markdown 格式美化回答。
 """
+        return system_message, prompt
+    
+    def _generate_comprehensive_answer_openai(self, question: str, context: str, sub_questions: List[str]) -> str:
+        """為廣泛問題生成綜合回答（OpenAI）"""
+        if not openai:
+            raise AnswerGenerationError("本系統未安裝 openai 套件，請改用 Gemini 或安裝 openai。")
+        
+        system_message, prompt = self._comprehensive_prompt_openai(question, context, sub_questions)
         
         try:
-            response = openai.ChatCompletion.create(
+            response = self._openai_client().chat.completions.create(
                 model=Config.OPENAI_MODEL,
                 messages=[
-                    {
-                        "role": "system", 
-                        "content": "你是一個專業的文檔問答助手，擅長處理廣泛性問題並提供全面、結構化的回答。"
-                    },
+                    {"role": "system", "content": system_message},
                     {"role": "user", "content": prompt}
                 ],
                 max_tokens=2500,
@@ -320,7 +713,7 @@ except ImportError:
             return response.choices[0].message.content.strip()
         except Exception as e:
             print(f"Error generating comprehensive answer (OpenAI): {str(e)}")
-            return "抱歉，生成綜合回答時發生錯誤（OpenAI）。請稍後再試。"
+            raise AnswerGenerationError("抱歉，生成綜合回答時發生錯誤（OpenAI）。請稍後再試。") from e
     
     def _calculate_enhanced_confidence(self, relevant_docs: List[Dict], question_analysis: Dict) -> float:
         """計算增強的信心分數"""
@@ -397,11 +790,13 @@ except ImportError:
         """獲取檢索統計資訊"""
         try:
             total_docs = len(self.get_available_documents())
-            total_chunks = len(self.vector_store.collection.get()['ids']) if hasattr(self.vector_store, 'collection') else 0
+            total_chunks = self.vector_store.get_chunk_count()
             
             return {
                 'total_documents': total_docs,
                 'total_chunks': total_chunks,
+                'query_embedding_cache': self.vector_store.query_cache.stats(),
+                'answer_cache': self.answer_cache.stats() if self.answer_cache is not None else None,
                 'retrieval_config': {
                     'top_k': Config.TOP_K,
                     'max_top_k': Config.MAX_TOP_K,
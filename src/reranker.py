@@ -0,0 +1,52 @@
+"""
+重新排序 - 以本機 cross-encoder 對 (問題, 片段) 重新評分
+
+cross-encoder 同時看問題與片段，比雙塔嵌入的距離更能判斷相關度，但每個候選都要跑一次模型；
+因此只對向量/混合檢索取回的候選評分，且所有問題的候選在同一次批次推論中完成。
+RERANK_BACKEND 為 onnx 時可搭配 RERANK_ONNX_FILE 使用量化模型，在 CPU 上進一步降低延遲。
+"""
+
+from typing import Dict, List
+from src.config import Config
+from src.services import get_reranker_model
+
+
+class Reranker:
+    def __init__(self, model=None, batch_size: int = None):
+        self._model = model
+        self.batch_size = batch_size or Config.RERANK_BATCH_SIZE
+
+    @property
+    def model(self):
+        if self._model is None:
+            self._model = get_reranker_model()
+        return self._model
+
+    def rerank(self, question: str, candidates: List[Dict], top_k: int) -> List[Dict]:
+        """依 cross-encoder 分數重新排序，保留前 top_k 個"""
+        return self.rerank_many([question], [candidates], [top_k])[0]
+
+    def rerank_many(self, questions: List[str], candidate_lists: List[List[Dict]],
+                    top_ks: List[int]) -> List[List[Dict]]:
+        """對多個問題的候選以單次批次推論評分，結果附上 rerank_score 並依分數由高到低排序"""
+        pairs = [
+            (question, doc['content'])
+            for question, candidates in zip(questions, candidate_lists)
+            for doc in candidates
+        ]
+        if not pairs:
+            return [[] for _ in candidate_lists]
+
+        scores = self.model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+
+        reranked_lists = []
+        offset = 0
+        for candidates, top_k in zip(candidate_lists, top_ks):
+            scored = [
+                dict(doc, rerank_score=float(score))
+                for doc, score in zip(candidates, scores[offset:offset + len(candidates)])
+            ]
+            offset += len(candidates)
+            scored.sort(key=lambda doc: doc['rerank_score'], reverse=True)
+            reranked_lists.append(scored[:top_k])
+        return reranked_lists
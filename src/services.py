@@ -0,0 +1,132 @@
+"""
+服務註冊表 - 每個程序只建立一份嵌入模型與向量資料庫，供各服務共用
+
+sentence_transformers（含 torch）與 chromadb 的 import 與模型載入都延遲到第一次使用，
+可選擇以 warm_up() 在背景執行緒預先載入。
+"""
+
+import threading
+import time
+from src.config import Config
+
+_lock = threading.RLock()
+_instances = {}
+_warmup = {'thread': None, 'error': None, 'seconds': None}
+
+
+def _get_or_create(name, factory):
+    """以雙重檢查鎖建立單例，避免多執行緒同時載入模型"""
+    instance = _instances.get(name)
+    if instance is None:
+        with _lock:
+            instance = _instances.get(name)
+            if instance is None:
+                instance = factory()
+                _instances[name] = instance
+    return instance
+
+
+def get_embedding_model():
+    """取得共用的 SentenceTransformer 嵌入模型"""
+    def factory():
+        from sentence_transformers import SentenceTransformer
+        print(f"Loading embedding model {Config.LOCAL_EMBEDDING_MODEL}...")
+        return SentenceTransformer(Config.LOCAL_EMBEDDING_MODEL)
+    return _get_or_create('embedding_model', factory)
+
+
+def get_reranker_model():
+    """取得共用的 cross-encoder 重新排序模型（可選擇 ONNX/量化後端）"""
+    def factory():
+        from sentence_transformers import CrossEncoder
+        model_kwargs = {'file_name': Config.RERANK_ONNX_FILE} if Config.RERANK_ONNX_FILE else None
+        print(f"Loading reranker model {Config.RERANK_MODEL} ({Config.RERANK_BACKEND})...")
+        return CrossEncoder(
+            Config.RERANK_MODEL,
+            device='cpu',
+            backend=Config.RERANK_BACKEND,
+            model_kwargs=model_kwargs,
+            max_length=Config.RERANK_MAX_LENGTH
+        )
+    return _get_or_create('reranker_model', factory)
+
+
+def create_chroma_client(path: str):
+    """建立指定目錄的 ChromaDB PersistentClient（不共用，由呼叫端負責 close）"""
+    import chromadb
+    from chromadb.config import Settings
+    return chromadb.PersistentClient(
+        path=path,
+        settings=Settings(anonymized_telemetry=False)
+    )
+
+
+def get_chroma_client():
+    """取得共用的 ChromaDB PersistentClient"""
+    return _get_or_create('chroma_client', lambda: create_chroma_client(Config.VECTOR_STORE_DIR))
+
+
+def get_token_counter():
+    """取得共用的 token 計數器（依 LLM 提供者選擇 tokenizer）"""
+    def factory():
+        from src.token_counter import create_token_counter
+        return create_token_counter()
+    return _get_or_create('token_counter', factory)
+
+
+def get_vector_store():
+    """取得共用的 VectorStore（建立時不載入模型）"""
+    def factory():
+        from src.vector_store import VectorStore
+        return VectorStore()
+    return _get_or_create('vector_store', factory)
+
+
+def warm_up():
+    """在背景執行緒預先載入嵌入模型與向量資料庫，重複呼叫不會重複啟動"""
+    with _lock:
+        if _warmup['thread'] is not None:
+            return _warmup['thread']
+
+        def run():
+            start = time.perf_counter()
+            try:
+                store = get_vector_store()
+                store.embedding_model
+                store.collection
+                if Config.RERANK_ENABLED:
+                    get_reranker_model()
+                _warmup['seconds'] = round(time.perf_counter() - start, 2)
+                print(f"Warm-up completed in {_warmup['seconds']}s")
+            except Exception as e:
+                _warmup['error'] = str(e)
+                print(f"Error during warm-up: {str(e)}")
+
+        thread = threading.Thread(target=run, name="model-warmup", daemon=True)
+        _warmup['thread'] = thread
+        thread.start()
+        return thread
+
+
+def readiness() -> dict:
+    """回傳模型載入狀態，供 readiness 檢查使用"""
+    store = _instances.get('vector_store')
+    thread = _warmup['thread']
+    return {
+        'ready': bool(store is not None and store.is_loaded()),
+        'warming_up': bool(thread is not None and thread.is_alive()),
+        'warmup_seconds': _warmup['seconds'],
+        'error': _warmup['error']
+    }
+
+
+def register(name, instance):
+    """手動註冊（或替換）共用實例，主要用於測試"""
+    with _lock:
+        _instances[name] = instance
+
+
+def reset():
+    """清除所有共用實例"""
+    with _lock:
+        _instances.clear()
@@ -6,11 +6,25 @@ import re
 from typing import List, Dict, Tuple
 from src.config import Config
 from src.vector_store import VectorStore
+from src.services import get_vector_store, get_token_counter
+from src.token_counter import TokenCounter
+from src.reranker import Reranker
 
 
 class SmartRetrievalService:
-    def __init__(self):
-        self.vector_store = VectorStore()
+    def __init__(self, vector_store: VectorStore = None, token_counter: TokenCounter = None,
+                 reranker: Reranker = None):
+        # 預設使用程序內共用的向量資料庫
+        self.vector_store = vector_store or get_vector_store()
+        self._token_counter = token_counter
+        # 傳入 reranker 時一律重新排序；否則依 RERANK_ENABLED 決定
+        self.reranker = reranker or (Reranker() if Config.RERANK_ENABLED else None)
+    
+    @property
+    def token_counter(self) -> TokenCounter:
+        if self._token_counter is None:
+            self._token_counter = get_token_counter()
+        return self._token_counter
     
     def analyze_question_complexity(self, question: str) -> Dict:
         """分析問題複雜度和類型"""
@@ -71,67 +85,132 @@ class SmartRetrievalService:
         
         return sub_questions if sub_questions else [question]
     
-    def adaptive_retrieval(self, question: str) -> List[Dict]:
+    def adaptive_retrieval(self, question: str, filenames: List[str] = None) -> List[Dict]:
         """自適應檢索策略"""
-        analysis = self.analyze_question_complexity(question)
+        return self.adaptive_retrieval_many([question], filenames)[0]
+    
+    def adaptive_retrieval_many(self, questions: List[str], filenames: List[str] = None) -> List[List[Dict]]:
+        """對多個問題同時執行自適應檢索：批次嵌入、單次多查詢檢索、單次鄰居擴展，回傳每個問題的結果
+
+        filenames 為檢索範圍（只檢索這些文檔，None 為全部文檔）。
+        """
+        if not questions:
+            return []
+        analyses = [self.analyze_question_complexity(question) for question in questions]
+        params = [self._retrieval_params(analysis) for analysis in analyses]
+        for analysis, (top_k, threshold) in zip(analyses, params):
+            print(f"Adaptive retrieval: top_k={top_k}, threshold={threshold}, complexity={analysis['complexity_score']}")
         
-        # 根據問題複雜度調整檢索參數
-        if analysis['is_broad'] or analysis['complexity_score'] > 7:
-            # 複雜/廣泛問題：增加檢索數量，降低相似度閾值
-            top_k = min(Config.MAX_TOP_K, Config.TOP_K * 3)
-            threshold = Config.SIMILARITY_THRESHOLD * 0.8
-        elif analysis['complexity_score'] < 3:
-            # 簡單問題：減少檢索數量，提高相似度閾值
-            top_k = max(Config.MIN_TOP_K, Config.TOP_K // 2)
-            threshold = Config.SIMILARITY_THRESHOLD * 1.1
+        if self.reranker is not None:
+            filtered_lists = self._rerank_many(questions, params, filenames)
         else:
-            # 一般問題：使用預設設定
-            top_k = Config.TOP_K
-            threshold = Config.SIMILARITY_THRESHOLD
+            filtered_lists = self._filter_by_similarity_many(questions, analyses, params, filenames)
         
-        print(f"Adaptive retrieval: top_k={top_k}, threshold={threshold}, complexity={analysis['complexity_score']}")
-        
-        # 執行初始檢索
-        initial_results = self.vector_store.search(question, top_k)
+        # Context 擴展
+        if Config.CONTEXT_EXPANSION:
+            filtered_lists = self._expand_context_many(filtered_lists)
         
-        # 過濾低相似度結果
-        filtered_results = [
-            doc for doc in initial_results 
-            if (1 - doc.get('distance', 1)) >= threshold
+        return filtered_lists
+    
+    def _retrieval_params(self, analysis: Dict):
+        """根據問題複雜度決定 (top_k, 相似度閾值)"""
+        if analysis['is_broad'] or analysis['complexity_score'] > 7:
+            # 複雜/廣泛問題：增加檢索數量，降低相似度閾值
+            return min(Config.MAX_TOP_K, Config.TOP_K * 3), Config.SIMILARITY_THRESHOLD * 0.8
+        if analysis['complexity_score'] < 3:
+            # 簡單問題：減少檢索數量，提高相似度閾值
+            return max(Config.MIN_TOP_K, Config.TOP_K // 2), Config.SIMILARITY_THRESHOLD * 1.1
+        # 一般問題：使用預設設定
+        return Config.TOP_K, Config.SIMILARITY_THRESHOLD
+    
+    def _filter_by_similarity_many(self, questions: List[str], analyses: List[Dict],
+                                   params: List[Tuple[int, float]], filenames: List[str] = None) -> List[List[Dict]]:
+        """依向量相似度閾值過濾檢索結果"""
+        # 執行初始檢索（以最大的 top_k 一次查詢，再依各問題的 top_k 截斷）
+        initial_lists = self._search_many(questions, max(top_k for top_k, _ in params), filenames)
+
+        # 過濾低相似度結果（BM25 排名前幾名的強關鍵字命中保留，避免精確詞彙查詢被向量相似度濾掉）
+        filtered_lists = [
+            [
+                doc for doc in initial_results[:top_k]
+                if (1 - doc.get('distance', 1)) >= threshold or self._is_strong_keyword_hit(doc)
+            ]
+            for initial_results, (top_k, threshold) in zip(initial_lists, params)
         ]
-        
+
         # 如果結果太少且是複雜問題，放寬條件重新檢索
-        if len(filtered_results) < Config.MIN_TOP_K and analysis['is_broad']:
-            print("Results too few for broad question, expanding retrieval...")
-            expanded_results = self.vector_store.search(question, Config.MAX_TOP_K)
-            filtered_results = expanded_results[:Config.TOP_K * 2]
+        retry = [
+            i for i, (analysis, filtered_results) in enumerate(zip(analyses, filtered_lists))
+            if len(filtered_results) < Config.MIN_TOP_K and analysis['is_broad']
+        ]
+        if retry:
+            print(f"Results too few for {len(retry)} broad question(s), expanding retrieval...")
+            expanded_lists = self._search_many([questions[i] for i in retry], Config.MAX_TOP_K, filenames)
+            for i, expanded_results in zip(retry, expanded_lists):
+                filtered_lists[i] = expanded_results[:Config.TOP_K * 2]
+        return filtered_lists
+
+    @staticmethod
+    def _is_strong_keyword_hit(doc: Dict) -> bool:
+        """片段是否為 BM25 排名前 BM25_KEEP_TOP_RANK 名（只命中少數常見字的片段排名靠後，仍須通過相似度閾值）"""
+        rank = doc.get('bm25_rank')
+        return rank is not None and rank <= Config.BM25_KEEP_TOP_RANK
+
+    def _rerank_many(self, questions: List[str], params: List[Tuple[int, float]],
+                     filenames: List[str] = None) -> List[List[Dict]]:
+        """多取候選後以 cross-encoder 重新排序，取代向量相似度閾值；所有問題的候選一次批次評分"""
+        candidate_count = max(Config.RERANK_CANDIDATES, max(top_k for top_k, _ in params))
+        candidate_lists = self._search_many(questions, candidate_count, filenames)
+        return self.reranker.rerank_many(questions, candidate_lists, [top_k for top_k, _ in params])
+
+    def _search_many(self, questions: List[str], top_k: int, filenames: List[str] = None) -> List[List[Dict]]:
+        """依設定使用混合檢索或純向量檢索"""
+        if Config.HYBRID_RETRIEVAL:
+            return self.vector_store.hybrid_search_many(questions, top_k, filenames)
+        return self.vector_store.search_many(questions, top_k, filenames)
+    
+    def _expand_context_many(self, result_lists: List[List[Dict]]) -> List[List[Dict]]:
+        """對多組檢索結果擴展上下文，所有結果的鄰居以單次批次查詢取得"""
+        # 收集所有命中片段的前後鄰居 ID
+        neighbor_pairs_lists = []
+        for initial_results in result_lists:
+            neighbor_pairs = []
+            for doc in initial_results:
+                filename = doc['metadata'].get('filename')
+                chunk_index = doc['metadata'].get('chunk_index', 0)
+                
+                if filename and chunk_index is not None:
+                    for offset in [-1, 1]:
+                        if chunk_index + offset >= 0:
+                            neighbor_pairs.append((doc, f"{filename}_chunk_{chunk_index + offset}"))
+            neighbor_pairs_lists.append(neighbor_pairs)
         
-        # Context 擴展
-        if Config.CONTEXT_EXPANSION:
-            filtered_results = self._expand_context(filtered_results)
+        neighbors = {
+            chunk['id']: chunk
+            for chunk in self.vector_store.get_chunks([
+                neighbor_id for neighbor_pairs in neighbor_pairs_lists for _, neighbor_id in neighbor_pairs
+            ])
+        }
         
-        return filtered_results
-    
-    def _expand_context(self, initial_results: List[Dict]) -> List[Dict]:
-        """擴展上下文 - 尋找相鄰片段"""
-        expanded_results = list(initial_results)
-        
-        for doc in initial_results:
-            filename = doc['metadata'].get('filename')
-            chunk_index = doc['metadata'].get('chunk_index', 0)
-            
-            if filename and chunk_index is not None:
-                # 嘗試獲取前後相鄰的片段
-                for offset in [-1, 1]:
-                    neighbor_id = f"{filename}_chunk_{chunk_index + offset}"
-                    neighbor = self._get_chunk_by_id(neighbor_id)
-                    if neighbor and neighbor not in expanded_results:
-                        # 檢查是否內容相關（簡單的重疊檢查）
-                        if self._is_content_related(doc['content'], neighbor['content']):
-                            expanded_results.append(neighbor)
-        
-        # 按原始相似度排序
-        return expanded_results
+        expanded_lists = []
+        for initial_results, neighbor_pairs in zip(result_lists, neighbor_pairs_lists):
+            expanded_results = list(initial_results)
+            seen_ids = {doc.get('id') for doc in initial_results}
+            for doc, neighbor_id in neighbor_pairs:
+                neighbor = neighbors.get(neighbor_id)
+                if neighbor and neighbor_id not in seen_ids:
+                    # 檢查是否內容相關（簡單的重疊檢查）
+                    if self._is_content_related(doc['content'], neighbor['content']):
+                        # 鄰居沿用帶出它的片段的距離與重新排序分數，避免被視為最相關的片段
+                        expanded = dict(neighbor, distance=doc.get('distance', 0))
+                        if 'rerank_score' in doc:
+                            expanded['rerank_score'] = doc['rerank_score']
+                        expanded_results.append(expanded)
+                        seen_ids.add(neighbor_id)
+            expanded_lists.append(expanded_results)
+
+        # 命中片段維持原本的排序（相似度或重新排序分數），鄰居附加在後
+        return expanded_lists
     
     def _get_chunk_by_id(self, chunk_id: str) -> Dict:
         """根據 ID 獲取特定片段"""
@@ -167,31 +246,68 @@ class SmartRetrievalService:
         # 返回前5個關鍵詞
         return keywords[:5]
     
-    def manage_token_budget(self, context_parts: List[str], question: str) -> str:
-        """管理 Token 預算，確保不超過限制"""
-        # 簡化的 token 計算（1 token ≈ 4 字符）
-        question_tokens = len(question) // 4
+    def chunk_token_count(self, doc: Dict) -> int:
+        """片段內容的 token 數：優先使用寫入時記錄在 metadata 的值（需為同一個計數器）"""
+        metadata = doc.get('metadata') or {}
+        if metadata.get('token_counter') == self.token_counter.name and metadata.get('token_count') is not None:
+            return metadata['token_count']
+        return self.token_counter.count(doc['content'])
+    
+    def relevance_score(self, doc: Dict) -> float:
+        """片段的相關度：有重新排序分數時使用 cross-encoder 分數，否則使用向量相似度"""
+        if doc.get('rerank_score') is not None:
+            return doc['rerank_score']
+        return 1 - doc.get('distance', 1)
+    
+    def manage_token_budget(self, context_parts: List[str], question: str,
+                            token_counts: List[int] = None, scores: List[float] = None) -> str:
+        """管理 Token 預算，確保不超過限制
+
+        token_counts 為各部分已知的 token 數（未提供時即時計算），scores 為各部分的相關度；
+        CONTEXT_PACKING 為 relevance 且提供 scores 時，依每 token 相關度挑選片段，否則依傳入順序。
+        """
+        counter = self.token_counter
+        question_tokens = counter.count(question)
         available_tokens = Config.MAX_CONTEXT_TOKENS - question_tokens - 500  # 保留回答空間
         
         if available_tokens <= 0:
             return "問題過長，請簡化問題。"
         
-        # 按優先級排序並截斷
-        current_tokens = 0
-        selected_parts = []
+        if token_counts is None:
+            token_counts = counter.count_many(context_parts)
+        separator_tokens = counter.count("\n\n")
+        truncation_marker = "...[內容截斷]"
+        
+        by_relevance = Config.CONTEXT_PACKING == 'relevance' and scores is not None
+        if by_relevance:
+            order = sorted(
+                range(len(context_parts)),
+                key=lambda i: max(scores[i], 0.0) / max(token_counts[i], 1),
+                reverse=True
+            )
+        else:
+            order = range(len(context_parts))
         
-        for part in context_parts:
-            part_tokens = len(part) // 4
-            if current_tokens + part_tokens <= available_tokens:
-                selected_parts.append(part)
-                current_tokens += part_tokens
+        current_tokens = 0
+        selected = {}
+        for i in order:
+            cost = token_counts[i] + (separator_tokens if selected else 0)
+            if current_tokens + cost <= available_tokens:
+                selected[i] = context_parts[i]
+                current_tokens += cost
+            elif by_relevance and selected:
+                # 放不下就略過，繼續嘗試其他較小的片段
+                continue
             else:
                 # 如果還有空間，截斷這一部分
-                remaining_chars = (available_tokens - current_tokens) * 4
-                if remaining_chars > 100:  # 至少保留100字符
-                    truncated_part = part[:remaining_chars] + "...[內容截斷]"
-                    selected_parts.append(truncated_part)
+                remaining_tokens = (available_tokens - current_tokens - (separator_tokens if selected else 0)
+                                    - counter.count(truncation_marker))
+                if remaining_tokens > 25:  # 至少保留約 100 字符
+                    selected[i] = counter.truncate(context_parts[i], remaining_tokens) + truncation_marker
+                    current_tokens += counter.count(selected[i]) + (separator_tokens if len(selected) > 1 else 0)
                 break
         
-        print(f"Token budget: used {current_tokens}/{available_tokens} tokens")
-        return "\n\n".join(selected_parts)
+        print(f"Token budget ({counter.name}, {'relevance' if by_relevance else 'greedy'}): "
+              f"used {current_tokens}/{available_tokens} tokens, {len(selected)}/{len(context_parts)} parts")
+        # 依原本的順序組合，維持上下文的閱讀順序
+        return "\n\n".join(selected[i] for i in sorted(selected))
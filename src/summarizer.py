@@ -1,6 +1,10 @@
 
 import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
 from src.config import Config
+from src.text_chunker import TextChunker
 
 # Gemini
 import google.generativeai as genai
@@ -10,15 +14,28 @@ try:
 except ImportError:
     openai = None
 
+RATE_LIMIT_MARKERS = ('429', 'rate limit', 'ratelimit', 'resource exhausted', 'resourceexhausted', 'quota', 'too many requests')
+
+
+def _is_rate_limit_error(error: Exception) -> bool:
+    """判斷是否為速率限制錯誤（Gemini ResourceExhausted / OpenAI RateLimitError / HTTP 429）"""
+    text = f"{type(error).__name__} {error}".lower()
+    return any(marker in text for marker in RATE_LIMIT_MARKERS)
+
+
 class Summarizer:
-    def __init__(self):
+    def __init__(self, llm=None):
+        # llm：可選的 callable(prompt, system_message, max_tokens) -> str，用於測試時替換真實的 LLM
+        self.llm = llm
+        # OpenAI（openai>=1.0）客戶端，第一次呼叫時建立
+        self._openai = None
         if Config.PROVIDER == 'gemini':
             genai.configure(api_key=Config.GEMINI_API_KEY)
         if openai and Config.PROVIDER == 'openai':
             openai.api_key = Config.OPENAI_API_KEY
 
-    def create_summary(self, text, filename):
-        """使用 Gemini 或 OpenAI 創建文檔摘要"""
+    def create_summary(self, text, filename, output_dir=None):
+        """使用 Gemini 或 OpenAI 創建文檔摘要（預設存到 Config.SUMMARY_DIR）"""
         try:
             print(f"Creating summary for {filename}...")
             # 如果文本太長，先進行分段摘要
@@ -28,7 +45,7 @@ class Summarizer:
                 summary = self._create_short_text_summary(text)
             # 儲存摘要
             summary_filename = os.path.splitext(filename)[0] + '.txt'
-            summary_path = os.path.join(Config.SUMMARY_DIR, summary_filename)
+            summary_path = os.path.join(output_dir or Config.SUMMARY_DIR, summary_filename)
             with open(summary_path, 'w', encoding='utf-8') as f:
                 f.write(summary)
             print(f"Summary created and saved to {summary_path}")
@@ -36,7 +53,40 @@ class Summarizer:
         except Exception as e:
             print(f"Error creating summary for {filename}: {str(e)}")
             return None, None
-    
+
+    def _call_llm(self, prompt, system_message, max_tokens):
+        """呼叫 LLM 一次（Gemini 或 OpenAI），錯誤直接拋出"""
+        if self.llm is not None:
+            return self.llm(prompt, system_message, max_tokens).strip()
+        if Config.PROVIDER == 'gemini':
+            model = genai.GenerativeModel(Config.GEMINI_MODEL)
+            response = model.generate_content(prompt)
+            return response.text.strip()
+        if self._openai is None:
+            self._openai = openai.OpenAI(api_key=Config.OPENAI_API_KEY)
+        response = self._openai.chat.completions.create(
+            model=Config.OPENAI_MODEL,
+            messages=[
+                {"role": "system", "content": system_message},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=max_tokens,
+            temperature=0.3
+        )
+        return response.choices[0].message.content.strip()
+
+    def _generate(self, prompt, system_message, max_tokens):
+        """呼叫 LLM，遇到速率限制時以指數退避（含隨機抖動）重試"""
+        for attempt in range(Config.SUMMARY_MAX_RETRIES + 1):
+            try:
+                return self._call_llm(prompt, system_message, max_tokens)
+            except Exception as e:
+                if attempt >= Config.SUMMARY_MAX_RETRIES or not _is_rate_limit_error(e):
+                    raise
+                delay = Config.SUMMARY_RETRY_BASE_DELAY * (2 ** attempt) * (1 + random.random())
+                print(f"Rate limited by LLM provider, retrying in {delay:.1f}s ({attempt + 1}/{Config.SUMMARY_MAX_RETRIES})...")
+                time.sleep(delay)
+
     def _create_short_text_summary(self, text):
         """為短文本創建摘要（Gemini 或 OpenAI）"""
         prompt = f"""
@@ -50,44 +100,72 @@ class Summarizer:
 
 請用繁體中文回答，摘要應該詳細但簡潔。
 """
-        if Config.PROVIDER == 'gemini':
-            try:
-                model = genai.GenerativeModel(Config.GEMINI_MODEL)
-                response = model.generate_content(prompt)
-                return response.text.strip()
-            except Exception as e:
-                print(f"Error calling Gemini API: {str(e)}")
-                return "摘要生成失敗（Gemini）"
-        else:
-            if not openai:
-                return "本系統未安裝 openai 套件，請改用 Gemini 或安裝 openai。"
-            try:
-                response = openai.ChatCompletion.create(
-                    model=Config.OPENAI_MODEL,
-                    messages=[
-                        {"role": "system", "content": "你是一個專業的文檔摘要專家，擅長提取重要資訊並創建結構化摘要。"},
-                        {"role": "user", "content": prompt}
-                    ],
-                    max_tokens=1000,
-                    temperature=0.3
-                )
-                return response.choices[0].message.content.strip()
-            except Exception as e:
-                print(f"Error calling OpenAI API: {str(e)}")
-                return "摘要生成失敗（OpenAI）"
-    
+        if self.llm is None and Config.PROVIDER != 'gemini' and not openai:
+            return "本系統未安裝 openai 套件，請改用 Gemini 或安裝 openai。"
+        provider = 'Gemini' if Config.PROVIDER == 'gemini' else 'OpenAI'
+        try:
+            return self._generate(
+                prompt, "你是一個專業的文檔摘要專家，擅長提取重要資訊並創建結構化摘要。", 1000
+            )
+        except Exception as e:
+            print(f"Error calling {provider} API: {str(e)}")
+            return f"摘要生成失敗（{provider}）"
+
     def _create_long_text_summary(self, text):
-        """為長文本創建摘要（分段處理）"""
-        chunks = self._split_text_into_chunks(text, 6000)
-        chunk_summaries = []
-        for i, chunk in enumerate(chunks):
-            print(f"Summarizing chunk {i+1}/{len(chunks)}...")
-            chunk_summary = self._create_short_text_summary(chunk)
-            chunk_summaries.append(chunk_summary)
-        combined_summary = "\n\n".join(chunk_summaries)
-        final_summary = self._create_final_summary(combined_summary)
-        return final_summary
-    
+        """為長文本創建摘要（並行 map 分段摘要，再階層式 reduce）"""
+        chunks = self._split_text_into_chunks(text, Config.SUMMARY_CHUNK_SIZE)
+        print(f"Summarizing {len(chunks)} chunks with concurrency {Config.SUMMARY_CONCURRENCY}...")
+        chunk_summaries = self._map_concurrently(self._create_short_text_summary, chunks)
+        return self._reduce_summaries(chunk_summaries)
+
+    def _map_concurrently(self, func, items):
+        """以有上限的執行緒池並行處理，結果維持輸入順序"""
+        workers = max(1, min(Config.SUMMARY_CONCURRENCY, len(items)))
+        if workers == 1:
+            return [func(item) for item in items]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(func, items))
+
+    def _reduce_summaries(self, summaries):
+        """階層式整合摘要：分組整合直到總長度可放進單一最終 prompt"""
+        limit = Config.SUMMARY_REDUCE_MAX_CHARS
+        level = 0
+        max_levels = 5  # 避免 LLM 輸出未縮短時無限整合
+        while len(summaries) > 1 and len("\n\n".join(summaries)) > limit and level < max_levels:
+            groups = self._group_by_length(summaries, limit)
+            if len(groups) == len(summaries):
+                # 單一摘要已超過上限，無法再分組合併，截斷後直接整合
+                share = max(1, limit // len(summaries))
+                summaries = [summary[:share] for summary in summaries]
+                break
+            level += 1
+            print(f"Reducing {len(summaries)} summaries into {len(groups)} groups (level {level})...")
+            summaries = self._map_concurrently(
+                lambda group: self._create_final_summary("\n\n".join(group)), groups
+            )
+        combined_summary = "\n\n".join(summaries)
+        if len(combined_summary) > limit:
+            combined_summary = combined_summary[:limit]
+        return self._create_final_summary(combined_summary)
+
+    def _group_by_length(self, summaries, limit):
+        """依序將摘要分組，每組合併後不超過長度上限"""
+        groups = []
+        current = []
+        current_length = 0
+        for summary in summaries:
+            extra = len(summary) + (2 if current else 0)
+            if current and current_length + extra > limit:
+                groups.append(current)
+                current = []
+                current_length = 0
+                extra = len(summary)
+            current.append(summary)
+            current_length += extra
+        if current:
+            groups.append(current)
+        return groups
+
     def _create_final_summary(self, combined_summary):
         """創建最終摘要（Gemini 或 OpenAI）"""
         prompt = f"""
@@ -97,35 +175,17 @@ class Summarizer:
 
 請用繁體中文創建一個結構化的最終摘要，包含主要主題、重點和結論。
 """
-        if Config.PROVIDER == 'gemini':
-            try:
-                model = genai.GenerativeModel(Config.GEMINI_MODEL)
-                response = model.generate_content(prompt)
-                return response.text.strip()
-            except Exception as e:
-                print(f"Error creating final summary (Gemini): {str(e)}")
-                return combined_summary
-        else:
-            if not openai:
-                return combined_summary
-            try:
-                response = openai.ChatCompletion.create(
-                    model=Config.OPENAI_MODEL,
-                    messages=[
-                        {"role": "system", "content": "你是一個專業的文檔摘要專家，擅長整合多個摘要成為連貫的最終摘要。"},
-                        {"role": "user", "content": prompt}
-                    ],
-                    max_tokens=1500,
-                    temperature=0.3
-                )
-                return response.choices[0].message.content.strip()
-            except Exception as e:
-                print(f"Error creating final summary (OpenAI): {str(e)}")
-                return combined_summary
-    
+        if self.llm is None and Config.PROVIDER != 'gemini' and not openai:
+            return combined_summary
+        provider = 'Gemini' if Config.PROVIDER == 'gemini' else 'OpenAI'
+        try:
+            return self._generate(
+                prompt, "你是一個專業的文檔摘要專家，擅長整合多個摘要成為連貫的最終摘要。", 1500
+            )
+        except Exception as e:
+            print(f"Error creating final summary ({provider}): {str(e)}")
+            return combined_summary
+
     def _split_text_into_chunks(self, text, chunk_size):
-        """將文本分割成指定大小的塊"""
-        chunks = []
-        for i in range(0, len(text), chunk_size):
-            chunks.append(text[i:i + chunk_size])
-        return chunks
\ No newline at end of file
+        """將文本分割成指定大小的塊（在段落或句子邊界切開）"""
+        return TextChunker(chunk_size).split(text)
@@ -0,0 +1,234 @@
+"""
+多租戶 - 每個 tenant 擁有獨立的資料目錄、向量集合、BM25 索引、文檔目錄與內容快取
+
+預設 tenant 沿用 DATA_DIR 下的既有路徑與 src.services 的共用向量資料庫；其他 tenant 的資料放在 TENANTS_DIR/<tenant_id>/，
+第一次使用時才開啟，開啟數量超過 MAX_OPEN_TENANTS 時關閉最久未使用的 tenant（仍有請求使用中的 tenant 等請求結束後才關閉）。
+嵌入模型、cross-encoder 與 token 計數器由所有 tenant 共用。
+"""
+
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, List
+
+from src.bm25_index import BM25Index
+from src.config import Config
+from src.content_cache import ContentCache
+from src.document_catalog import DocumentCatalog
+from src.file_handler import FileHandler
+from src.local_vector_index import LocalVectorCollection
+from src.qa_service import QAService
+from src.services import get_vector_store
+from src.vector_store import VectorStore
+
+# tenant ID 直接作為目錄名稱，只允許英數字、底線與連字號
+TENANT_ID_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_-]{0,63}$')
+
+
+def validate_tenant_id(tenant_id: str) -> str:
+    """檢查 tenant ID 格式，不合法時拋出 ValueError"""
+    if not isinstance(tenant_id, str) or not TENANT_ID_PATTERN.match(tenant_id):
+        raise ValueError(f"invalid tenant id: {tenant_id!r}")
+    return tenant_id
+
+
+def tenant_from_headers(headers) -> str:
+    """由請求標頭決定 tenant：未開啟 TRUST_TENANT_HEADER 或未帶標頭時為預設 tenant，格式不合法時拋出 ValueError"""
+    if not Config.TRUST_TENANT_HEADER:
+        return Config.DEFAULT_TENANT
+    tenant_id = (headers.get(Config.TENANT_HEADER) or '').strip()
+    return validate_tenant_id(tenant_id) if tenant_id else Config.DEFAULT_TENANT
+
+
+class TenantPaths:
+    """tenant 的資料路徑：預設 tenant 沿用 Config 的既有路徑，其他 tenant 位於 TENANTS_DIR/<tenant_id>/"""
+
+    def __init__(self, tenant_id: str):
+        self.is_default = tenant_id == Config.DEFAULT_TENANT
+        if self.is_default:
+            self.root = Config.DATA_DIR
+            self.pdf_dir = Config.PDF_DIR
+            self.ocr_dir = Config.OCR_DIR
+            self.summary_dir = Config.SUMMARY_DIR
+            self.vector_store_dir = Config.VECTOR_STORE_DIR
+            self.local_vector_dir = Config.LOCAL_VECTOR_DIR
+            self.bm25_db_path = Config.BM25_DB_PATH
+            self.catalog_db_path = Config.CATALOG_DB_PATH
+            self.content_cache_dir = Config.CONTENT_CACHE_DIR
+            self.content_cache_db = Config.CONTENT_CACHE_DB
+            return
+        self.root = os.path.join(Config.TENANTS_DIR, validate_tenant_id(tenant_id))
+        self.pdf_dir = os.path.join(self.root, 'pdfs')
+        self.ocr_dir = os.path.join(self.root, 'ocr_texts')
+        self.summary_dir = os.path.join(self.root, 'summaries')
+        self.vector_store_dir = os.path.join(self.root, 'vector_store')
+        self.local_vector_dir = os.path.join(self.root, 'local_vectors')
+        self.bm25_db_path = os.path.join(self.root, 'bm25_index.db')
+        self.catalog_db_path = os.path.join(self.root, 'catalog.db')
+        self.content_cache_dir = os.path.join(self.root, 'content_cache')
+        self.content_cache_db = os.path.join(self.content_cache_dir, 'refs.db')
+
+
+class Tenant:
+    """單一 tenant 的服務：檔案、向量資料庫（含文檔目錄與 BM25）與問答"""
+
+    def __init__(self, tenant_id: str, file_handler: FileHandler = None, vector_store: VectorStore = None,
+                 qa_service: QAService = None, executor: ThreadPoolExecutor = None):
+        self.tenant_id = tenant_id
+        self.paths = TenantPaths(tenant_id)
+        self.file_handler = file_handler or FileHandler(
+            pdf_dir=self.paths.pdf_dir,
+            ocr_dir=self.paths.ocr_dir,
+            summary_dir=self.paths.summary_dir,
+            content_cache=ContentCache(
+                db_path=self.paths.content_cache_db,
+                cache_dir=self.paths.content_cache_dir,
+                ocr_dir=self.paths.ocr_dir,
+                summary_dir=self.paths.summary_dir
+            )
+        )
+        if vector_store is None:
+            vector_store = get_vector_store() if self.paths.is_default else self._create_vector_store()
+        self.vector_store = vector_store
+        self.qa_service = qa_service or QAService(
+            vector_store=self.vector_store,
+            tenant_id='' if self.paths.is_default else tenant_id,
+            executor=executor
+        )
+        self.leases = 0  # 使用中的請求數，由 TenantRegistry 維護
+
+    def _create_vector_store(self) -> VectorStore:
+        """建立此 tenant 專屬的集合（ChromaDB client 於第一次使用時才開啟）"""
+        collection = None
+        if Config.VECTOR_BACKEND == 'local':
+            collection = LocalVectorCollection(self.paths.local_vector_dir)
+        return VectorStore(
+            catalog=DocumentCatalog(db_path=self.paths.catalog_db_path),
+            bm25_index=BM25Index(db_path=self.paths.bm25_db_path),
+            collection=collection,
+            persist_directory=self.paths.vector_store_dir
+        )
+
+    def close(self):
+        """釋放集合與 ChromaDB client；預設 tenant 使用共用實例，不關閉"""
+        if not self.paths.is_default:
+            self.vector_store.close()
+
+
+class TenantRegistry:
+    """依需要開啟 tenant 並以 LRU 關閉超過上限的 tenant；預設 tenant 常駐，不計入上限"""
+
+    def __init__(self, default_tenant: Tenant = None, max_open: int = None, factory=None,
+                 executor: ThreadPoolExecutor = None):
+        self.max_open = Config.MAX_OPEN_TENANTS if max_open is None else max_open
+        self._default = default_tenant
+        # factory(tenant_id, executor=...) -> Tenant，主要用於測試時替換
+        self._factory = factory or Tenant
+        # 各 tenant 的非同步問答共用的執行緒池（未指定時各自建立）
+        self.executor = executor
+        self._open = OrderedDict()  # tenant_id → Tenant，最近使用的排在最後
+        self._closing = {}          # 已被逐出但仍有請求使用中的 tenant，最後一個請求結束時關閉
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.closed = 0
+
+    @property
+    def default(self) -> Tenant:
+        if self._default is None:
+            with self._lock:
+                if self._default is None:
+                    self._default = Tenant(Config.DEFAULT_TENANT)
+        return self._default
+
+    @contextmanager
+    def use(self, tenant_id: str = None):
+        """取得 tenant，使用期間不會被關閉"""
+        tenant = self.acquire(tenant_id)
+        try:
+            yield tenant
+        finally:
+            self.release(tenant)
+
+    def acquire(self, tenant_id: str = None) -> Tenant:
+        """取得 tenant 並登記使用（需以 release 歸還）；未開啟時建立，tenant_id 不合法時拋出 ValueError"""
+        if not tenant_id or tenant_id == Config.DEFAULT_TENANT:
+            return self.default
+        validate_tenant_id(tenant_id)
+        tenant = self._checkout(tenant_id)
+        if tenant is None:
+            # 在鎖外開啟（可能需要讀取磁碟），避免阻塞其他 tenant 的請求
+            created = self._factory(tenant_id, executor=self.executor)
+            tenant = self._checkout(tenant_id, created)
+            if tenant is not created:
+                created.close()
+        return tenant
+
+    def release(self, tenant: Tenant):
+        """歸還 tenant；已被逐出且沒有其他請求使用時關閉"""
+        if tenant is self._default:
+            return
+        with self._lock:
+            tenant.leases -= 1
+            if tenant.leases > 0 or self._closing.get(tenant.tenant_id) is not tenant:
+                return
+            del self._closing[tenant.tenant_id]
+        self._close([tenant])
+
+    def _checkout(self, tenant_id: str, created: Tenant = None):
+        """取出已開啟（或關閉中）的 tenant，沒有時登記 created；回傳 tenant 或 None"""
+        with self._lock:
+            tenant = self._open.get(tenant_id) or self._closing.pop(tenant_id, None)
+            if tenant is None:
+                if created is None:
+                    return None
+                tenant = created
+                self.opened += 1
+                print(f"Opened tenant {tenant_id}")
+            self._open[tenant_id] = tenant
+            self._open.move_to_end(tenant_id)
+            tenant.leases += 1
+            evicted = self._evict()
+        self._close(evicted)
+        return tenant
+
+    def _evict(self) -> List[Tenant]:
+        """移除超過上限的最久未使用 tenant（須持有鎖），回傳可立即關閉的 tenant"""
+        evicted = []
+        while len(self._open) > self.max_open:
+            tenant_id, tenant = self._open.popitem(last=False)
+            if tenant.leases > 0:
+                self._closing[tenant_id] = tenant
+            else:
+                evicted.append(tenant)
+        return evicted
+
+    def _close(self, tenants: List[Tenant]):
+        for tenant in tenants:
+            try:
+                tenant.close()
+                print(f"Closed tenant {tenant.tenant_id}")
+            except Exception as e:
+                print(f"Error closing tenant {tenant.tenant_id}: {str(e)}")
+            with self._lock:
+                self.closed += 1
+
+    def close_all(self):
+        """關閉所有已開啟的 tenant（程序結束時使用）"""
+        with self._lock:
+            tenants = list(self._open.values()) + list(self._closing.values())
+            self._open.clear()
+            self._closing.clear()
+        self._close(tenants)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'open': list(self._open),
+                'closing': list(self._closing),
+                'max_open': self.max_open,
+                'opened': self.opened,
+                'closed': self.closed
+            }
@@ -0,0 +1,92 @@
+"""
+文本分塊 - 向量資料庫與摘要共用的分塊引擎
+
+每一塊先求出長度上限內最遠的位置，再以預先編譯的邊界正規表示式單次掃描塊尾的回溯範圍，
+選擇層級最高（段落 > 句子 > 換行 > 子句/空白）且最靠後的邊界切開，找不到邊界時直接切開。
+下一塊的起點一定前進，且重疊不超過該塊長度的一半，不會產生近乎重複的片段。
+傳入 token_counter 時以 token 數計算長度，否則以字元數計算。
+"""
+
+import re
+from typing import List
+from src.token_counter import TokenCounter
+
+# 句末標點（含其後的右引號/括號）、拉丁句點、子句標點或空白，一律連同其後的空白一起視為邊界
+BOUNDARY_PATTERN = re.compile(r'[。！？!?…]+[」』”’）)\]]*\s*|\.\s+|[，、；：,;:]\s*|\s+')
+SENTENCE_END_CHARS = '。！？!?….'
+
+# 邊界層級：段落 > 句子 > 換行 > 子句/空白
+PARAGRAPH, SENTENCE, LINE, WORD = 4, 3, 2, 1
+
+# token 模式下每個 token 最多估計的字元數，用來限制 truncate 處理的文字長度
+MAX_CHARS_PER_TOKEN = 8
+
+
+class TextChunker:
+    def __init__(self, chunk_size: int, chunk_overlap: int = 0, token_counter: TokenCounter = None,
+                 lookback_ratio: float = 0.2):
+        if chunk_size <= 0:
+            raise ValueError("chunk_size must be positive")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = max(0, min(chunk_overlap, chunk_size - 1))
+        self.token_counter = token_counter
+        # 塊尾往回尋找邊界的範圍（塊長的比例）
+        self.lookback_ratio = lookback_ratio
+
+    def split(self, text: str) -> List[str]:
+        """將文本分割成重疊的塊"""
+        chunks = []
+        start = 0
+
+        while start < len(text):
+            limit = self._limit(text, start)
+            if limit >= len(text):
+                # 最後一塊
+                chunks.append(text[start:])
+                break
+
+            end = self._best_boundary(text, start, limit)
+            chunks.append(text[start:end])
+
+            # 下一塊的起點：重疊不超過 chunk_overlap，也不超過本塊長度的一半，並對齊到下一個邊界
+            length = end - start
+            overlap = self.chunk_overlap
+            if self.token_counter is not None:
+                # 依本塊的字元/token 比例換算重疊的字元數
+                overlap = length * self.chunk_overlap // self.chunk_size
+            target = max(end - overlap, start + (length + 1) // 2)
+            if len(text) - end <= overlap:
+                # 剩下的內容比重疊還短時不再重疊，避免最後一塊幾乎都是重複內容
+                target = end
+            boundary = BOUNDARY_PATTERN.search(text, target, end) if target < end else None
+            start = boundary.end() if boundary else target
+
+        return [chunk.strip() for chunk in chunks if chunk.strip()]
+
+    def _limit(self, text: str, start: int) -> int:
+        """從 start 起不超過 chunk_size 的最遠位置"""
+        if self.token_counter is None:
+            return start + self.chunk_size
+        window = text[start:start + self.chunk_size * MAX_CHARS_PER_TOKEN]
+        prefix = self.token_counter.truncate(window, self.chunk_size)
+        return start + max(1, len(prefix))
+
+    def _best_boundary(self, text: str, start: int, limit: int) -> int:
+        """在塊尾回溯範圍內選擇層級最高、位置最後的邊界；沒有邊界時在 limit 切開"""
+        window_start = max(start + 1, limit - max(1, int((limit - start) * self.lookback_ratio)))
+        best, best_priority = limit, 0
+        for match in BOUNDARY_PATTERN.finditer(text, window_start, limit):
+            priority = self._priority(match.group())
+            if priority >= best_priority:
+                best, best_priority = match.end(), priority
+        return best
+
+    @staticmethod
+    def _priority(boundary: str) -> int:
+        if boundary.count('\n') >= 2:
+            return PARAGRAPH
+        if boundary[0] in SENTENCE_END_CHARS:
+            return SENTENCE
+        if '\n' in boundary:
+            return LINE
+        return WORD
@@ -0,0 +1,109 @@
+"""
+Token 計數 - 依 LLM 提供者選擇離線 tokenizer，計數結果以 LRU 記憶
+
+OpenAI 使用 tiktoken（需要本機已快取的 BPE 檔）；Gemini 沒有可離線使用的 tokenizer，
+使用以字元類別估算的計數器（中日韓文字每字一個 token，英數字約每 4 字元一個 token）。
+"""
+
+import math
+import re
+from functools import lru_cache
+from typing import List
+from src.config import Config
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# 中日韓文字（含全形標點）、英數字詞、其他非空白字元
+CJK_RANGES = '\u3000-\u303f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef\uac00-\ud7af'
+CJK_PATTERN = re.compile(f'[{CJK_RANGES}]')
+WORD_PATTERN = re.compile(r'[A-Za-z0-9]+')
+OTHER_PATTERN = re.compile(rf'[^\sA-Za-z0-9{CJK_RANGES}]')
+TOKEN_PATTERN = re.compile(r'(?P<word>[A-Za-z0-9]+)|[^\sA-Za-z0-9]')
+
+
+class TokenCounter:
+    """Token 計數器基底類別：子類別實作 _count 與 truncate"""
+
+    name = 'base'
+
+    def __init__(self, cache_size: int = None):
+        cache_size = Config.TOKEN_COUNT_CACHE_SIZE if cache_size is None else cache_size
+        self.count = lru_cache(maxsize=cache_size)(self._count)
+
+    def _count(self, text: str) -> int:
+        raise NotImplementedError
+
+    def count_many(self, texts: List[str]) -> List[int]:
+        return [self.count(text) for text in texts]
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """截斷文字使其不超過 max_tokens"""
+        raise NotImplementedError
+
+
+class HeuristicTokenCounter(TokenCounter):
+    """依字元類別估算 token 數（不需任何模型檔案）"""
+
+    name = 'heuristic'
+
+    def _count(self, text: str) -> int:
+        cjk = len(CJK_PATTERN.findall(text))
+        words = sum(math.ceil(len(word) / 4) for word in WORD_PATTERN.findall(text))
+        other = len(OTHER_PATTERN.findall(text))
+        return cjk + words + other
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        # 依序累加每個 token，超過預算時在該位置截斷（英數字詞可從中間截斷）
+        used = 0
+        for match in TOKEN_PATTERN.finditer(text):
+            if match.lastgroup == 'word':
+                cost = math.ceil(len(match.group()) / 4)
+                if used + cost > max_tokens:
+                    return text[:match.start() + (max_tokens - used) * 4]
+            else:
+                cost = 1
+                if used + cost > max_tokens:
+                    return text[:match.start()]
+            used += cost
+        return text
+
+
+class TiktokenCounter(TokenCounter):
+    """以 tiktoken 精確計數（OpenAI 模型）"""
+
+    def __init__(self, model_name: str = None, cache_size: int = None):
+        super().__init__(cache_size)
+        try:
+            self.encoding = tiktoken.encoding_for_model(model_name or Config.OPENAI_MODEL)
+        except KeyError:
+            self.encoding = tiktoken.get_encoding('cl100k_base')
+        self.name = f"tiktoken:{self.encoding.name}"
+
+    def _count(self, text: str) -> int:
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        tokens = self.encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        return self.encoding.decode(tokens[:max_tokens])
+
+
+def create_token_counter(kind: str = None) -> TokenCounter:
+    """依設定建立計數器：auto 時 OpenAI 使用 tiktoken，Gemini 使用估算；tiktoken 無法載入時退回估算"""
+    kind = kind or Config.TOKEN_COUNTER
+    if kind == 'auto':
+        kind = 'tiktoken' if Config.PROVIDER == 'openai' else 'heuristic'
+    if kind == 'tiktoken':
+        if tiktoken is None:
+            print("tiktoken is not installed, falling back to heuristic token counting")
+        else:
+            try:
+                return TiktokenCounter()
+            except Exception as e:
+                # BPE 檔案未快取且無法下載時
+                print(f"tiktoken encoding unavailable, falling back to heuristic token counting: {str(e)}")
+    return HeuristicTokenCounter()
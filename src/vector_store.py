@@ -1,99 +1,543 @@
+import hashlib
 import os
-import chromadb
-from chromadb.config import Settings
-from sentence_transformers import SentenceTransformer
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
 import numpy as np
 from typing import List, Dict
 from src.config import Config
+from src import services
+from src.document_catalog import DocumentCatalog, STATUS_DELETING
+from src.bm25_index import BM25Index, reciprocal_rank_fusion
+from src.text_chunker import TextChunker
+from src.local_vector_index import LocalVectorCollection
+
+class QueryEmbeddingCache:
+    """查詢嵌入向量的 LRU 快取，以（模型名稱, 正規化後的查詢）為鍵"""
+
+    def __init__(self, max_size: int = None):
+        self.max_size = Config.QUERY_EMBEDDING_CACHE_SIZE if max_size is None else max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """全形/半形統一並合併空白，讓語意相同的查詢共用快取"""
+        return " ".join(unicodedata.normalize('NFKC', text).split())
+
+    def get(self, model_name: str, text: str):
+        key = (model_name, self.normalize(text))
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return embedding
+
+    def put(self, model_name: str, text: str, embedding):
+        if self.max_size <= 0:
+            return
+        key = (model_name, self.normalize(text))
+        with self._lock:
+            self._entries[key] = embedding
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else 0.0
+            }
+
 
 class VectorStore:
-    def __init__(self):
-        # 初始化 ChromaDB
-        self.client = chromadb.PersistentClient(
-            path=Config.VECTOR_STORE_DIR,
-            settings=Settings(anonymized_telemetry=False)
-        )
-        
-        # 初始化嵌入模型
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-        
-        # 取得或創建集合
-        self.collection = self.client.get_or_create_collection(
-            name="pdf_documents",
-            metadata={"hnsw:space": "cosine"}
-        )
+    def __init__(self, client=None, embedding_model=None, catalog: DocumentCatalog = None,
+                 bm25_index: BM25Index = None, token_counter=None, collection=None, persist_directory: str = None):
+        # ChromaDB 與嵌入模型延遲到第一次使用時才載入（預設取用 src.services 的共用實例）
+        self._client = client
+        # 指定 persist_directory 時改為自行建立該目錄的 ChromaDB client（例如各 tenant 的資料目錄），close() 時釋放
+        self.persist_directory = persist_directory
+        self._owns_client = False
+        self._embedding_model = embedding_model
+        # 可直接傳入集合（例如 LocalVectorCollection），否則依 VECTOR_BACKEND 建立
+        self._collection = collection
+        self._token_counter = token_counter
+        self._init_lock = threading.Lock()
+        self.query_cache = QueryEmbeddingCache()
+        # 文檔目錄：文檔清單與統計不必掃描整個集合
+        self.catalog = catalog or DocumentCatalog()
+        self._catalog_synced = False
+        # BM25 倒排索引：與集合同步維護，供混合檢索使用
+        self.bm25_index = bm25_index or BM25Index()
+        self._bm25_synced = False
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._init_lock:
+                if self._client is None:
+                    if self.persist_directory:
+                        self._client = services.create_chroma_client(self.persist_directory)
+                        self._owns_client = True
+                    else:
+                        self._client = services.get_chroma_client()
+        return self._client
+
+    @property
+    def embedding_model(self):
+        if self._embedding_model is None:
+            with self._init_lock:
+                if self._embedding_model is None:
+                    self._embedding_model = services.get_embedding_model()
+        return self._embedding_model
+
+    @property
+    def token_counter(self):
+        if self._token_counter is None:
+            self._token_counter = services.get_token_counter()
+        return self._token_counter
+
+    @property
+    def collection(self):
+        if self._collection is None:
+            if Config.VECTOR_BACKEND == 'local':
+                with self._init_lock:
+                    if self._collection is None:
+                        self._collection = LocalVectorCollection()
+                return self._collection
+            client = self.client
+            with self._init_lock:
+                if self._collection is None:
+                    # 取得或創建集合
+                    self._collection = client.get_or_create_collection(
+                        name="pdf_documents",
+                        metadata={"hnsw:space": "cosine"}
+                    )
+        return self._collection
+
+    def is_loaded(self) -> bool:
+        """嵌入模型與集合是否都已載入（可開始處理檢索請求）"""
+        return self._embedding_model is not None and self._collection is not None
+
+    def close(self):
+        """釋放集合與自行建立的 ChromaDB client（共用的 client 與嵌入模型不受影響）"""
+        with self._init_lock:
+            collection, self._collection = self._collection, None
+            client = self._client if self._owns_client else None
+            if self._owns_client:
+                self._client = None
+                self._owns_client = False
+        if hasattr(collection, 'close'):
+            collection.close()
+        if client is not None:
+            client.close()
     
-    def add_document(self, text: str, filename: str):
-        """將文檔添加到向量資料庫"""
+    def add_document(self, text: str, filename: str, content_hash: str = None):
+        """將文檔添加到向量資料庫（分批嵌入並寫入，記憶體上限取決於批次大小）
+
+        文檔已存在時只處理有變動的片段：位置與內容都相同的片段不重寫，內容出現在其他位置的片段沿用既有的嵌入向量，
+        其餘片段才重新嵌入，多出來的舊片段則刪除。
+        """
+        previous, stored, written_ids = None, {}, []
         try:
             print(f"Adding document {filename} to vector store...")
+            start_time = time.perf_counter()
             
             # 將文本分塊
             chunks = self._split_text_into_chunks(text, Config.CHUNK_SIZE, Config.CHUNK_OVERLAP)
+            total_chunks = len(chunks)
+            chunk_hashes = [self._chunk_hash(chunk) for chunk in chunks]
+            doc_ids = [f"{filename}_chunk_{i}" for i in range(total_chunks)]
             
-            # 生成嵌入向量
-            embeddings = self.embedding_model.encode(chunks).tolist()
+            # 與已儲存的片段比對
+            stored = self._get_stored_chunks(filename)
+            changed = [i for i in range(total_chunks) if stored.get(doc_ids[i], {}).get('hash') != chunk_hashes[i]]
+            changed_set = set(changed)
+            unchanged = [i for i in range(total_chunks) if i not in changed_set]
+            new_ids = set(doc_ids)
+            stale_ids = [chunk_id for chunk_id in stored if chunk_id not in new_ids]
+            stored_by_hash = {entry['hash']: chunk_id for chunk_id, entry in stored.items()}
             
-            # 生成文檔 IDs
-            doc_ids = [f"{filename}_chunk_{i}" for i in range(len(chunks))]
+            previous = self.catalog.get(filename)
+            self.catalog.begin_indexing(filename, total_chunks, content_hash)
             
-            # 準備元數據
-            metadatas = [
-                {
-                    "filename": filename,
-                    "chunk_index": i,
-                    "total_chunks": len(chunks)
-                }
-                for i in range(len(chunks))
-            ]
-            
-            # 添加到 ChromaDB
-            self.collection.add(
-                documents=chunks,
-                embeddings=embeddings,
-                metadatas=metadatas,
-                ids=doc_ids
-            )
+            batch_size = self._batch_size()
+            reusable = self._get_reusable_embeddings(changed, chunk_hashes, stored_by_hash)
+            for batch_start in range(0, len(changed), batch_size):
+                indexes = changed[batch_start:batch_start + batch_size]
+                batch = [chunks[i] for i in indexes]
+                batch_hashes = [chunk_hashes[i] for i in indexes]
+                batch_ids = [doc_ids[i] for i in indexes]
+                
+                # 生成嵌入向量（直接使用 float32 NumPy 陣列，不轉成 Python list；內容未變的片段沿用既有向量）
+                embeddings = self._embed_chunks(batch, indexes, reusable, batch_size)
+                
+                # 片段的 token 數在寫入時計算一次，查詢時直接用於 token 預算
+                token_counts = self.token_counter.count_many(batch)
+                metadatas = [
+                    self._chunk_metadata(filename, i, total_chunks, token_count, chunk_hash)
+                    for i, token_count, chunk_hash in zip(indexes, token_counts, batch_hashes)
+                ]
+                
+                # 寫入 ChromaDB（upsert 讓中斷後重試不會重複）；先記錄 id，寫到一半失敗時也能清除
+                written_ids.extend(batch_ids)
+                self.collection.upsert(
+                    documents=batch,
+                    embeddings=embeddings,
+                    metadatas=metadatas,
+                    ids=batch_ids
+                )
+                self.bm25_index.add_chunks(filename, batch_ids, batch)
+            
+            # 未變動的片段只在總片段數改變時更新 metadata
+            outdated = [i for i in unchanged if stored[doc_ids[i]]['metadata'].get('total_chunks') != total_chunks]
+            for batch_start in range(0, len(outdated), batch_size):
+                indexes = outdated[batch_start:batch_start + batch_size]
+                self.collection.update(
+                    ids=[doc_ids[i] for i in indexes],
+                    metadatas=[
+                        dict(stored[doc_ids[i]]['metadata'], total_chunks=total_chunks, chunk_hash=chunk_hashes[i])
+                        for i in indexes
+                    ]
+                )
             
-            print(f"Successfully added {len(chunks)} chunks from {filename}")
+            if stale_ids:
+                for batch_start in range(0, len(stale_ids), batch_size):
+                    self.collection.delete(ids=stale_ids[batch_start:batch_start + batch_size])
+                self.bm25_index.delete_chunks(stale_ids)
+            
+            self.catalog.mark_ready(filename)
+            elapsed = time.perf_counter() - start_time
+            reused = len(reusable)
+            embedded = len(changed) - reused
+            throughput = embedded / elapsed if elapsed > 0 else 0
+            if stored:
+                print(f"Re-indexed {filename} in {elapsed:.2f}s: {len(unchanged)} unchanged, {reused} reused, "
+                      f"{embedded} embedded, {len(stale_ids)} deleted")
+            else:
+                print(f"Successfully added {total_chunks} chunks from {filename} "
+                      f"in {elapsed:.2f}s ({throughput:.1f} chunks/s, batch size {batch_size})")
             return True
             
         except Exception as e:
             print(f"Error adding document {filename} to vector store: {str(e)}")
+            # 新文檔寫到一半失敗：清除已寫入的片段，避免檢索到文檔目錄中沒有的片段
+            if not stored and written_ids:
+                self._delete_chunks(written_ids)
+            # 重新索引失敗時既有片段仍在集合中：保留文檔紀錄（上傳時間、標籤）並還原先前的狀態
+            if previous is not None:
+                self.catalog.restore(previous)
+            elif stored:
+                self.catalog.mark_ready(filename, len(stored))
+            else:
+                self.catalog.remove(filename)
             return False
     
-    def search(self, query: str, top_k: int = None) -> List[Dict]:
+    def _delete_chunks(self, chunk_ids: List[str]):
+        """從集合與 BM25 索引刪除指定片段（清除失敗只記錄，不影響呼叫端的錯誤處理）"""
+        try:
+            batch_size = self._batch_size()
+            for batch_start in range(0, len(chunk_ids), batch_size):
+                self.collection.delete(ids=chunk_ids[batch_start:batch_start + batch_size])
+            self.bm25_index.delete_chunks(chunk_ids)
+        except Exception as e:
+            print(f"Error removing partially written chunks: {str(e)}")
+    
+    @staticmethod
+    def _chunk_hash(chunk: str) -> str:
+        return hashlib.sha1(chunk.encode('utf-8')).hexdigest()
+    
+    def _chunk_metadata(self, filename: str, chunk_index: int, total_chunks: int,
+                        token_count: int, chunk_hash: str) -> Dict:
+        return {
+            "filename": filename,
+            "chunk_index": chunk_index,
+            "total_chunks": total_chunks,
+            "token_count": token_count,
+            "token_counter": self.token_counter.name,
+            "chunk_hash": chunk_hash
+        }
+    
+    def _get_stored_chunks(self, filename: str) -> Dict[str, Dict]:
+        """取得文檔已儲存片段的內容雜湊與 metadata（舊資料沒有雜湊時由內容計算）"""
+        results = self.collection.get(where={"filename": filename}, include=["metadatas", "documents"])
+        stored = {}
+        for chunk_id, metadata, document in zip(results['ids'], results['metadatas'], results['documents']):
+            metadata = metadata or {}
+            stored[chunk_id] = {
+                'hash': metadata.get('chunk_hash') or self._chunk_hash(document or ''),
+                'metadata': metadata
+            }
+        return stored
+    
+    def _get_reusable_embeddings(self, indexes: List[int], chunk_hashes: List[str],
+                                 stored_by_hash: Dict[str, str]) -> Dict[int, np.ndarray]:
+        """內容已存在於其他位置的片段，取回其既有嵌入向量（需在寫入任何片段前取回，避免來源已被覆寫）"""
+        sources = {i: stored_by_hash[chunk_hashes[i]] for i in indexes if chunk_hashes[i] in stored_by_hash}
+        if not sources:
+            return {}
+        results = self.collection.get(ids=list(set(sources.values())), include=["embeddings"])
+        # collection.get 的回傳順序不保證與 ids 相同
+        by_id = dict(zip(results['ids'], results['embeddings']))
+        return {i: by_id[chunk_id] for i, chunk_id in sources.items() if chunk_id in by_id}
+    
+    def _embed_chunks(self, chunks: List[str], indexes: List[int], reusable: Dict[int, np.ndarray],
+                      batch_size: int) -> np.ndarray:
+        """嵌入一批片段：可沿用的片段使用既有向量，其餘一次批次編碼"""
+        missing = [k for k, i in enumerate(indexes) if i not in reusable]
+        encoded = {}
+        if missing:
+            vectors = self.embedding_model.encode(
+                [chunks[k] for k in missing], batch_size=batch_size, convert_to_numpy=True
+            )
+            encoded = dict(zip(missing, vectors))
+        return np.asarray(
+            [encoded[k] if k in encoded else reusable[i] for k, i in enumerate(indexes)],
+            dtype=np.float32
+        )
+    
+    def _batch_size(self) -> int:
+        """嵌入與寫入的批次大小，不超過 ChromaDB 單次寫入上限"""
+        batch_size = max(1, Config.EMBEDDING_BATCH_SIZE)
+        if isinstance(self.collection, LocalVectorCollection):
+            return batch_size
+        try:
+            batch_size = min(batch_size, self.client.get_max_batch_size())
+        except Exception:
+            pass
+        return batch_size
+    
+    def copy_document(self, source_filename: str, filename: str) -> bool:
+        """複製已存在文檔的片段與嵌入向量到新檔名（內容相同時免重新嵌入）"""
+        try:
+            results = self.collection.get(
+                where={"filename": source_filename},
+                include=["documents", "metadatas", "embeddings"]
+            )
+            if not results['ids']:
+                return False
+
+            metadatas = []
+            for metadata in results['metadatas']:
+                metadata = dict(metadata)
+                metadata['filename'] = filename
+                metadatas.append(metadata)
+
+            source_entry = self.catalog.get(source_filename) or {}
+            self.catalog.begin_indexing(filename, len(metadatas), source_entry.get('content_hash'))
+            ids = [f"{filename}_chunk_{metadata['chunk_index']}" for metadata in metadatas]
+            batch_size = self._batch_size()
+            for batch_start in range(0, len(ids), batch_size):
+                batch_end = batch_start + batch_size
+                self.collection.upsert(
+                    documents=results['documents'][batch_start:batch_end],
+                    embeddings=results['embeddings'][batch_start:batch_end],
+                    metadatas=metadatas[batch_start:batch_end],
+                    ids=ids[batch_start:batch_end]
+                )
+                self.bm25_index.add_chunks(
+                    filename, ids[batch_start:batch_end], results['documents'][batch_start:batch_end]
+                )
+            self.catalog.mark_ready(filename)
+            print(f"Copied {len(metadatas)} chunks from {source_filename} to {filename}")
+            return True
+
+        except Exception as e:
+            print(f"Error copying document {source_filename} to {filename}: {str(e)}")
+            self.catalog.remove(filename)
+            return False
+
+    def search(self, query: str, top_k: int = None, filenames: List[str] = None) -> List[Dict]:
         """搜索相關文檔片段（增強版）"""
+        return self.search_many([query], top_k, filenames)[0]
+    
+    def search_many(self, queries: List[str], top_k: int = None, filenames: List[str] = None) -> List[List[Dict]]:
+        """以單次批次嵌入與單次 collection.query 同時搜索多個查詢，回傳每個查詢的結果
+
+        傳入 filenames 時只在這些文檔的片段中搜索（以 where 條件交給向量資料庫過濾）。
+        """
         if top_k is None:
             top_k = Config.TOP_K
+        if not queries:
+            return []
+        if filenames is not None and not filenames:
+            return [[] for _ in queries]
         
         try:
-            # 生成查詢的嵌入向量
-            query_embedding = self.embedding_model.encode([query]).tolist()
+            # 生成查詢的嵌入向量（已快取的查詢不重新嵌入，其餘一次批次編碼）
+            query_embeddings = self.embed_queries(queries)
             
             # 搜索
             results = self.collection.query(
-                query_embeddings=query_embedding,
-                n_results=top_k
+                query_embeddings=query_embeddings.tolist(),
+                n_results=top_k,
+                where=self._scope_where(filenames)
             )
             
             # 格式化結果
             formatted_results = []
-            if results['documents'] and len(results['documents']) > 0:
-                for i in range(len(results['documents'][0])):
-                    formatted_results.append({
-                        'content': results['documents'][0][i],
-                        'metadata': results['metadatas'][0][i] if results['metadatas'] else {},
-                        'distance': results['distances'][0][i] if results['distances'] else 0,
-                        'id': results['ids'][0][i] if results['ids'] else f'doc_{i}'
-                    })
+            for q in range(len(queries)):
+                query_results = []
+                if results['documents'] and len(results['documents']) > q:
+                    for i in range(len(results['documents'][q])):
+                        query_results.append({
+                            'content': results['documents'][q][i],
+                            'metadata': results['metadatas'][q][i] if results['metadatas'] else {},
+                            'distance': results['distances'][q][i] if results['distances'] else 0,
+                            'id': results['ids'][q][i] if results['ids'] else f'doc_{i}'
+                        })
+                formatted_results.append(query_results)
             
             return formatted_results
             
         except Exception as e:
             print(f"Error searching vector store: {str(e)}")
+            return [[] for _ in queries]
+    
+    def hybrid_search(self, query: str, top_k: int = None, filenames: List[str] = None) -> List[Dict]:
+        """混合檢索：向量檢索與 BM25 關鍵字檢索的結果以 Reciprocal Rank Fusion 合併"""
+        return self.hybrid_search_many([query], top_k, filenames)[0]
+    
+    def hybrid_search_many(self, queries: List[str], top_k: int = None,
+                           filenames: List[str] = None) -> List[List[Dict]]:
+        """多個查詢的混合檢索：向量部分以單次批次查詢完成，各查詢分別與 BM25 結果融合"""
+        if top_k is None:
+            top_k = Config.TOP_K
+        if not queries:
             return []
+        if filenames is not None and not filenames:
+            return [[] for _ in queries]
+        
+        try:
+            self._sync_bm25()
+            candidates = top_k * Config.HYBRID_CANDIDATE_MULTIPLIER
+            dense_lists = self.search_many(queries, candidates, filenames)
+            
+            fused_lists, bm25_rank_lists = [], []
+            for query, dense_results in zip(queries, dense_lists):
+                sparse_results = self.bm25_index.search(query, candidates, filenames)
+                fused_lists.append(reciprocal_rank_fusion([
+                    [doc['id'] for doc in dense_results],
+                    [chunk_id for chunk_id, _ in sparse_results]
+                ])[:top_k])
+                bm25_rank_lists.append(
+                    {chunk_id: rank for rank, (chunk_id, _) in enumerate(sparse_results, start=1)}
+                )
+            
+            # 只有關鍵字命中的片段沒有向量距離：所有查詢缺少的片段一次取回嵌入向量，再各自計算餘弦距離
+            docs_by_id_lists = [{doc['id']: doc for doc in dense_results} for dense_results in dense_lists]
+            missing_ids = {
+                chunk_id
+                for fused, docs_by_id in zip(fused_lists, docs_by_id_lists)
+                for chunk_id, _ in fused if chunk_id not in docs_by_id
+            }
+            if missing_ids:
+                chunks, embeddings = self._get_chunks_with_embeddings(list(missing_ids))
+                query_embeddings = self.embed_queries(queries)
+                for q, docs_by_id in enumerate(docs_by_id_lists):
+                    docs_by_id.update(self._with_distance(chunks, embeddings, query_embeddings[q], docs_by_id))
+            
+            all_results = []
+            for fused, docs_by_id, bm25_ranks in zip(fused_lists, docs_by_id_lists, bm25_rank_lists):
+                results = []
+                for chunk_id, score in fused:
+                    doc = docs_by_id.get(chunk_id)
+                    if doc is None:
+                        continue
+                    doc = dict(doc)
+                    doc['rrf_score'] = score
+                    doc['bm25_rank'] = bm25_ranks.get(chunk_id)
+                    results.append(doc)
+                all_results.append(results)
+            return all_results
+            
+        except Exception as e:
+            print(f"Error in hybrid search: {str(e)}")
+            return self.search_many(queries, top_k, filenames)
+
+    @staticmethod
+    def _scope_where(filenames: List[str] = None):
+        """檢索範圍對應的 where 條件（未限定範圍時為 None）"""
+        if filenames is None:
+            return None
+        if len(filenames) == 1:
+            return {"filename": filenames[0]}
+        return {"filename": {"$in": list(filenames)}}
+    
+    def _get_chunks_with_embeddings(self, chunk_ids: List[str]):
+        """取得片段內容與其嵌入向量"""
+        results = self.collection.get(ids=chunk_ids, include=["documents", "metadatas", "embeddings"])
+        chunks = [
+            {
+                'content': results['documents'][i],
+                'metadata': results['metadatas'][i] if results['metadatas'] else {},
+                'id': chunk_id
+            }
+            for i, chunk_id in enumerate(results['ids'])
+        ]
+        return chunks, np.asarray(results['embeddings'], dtype=np.float32)
+    
+    @staticmethod
+    def _with_distance(chunks: List[Dict], embeddings: np.ndarray, query_embedding: np.ndarray,
+                       exclude: Dict = None) -> Dict[str, Dict]:
+        """計算片段與查詢的餘弦距離（與集合的 cosine 空間一致）"""
+        if not chunks:
+            return {}
+        norms = np.linalg.norm(embeddings, axis=1) * (np.linalg.norm(query_embedding) or 1.0)
+        similarities = embeddings @ query_embedding / np.where(norms == 0, 1.0, norms)
+        return {
+            chunk['id']: dict(chunk, distance=float(1 - similarities[i]))
+            for i, chunk in enumerate(chunks)
+            if not exclude or chunk['id'] not in exclude
+        }
     
+    def _sync_bm25(self):
+        """BM25 索引為空但集合已有資料時（升級前建立的資料庫），以集合內容重建一次索引"""
+        if self._bm25_synced:
+            return
+        if self.bm25_index.is_empty() and self.collection.count() > 0:
+            print("Building BM25 index from existing collection...")
+            results = self.collection.get(include=["documents", "metadatas"])
+            by_file = {}
+            for chunk_id, document, metadata in zip(results['ids'], results['documents'], results['metadatas']):
+                filename = (metadata or {}).get('filename', '')
+                by_file.setdefault(filename, ([], []))
+                by_file[filename][0].append(chunk_id)
+                by_file[filename][1].append(document)
+            for filename, (chunk_ids, documents) in by_file.items():
+                self.bm25_index.add_chunks(filename, chunk_ids, documents)
+        self._bm25_synced = True
+    
+    def embed_query(self, query: str) -> np.ndarray:
+        """取得查詢的嵌入向量，優先使用快取"""
+        return self.embed_queries([query])[0]
+
+    def embed_queries(self, queries: List[str]) -> np.ndarray:
+        """取得多個查詢的嵌入向量：快取命中的直接取用，其餘以一次 encode 批次計算"""
+        embeddings = [self.query_cache.get(Config.LOCAL_EMBEDDING_MODEL, query) for query in queries]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            encoded = self.embedding_model.encode([queries[i] for i in missing])
+            for i, embedding in zip(missing, encoded):
+                embeddings[i] = np.asarray(embedding, dtype=np.float32)
+                self.query_cache.put(Config.LOCAL_EMBEDDING_MODEL, queries[i], embeddings[i])
+        return np.stack(embeddings)
+
     def get_chunk_by_id(self, chunk_id: str) -> Dict:
         """根據 ID 獲取特定片段"""
         try:
@@ -109,10 +553,30 @@ class VectorStore:
             print(f"Error getting chunk {chunk_id}: {e}")
         return None
     
+    def get_chunks(self, chunk_ids: List[str]) -> List[Dict]:
+        """以單一次 collection.get 批次取得多個片段，依傳入順序回傳（不存在的 ID 略過）"""
+        if not chunk_ids:
+            return []
+        try:
+            unique_ids = list(dict.fromkeys(chunk_ids))
+            results = self.collection.get(ids=unique_ids)
+            chunks_by_id = {}
+            for i, chunk_id in enumerate(results['ids']):
+                chunks_by_id[chunk_id] = {
+                    'content': results['documents'][i],
+                    'metadata': results['metadatas'][i] if results['metadatas'] else {},
+                    'distance': 0,  # 直接獲取的片段設為高相似度
+                    'id': chunk_id
+                }
+            return [chunks_by_id[chunk_id] for chunk_id in unique_ids if chunk_id in chunks_by_id]
+        except Exception as e:
+            print(f"Error getting chunks: {e}")
+            return []
+
     def get_adjacent_chunks(self, filename: str, chunk_index: int, window_size: int = 1) -> List[Dict]:
         """獲取相鄰的文檔片段"""
         try:
-            adjacent_chunks = []
+            chunk_ids = []
             
             for offset in range(-window_size, window_size + 1):
                 if offset == 0:  # 跳過當前片段
@@ -122,77 +586,85 @@ class VectorStore:
                 if target_index < 0:  # 跳過負索引
                     continue
                     
-                chunk_id = f"{filename}_chunk_{target_index}"
-                chunk = self.get_chunk_by_id(chunk_id)
-                
-                if chunk:
-                    adjacent_chunks.append(chunk)
+                chunk_ids.append(f"{filename}_chunk_{target_index}")
             
-            return adjacent_chunks
+            # 一次取回所有相鄰片段
+            return self.get_chunks(chunk_ids)
             
         except Exception as e:
             print(f"Error getting adjacent chunks: {e}")
             return []
     
     def delete_document(self, filename: str):
-        """從向量資料庫中刪除文檔"""
+        """從向量資料庫中刪除文檔（失敗時還原文檔紀錄的狀態，可再次刪除）"""
+        previous = None
         try:
-            # 找到所有相關的文檔塊
+            previous = self.catalog.get(filename)
+            self.catalog.mark_deleting(filename)
+            
+            # 找到所有相關的文檔塊（只取 ID，不載入內容）
             results = self.collection.get(
-                where={"filename": filename}
+                where={"filename": filename},
+                include=[]
             )
             
             if results['ids']:
                 # 刪除所有相關的塊
                 self.collection.delete(ids=results['ids'])
                 print(f"Deleted {len(results['ids'])} chunks for {filename}")
-                return True
             
+            self.bm25_index.delete_document(filename)
+            self.catalog.remove(filename)
             return True
             
         except Exception as e:
             print(f"Error deleting document {filename} from vector store: {str(e)}")
+            # 片段可能仍在集合中：還原狀態讓文檔重新出現在清單中，而不是永遠停在刪除中
+            if previous is not None:
+                try:
+                    self.catalog.restore(previous)
+                except Exception as restore_error:
+                    print(f"Error restoring catalog entry for {filename}: {str(restore_error)}")
             return False
     
     def get_document_list(self) -> List[str]:
-        """取得向量資料庫中所有文檔的清單"""
+        """取得向量資料庫中所有文檔的清單（查詢文檔目錄）"""
         try:
-            results = self.collection.get()
-            filenames = set()
-            
-            if results['metadatas']:
-                for metadata in results['metadatas']:
-                    if 'filename' in metadata:
-                        filenames.add(metadata['filename'])
-            
-            return list(filenames)
+            self._sync_catalog()
+            return self.catalog.get_filenames()
             
         except Exception as e:
             print(f"Error getting document list: {str(e)}")
             return []
     
+    def get_chunk_count(self) -> int:
+        """取得向量資料庫中的片段總數（查詢文檔目錄）"""
+        try:
+            self._sync_catalog()
+            return self.catalog.total_chunks()
+        except Exception as e:
+            print(f"Error getting chunk count: {str(e)}")
+            return 0
+    
+    def _sync_catalog(self):
+        """目錄為空但集合已有資料時（升級前建立的資料庫），以中繼資料重建一次目錄；
+        並完成上次程序中斷時仍停在刪除中的文檔"""
+        if self._catalog_synced:
+            return
+        for entry in self.catalog.list_documents(STATUS_DELETING):
+            print(f"Finishing interrupted deletion of {entry['filename']}...")
+            self.delete_document(entry['filename'])
+        if self.catalog.is_empty() and self.collection.count() > 0:
+            print("Rebuilding document catalog from existing collection metadata...")
+            results = self.collection.get(include=["metadatas"])
+            chunk_counts = {}
+            for metadata in results['metadatas'] or []:
+                if metadata and 'filename' in metadata:
+                    chunk_counts[metadata['filename']] = chunk_counts.get(metadata['filename'], 0) + 1
+            self.catalog.rebuild(chunk_counts)
+        self._catalog_synced = True
+    
     def _split_text_into_chunks(self, text: str, chunk_size: int, chunk_overlap: int) -> List[str]:
-        """將文本分割成重疊的塊"""
-        chunks = []
-        start = 0
-        
-        while start < len(text):
-            # 計算結束位置
-            end = start + chunk_size
-            
-            if end >= len(text):
-                # 最後一塊
-                chunks.append(text[start:])
-                break
-            
-            # 尋找適當的分割點（避免在單詞中間分割）
-            split_end = end
-            for i in range(end, max(start, end - 100), -1):
-                if text[i] in [' ', '\n', '\t', '。', '！', '？', '.', '!', '?']:
-                    split_end = i + 1
-                    break
-            
-            chunks.append(text[start:split_end])
-            start = split_end - chunk_overlap if split_end > chunk_overlap else split_end
-        
-        return [chunk.strip() for chunk in chunks if chunk.strip()]
\ No newline at end of file
+        """將文本分割成重疊的塊（CHUNK_UNIT 為 tokens 時以 token 數計算長度）"""
+        token_counter = self.token_counter if Config.CHUNK_UNIT == 'tokens' else None
+        return TextChunker(chunk_size, chunk_overlap, token_counter=token_counter).split(text)
\ No newline at end of file
@@ -0,0 +1,57 @@
+"""
+資料目錄的寫入者鎖 - 同一時間只允許一個程序寫入向量集合、BM25 索引與本地向量資料庫
+
+Web 應用與批次匯入 CLI 都會寫入同一組資料庫，其中本地向量資料庫只支援單一程序；
+兩者以 DATA_DIR 下的鎖檔互斥，程序結束時由作業系統自動釋放。
+"""
+
+import os
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from src.config import Config
+
+
+class WriterLock:
+    def __init__(self, path: str = None):
+        self.path = path or Config.WRITER_LOCK_PATH
+        self._file = None
+
+    @property
+    def held(self) -> bool:
+        return self._file is not None
+
+    def acquire(self) -> bool:
+        """嘗試取得鎖（不等待）；已由其他程序持有時回傳 False"""
+        if self._file is not None:
+            return True
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        lock_file = open(self.path, 'a+')
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            lock_file.close()
+            return False
+        self._file = lock_file
+        return True
+
+    def release(self):
+        if self._file is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+測試共用設定：所有測試的資料目錄都指向 tmp_path，不寫入專案的 data/ 目錄；各測試共用的假嵌入模型與假向量資料庫
+"""
+
+import hashlib
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# 添加專案根目錄到 Python 路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.config import Config
+
+
+@pytest.fixture(autouse=True)
+def isolated_data_dir(tmp_path, monkeypatch):
+    """將 Config 的資料路徑改到此測試的暫存目錄"""
+    data_dir = tmp_path / 'data'
+    paths = {
+        'DATA_DIR': data_dir,
+        'PDF_DIR': data_dir / 'pdfs',
+        'OCR_DIR': data_dir / 'ocr_texts',
+        'SUMMARY_DIR': data_dir / 'summaries',
+        'VECTOR_STORE_DIR': data_dir / 'vector_store',
+        'LOCAL_VECTOR_DIR': data_dir / 'local_vectors',
+        'BM25_DB_PATH': data_dir / 'bm25_index.db',
+        'JOB_DB_PATH': data_dir / 'jobs.db',
+        'CATALOG_DB_PATH': data_dir / 'catalog.db',
+        'CONTENT_CACHE_DIR': data_dir / 'content_cache',
+        'CONTENT_CACHE_DB': data_dir / 'content_cache' / 'refs.db',
+        'TENANTS_DIR': data_dir / 'tenants',
+        'WRITER_LOCK_PATH': data_dir / 'writer.lock',
+    }
+    for name, path in paths.items():
+        monkeypatch.setattr(Config, name, str(path))
+    return data_dir
+
+
+class FakeEmbeddingModel:
+    """以雜湊產生固定向量的假模型，並記錄 encode 的次數
+
+    per_char=False 時每段文字以其雜湊為種子產生隨機向量（任兩段文字的相似度都很低）；
+    per_char=True 時每個字元依雜湊累加到一個維度（共用字元越多的文字越相似）。
+    """
+
+    def __init__(self, dim=16, per_char=False):
+        self.dim = dim
+        self.per_char = per_char
+        self.encode_calls = 0
+        self.encoded_texts = 0
+
+    def encode(self, texts, **kwargs):
+        self.encode_calls += 1
+        self.encoded_texts += len(texts)
+        if self.per_char:
+            vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+            for i, text in enumerate(texts):
+                for char in text:
+                    vectors[i, int(hashlib.md5(char.encode('utf-8')).hexdigest()[:6], 16) % self.dim] += 1
+            return vectors
+        return np.asarray([
+            np.random.default_rng(int(hashlib.md5(text.encode('utf-8')).hexdigest()[:8], 16)).standard_normal(self.dim)
+            for text in texts
+        ], dtype=np.float32)
+
+
+class FakeVectorStore:
+    """只提供測試需要的部分：問答快取用的 catalog 與 embed_query，以及依序回傳固定候選片段的檢索"""
+
+    def __init__(self, catalog=None, chunks=()):
+        self.catalog = catalog
+        self.chunks = list(chunks)
+        self.requested_top_k = []
+
+    def embed_query(self, question):
+        # 忽略大小寫與結尾問號，模擬語意相同的問題有相同的嵌入
+        seed = sum(map(ord, question.lower().rstrip('?？')))
+        return np.random.default_rng(seed).standard_normal(16).astype(np.float32)
+
+    def search_many(self, queries, top_k, filenames=None):
+        self.requested_top_k.append(top_k)
+        return [[dict(chunk) for chunk in self.chunks[:top_k]] for _ in queries]
+
+    hybrid_search_many = search_many
+
+    def get_chunks(self, ids):
+        return []
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+測試問答快取：近似問題命中、TTL 與容量淘汰、並行查詢的計數、文檔變動後失效、檢索範圍隔離、LLM 失敗的回答不快取
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+# 添加專案根目錄到 Python 路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conftest import FakeVectorStore
+from src.answer_cache import AnswerCache
+from src.document_catalog import DocumentCatalog
+from src.qa_service import AnswerGenerationError, QAService
+
+
+def test_lookup_matches_similar_embeddings_and_evicts():
+    cache = AnswerCache(similarity_threshold=0.95, ttl=60, max_size=2)
+    base = np.ones(8, dtype=np.float32)
+
+    cache.store('v1', 'q1', base, {'answer': 'a1', 'sources': [{'filename': 'a.pdf'}]})
+    assert cache.lookup('v1', base + 0.01)['answer'] == 'a1'
+    assert cache.lookup('v1', -base) is None
+    assert cache.lookup('v2', base) is None
+
+    other = np.arange(8, dtype=np.float32)
+    cache.store('v1', 'q2', other, {'answer': 'a2', 'sources': []})
+    cache.store('v1', 'q3', -base, {'answer': 'a3', 'sources': []})
+    assert cache.lookup('v1', base) is None  # 最舊的項目已被淘汰
+    assert cache.stats()['size'] == 2
+
+    expired = AnswerCache(ttl=0)
+    expired.store('v1', 'q1', base, {'answer': 'a1'})
+    assert expired.lookup('v1', base) is None
+
+
+class SlowCount(int):
+    """加法時讓出執行緒的計數，未加鎖的 += 會遺失更新"""
+
+    def __add__(self, other):
+        time.sleep(0.0001)
+        return SlowCount(int(self) + other)
+
+
+def test_concurrent_lookups_are_all_counted():
+    cache = AnswerCache(similarity_threshold=0.95, ttl=60, max_size=2)
+    cache.hits, cache.misses = SlowCount(0), SlowCount(0)
+    base = np.ones(8, dtype=np.float32)
+    cache.store('v1', 'q1', base, {'answer': 'a1'})
+
+    def worker():
+        for _ in range(50):
+            cache.lookup('v1', base)
+            cache.lookup('v1', -base)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses']) == (400, 400)
+    assert stats['hit_rate'] == 0.5
+
+
+def test_qa_service_serves_repeats_from_cache_until_documents_change(tmp_path):
+    catalog = DocumentCatalog(db_path=str(tmp_path / 'catalog.db'))
+    catalog.begin_indexing('a.pdf', 3)
+    catalog.mark_ready('a.pdf')
+    service = QAService(vector_store=FakeVectorStore(catalog), smart_retrieval=object(), answer_cache=AnswerCache())
+
+    calls = []
+
+    def fake_answer(question, filenames=None):
+        calls.append(question)
+        return {'answer': f'answer {len(calls)}', 'sources': [{'filename': 'a.pdf'}], 'confidence': 0.9}, True
+
+    service._answer_question = fake_answer
+
+    first = service.answer_question('What is CS101?')
+    repeat = service.answer_question('what is cs101')
+    assert repeat['answer'] == first['answer'] and repeat['cached'] is True
+    assert len(calls) == 1
+
+    catalog.begin_indexing('b.pdf', 2)
+    catalog.mark_ready('b.pdf')
+    assert service.answer_question('What is CS101?')['answer'] == 'answer 2'
+    assert len(calls) == 2
+
+
+def test_scoped_answers_are_cached_per_scope(tmp_path):
+    catalog = DocumentCatalog(db_path=str(tmp_path / 'catalog.db'))
+    for filename in ('a.pdf', 'b.pdf'):
+        catalog.begin_indexing(filename, 3)
+        catalog.mark_ready(filename)
+    service = QAService(vector_store=FakeVectorStore(catalog), smart_retrieval=object(), answer_cache=AnswerCache())
+
+    calls = []
+
+    def fake_answer(question, filenames=None):
+        calls.append(filenames)
+        return {'answer': f'answer {len(calls)}', 'sources': [{'filename': 'a.pdf'}], 'confidence': 0.9}, True
+
+    service._answer_question = fake_answer
+
+    assert service.answer_question('What is CS101?', {'filenames': ['a.pdf']})['answer'] == 'answer 1'
+    assert service.answer_question('What is CS101?')['answer'] == 'answer 2'
+    assert service.answer_question('what is cs101', {'filenames': ['a.pdf']})['cached'] is True
+    assert calls == [['a.pdf'], None]
+
+    # 範圍內沒有文檔時不檢索
+    assert service.answer_question('What is CS101?', {'tags': ['none']})['sources'] == []
+    assert len(calls) == 2
+
+
+def test_failed_generation_is_not_cached(tmp_path):
+    catalog = DocumentCatalog(db_path=str(tmp_path / 'catalog.db'))
+    cache = AnswerCache()
+    service = QAService(vector_store=FakeVectorStore(catalog), smart_retrieval=object(), answer_cache=cache)
+    docs = [{'content': '內容', 'metadata': {'filename': 'a.pdf', 'chunk_index': 0, 'total_chunks': 1}, 'distance': 0.1}]
+    service._plan_answer = lambda question, filenames=None: {
+        'question': question, 'docs': docs, 'context': '內容',
+        'question_analysis': {'is_broad': False, 'complexity_score': 2}
+    }
+
+    # 模擬 LLM 呼叫失敗：一般、串流與非同步路徑都回傳錯誤說明，但不寫入快取
+    def failing_generate(plan):
+        raise AnswerGenerationError('生成失敗')
+
+    def failing_stream(plan):
+        yield '部分'
+        raise AnswerGenerationError('生成失敗')
+
+    async def failing_astream(plan):
+        raise AnswerGenerationError('生成失敗')
+        yield
+
+    async def collect(events):
+        return [event async for event in events]
+
+    service._generate_answer = failing_generate
+    service._stream_answer = failing_stream
+    service._astream_answer = failing_astream
+
+    result = service.answer_question('What is CS101?')
+    assert result['answer'] == '生成失敗' and result['sources']
+    events = list(service.answer_question_stream('What is CS101?'))
+    assert events[-2:] == [('token', {'text': '生成失敗'}), ('done', {'cached': False})]
+    assert asyncio.run(service.answer_question_async('What is CS101?'))['answer'] == '生成失敗'
+    asyncio.run(collect(service.answer_question_stream_async('What is CS101?')))
+    assert cache.stats()['size'] == 0
+
+    # LLM 恢復後的回答照常寫入快取
+    service._generate_answer = lambda plan: '正常回答'
+    service.answer_question('What is CS101?')
+    assert service.answer_question('What is CS101?')['cached'] is True
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+測試 BM25 倒排索引、Reciprocal Rank Fusion 與混合檢索的相似度閾值過濾
+"""
+
+import os
+import sys
+
+# 添加專案根目錄到 Python 路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conftest import FakeEmbeddingModel
+from src.bm25_index import BM25Index, reciprocal_rank_fusion, tokenize
+from src.config import Config
+from src.document_catalog import DocumentCatalog
+from src.local_vector_index import LocalVectorCollection
+from src.smart_retrieval import SmartRetrievalService
+from src.vector_store import VectorStore
+
+
+def test_tokenize_mixed_cjk_and_latin():
+    tokens = tokenize('MA1101 線性代數')
+    assert 'ma1101' in tokens
+    assert '線性' in tokens and '代數' in tokens and '線' in tokens
+
+
+def test_search_ranks_exact_terms_and_survives_reopen(tmp_path):
+    db_path = str(tmp_path / 'bm25.db')
+    index = BM25Index(db_path=db_path)
+    index.add_chunks('a.pdf', ['a.pdf_chunk_0', 'a.pdf_chunk_1'], [
+        '本章介紹傅立葉轉換與拉普拉斯轉換。',
+        '課程代碼 EE2010 訊號與系統，期中考範圍。'
+    ])
+    index.add_chunks('b.pdf', ['b.pdf_chunk_0'], ['機器學習的基本概念與監督式學習。'])
+
+    reopened = BM25Index(db_path=db_path)
+    assert reopened.search('EE2010')[0][0] == 'a.pdf_chunk_1'
+    assert reopened.search('傅立葉轉換')[0][0] == 'a.pdf_chunk_0'
+
+    reopened.delete_document('a.pdf')
+    assert reopened.search('EE2010') == []
+    assert reopened.search('監督式學習')[0][0] == 'b.pdf_chunk_0'
+
+
+def test_search_within_filenames_keeps_global_scores(tmp_path):
+    index = BM25Index(db_path=str(tmp_path / 'bm25.db'))
+    index.add_chunks('a.pdf', ['a.pdf_chunk_0'], ['傅立葉轉換的定義與性質。'])
+    index.add_chunks('b.pdf', ['b.pdf_chunk_0'], ['傅立葉級數與傅立葉轉換的關係。'])
+    index.add_chunks('c.pdf', ['c.pdf_chunk_0'], ['機率論的基本概念。'])
+
+    unscoped = dict(index.search('傅立葉轉換', top_k=5))
+    scoped = index.search('傅立葉轉換', top_k=5, filenames=['a.pdf', 'c.pdf'])
+
+    assert [chunk_id for chunk_id, _ in scoped] == ['a.pdf_chunk_0']
+    assert abs(scoped[0][1] - unscoped['a.pdf_chunk_0']) < 1e-9
+    assert index.search('傅立葉轉換', filenames=[]) == []
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([['x', 'y', 'z'], ['y', 'w']], k=60)
+    assert fused[0][0] == 'y'
+    assert {item_id for item_id, _ in fused} == {'x', 'y', 'z', 'w'}
+
+
+def test_function_characters_do_not_bypass_similarity_threshold(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'RERANK_ENABLED', False)
+    monkeypatch.setattr(Config, 'HYBRID_RETRIEVAL', True)
+    store = VectorStore(
+        embedding_model=FakeEmbeddingModel(),
+        catalog=DocumentCatalog(db_path=str(tmp_path / 'catalog.db')),
+        bm25_index=BM25Index(db_path=str(tmp_path / 'bm25.db')),
+        collection=LocalVectorCollection(str(tmp_path / 'vectors'))
+    )
+    store.add_document('貝氏定理描述條件機率的關係，是統計推論的基礎。', 'bayes.pdf')
+    store.add_document('這是課程的期末報告要求，報告的字數是三千字。', 'report.pdf')
+
+    # 無關片段只與問題共用「的」「是」等虛詞，不算關鍵字命中
+    assert [chunk_id for chunk_id, _ in store.bm25_index.search('什麼是貝氏定理的公式？')] == ['bayes.pdf_chunk_0']
+
+    service = SmartRetrievalService(store)
+    analysis = service.analyze_question_complexity('什麼是貝氏定理的公式？')
+    filtered = service._filter_by_similarity_many(['什麼是貝氏定理的公式？'], [analysis], [(5, 0.7)])[0]
+    assert [doc['metadata']['filename'] for doc in filtered] == ['bayes.pdf']
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+測試內容定址快取的引用計數
+"""
+
+import os
+import sys
+
+# 添加專案根目錄到 Python 路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.config import Config
+from src.content_cache import ContentCache, file_sha256
+
+
+def test_duplicate_content_links_and_refcounts(tmp_path, monkeypatch):
+    """相同內容的第二份上傳應連結既有產物，最後一個引用釋放時才清除快取"""
+    monkeypatch.setattr(Config, 'OCR_DIR', str(tmp_path / 'ocr'))
+    monkeypatch.setattr(Config, 'SUMMARY_DIR', str(tmp_path / 'summaries'))
+    os.makedirs(Config.OCR_DIR)
+    os.makedirs(Config.SUMMARY_DIR)
+    cache = ContentCache(db_path=str(tmp_path / 'cache' / 'refs.db'), cache_dir=str(tmp_path / 'cache'))
+
+    pdf_path = tmp_path / 'notes.pdf'
+    pdf_path.write_bytes(b'%PDF-1.4 same content')
+    content_hash = file_sha256(str(pdf_path))
+
+    ocr_path = os.path.join(Config.OCR_DIR, 'notes.txt')
+    summary_path = os.path.join(Config.SUMMARY_DIR, 'notes.txt')
+    with open(ocr_path, 'w', encoding='utf-8') as f:
+        f.write('OCR 文字')
+    with open(summary_path, 'w', encoding='utf-8') as f:
+        f.write('摘要')
+
+    assert not cache.has_artifacts(content_hash)
+    cache.store(content_hash, 'notes.pdf', ocr_path, summary_path)
+    assert cache.has_artifacts(content_hash)
+
+    linked_ocr, linked_summary = cache.link(content_hash, 'notes_1.pdf')
+    with open(linked_ocr, encoding='utf-8') as f:
+        assert f.read() == 'OCR 文字'
+    assert cache.ref_count(content_hash) == 2
+
+    # 改寫其中一個檔名的 OCR 文字（例如修正後重新索引）不影響快取與其他檔名
+    with open(linked_ocr, 'w', encoding='utf-8') as f:
+        f.write('修正後的 OCR 文字')
+    assert cache.read_ocr_text(content_hash) == 'OCR 文字'
+    with open(ocr_path, encoding='utf-8') as f:
+        assert f.read() == 'OCR 文字'
+
+    # 刪除原始檔的產物不影響重複上傳的檔案
+    os.remove(ocr_path)
+    assert cache.release('notes.pdf') is False
+    assert cache.has_artifacts(content_hash)
+    assert os.path.exists(linked_ocr)
+
+    assert cache.release('notes_1.pdf') is True
+    assert not cache.has_artifacts(content_hash)
+    assert cache.get_hash('notes_1.pdf') is None
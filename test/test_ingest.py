@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+以 stub 的擷取、摘要、向量化階段測試批次匯入管線：成功、中間階段失敗與各階段的並行上限
+"""
+
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+# 添加專案根目錄到 Python 路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.config import Config
+from src.ingest import IngestPipeline, main
+from src.writer_lock import WriterLock
+
+
+class StageStub:
+    """記錄呼叫次數與最大同時執行數的假階段，filename 在 failing 中時拋出例外"""
+
+    def __init__(self, delay=0.05, failing=(), on_call=None):
+        self.delay = delay
+        self.failing = set(failing)
+        self.on_call = on_call
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def run(self, filename, output_dir=None, content=''):
+        with self._lock:
+            self.calls.append(filename)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.on_call:
+                self.on_call(filename)
+            time.sleep(self.delay)
+            if filename in self.failing:
+                raise Exception(f'{filename} 處理失敗')
+            path = None
+            if output_dir:
+                path = os.path.join(output_dir, os.path.splitext(filename)[0] + '.txt')
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(content)
+            return path, content
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+class StubOCRReader:
+    def __init__(self, stage):
+        self.stage = stage
+
+    def process_pdf(self, pdf_path, filename, output_dir=None):
+        return self.stage.run(filename, output_dir, f'{filename} 的內容')
+
+
+class StubSummarizer:
+    def __init__(self, stage):
+        self.stage = stage
+
+    def create_summary(self, text, filename, output_dir=None):
+        return self.stage.run(filename, output_dir, f'{filename} 的摘要')
+
+
+class StubVectorStore:
+    """只提供管線需要的 catalog 與 add_document"""
+
+    def __init__(self, catalog, stage):
+        self.catalog = catalog
+        self.stage = stage
+
+    def add_document(self, text, filename, content_hash=None):
+        self.stage.run(filename)
+        self.catalog.begin_indexing(filename, 1, content_hash)
+        self.catalog.mark_ready(filename)
+        return True
+
+
+@pytest.fixture
+def make_pipeline(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'TENANTS_DIR', str(tmp_path / 'tenants'))
+    monkeypatch.setattr(Config, 'VECTOR_BACKEND', 'local')
+
+    def make(extract, summary, embedding, **workers):
+        pipeline = IngestPipeline(tenant_id='ingest-test', **workers)
+        for directory in (pipeline.paths.pdf_dir, pipeline.paths.ocr_dir, pipeline.paths.summary_dir):
+            os.makedirs(directory, exist_ok=True)
+        pipeline.ocr_reader = StubOCRReader(extract)
+        pipeline.summarizer = StubSummarizer(summary)
+        pipeline.vector_store = StubVectorStore(pipeline.vector_store.catalog, embedding)
+        return pipeline
+
+    return make
+
+
+def write_pdfs(directory, names):
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for name in names:
+        path = os.path.join(directory, name)
+        with open(path, 'wb') as f:
+            f.write(f'%PDF-1.4 {name}'.encode('utf-8'))
+        paths.append(path)
+    return paths
+
+
+def test_pipeline_ingests_all_documents(make_pipeline, tmp_path):
+    extract, summary, embedding = StageStub(), StageStub(), StageStub()
+    pipeline = make_pipeline(extract, summary, embedding)
+    pdf_paths = write_pdfs(str(tmp_path / 'inbox'), [f'lecture{i}.pdf' for i in range(4)])
+
+    results = pipeline.run(pdf_paths)
+
+    assert sorted(results['completed']) == [f'lecture{i}.pdf' for i in range(4)]
+    assert results['failed'] == []
+    assert sorted(embedding.calls) == sorted(results['completed'])
+    assert pipeline.stage_stats['summary']['count'] == 4
+    assert pipeline.vector_store.catalog.get('lecture0.pdf')['status'] == 'ready'
+
+    # 重新執行時已完成的文件直接略過
+    rerun = make_pipeline(StageStub(), StageStub(), StageStub()).run(pdf_paths)
+    assert sorted(rerun['resumed']) == sorted(results['completed'])
+
+
+def test_failing_middle_stage_marks_item_failed(make_pipeline, tmp_path):
+    extract, summary, embedding = StageStub(), StageStub(failing={'broken.pdf'}), StageStub()
+    pipeline = make_pipeline(extract, summary, embedding)
+    pdf_paths = write_pdfs(str(tmp_path / 'inbox'), ['good.pdf', 'broken.pdf', 'other.pdf'])
+
+    results = pipeline.run(pdf_paths)
+
+    # 失敗的文件不進入向量化階段，其他文件照常完成，run() 仍然回傳
+    assert results['failed'] == ['broken.pdf']
+    assert sorted(results['completed']) == ['good.pdf', 'other.pdf']
+    assert 'broken.pdf' not in embedding.calls
+    assert pipeline.vector_store.catalog.get('broken.pdf') is None
+
+
+def test_stages_respect_their_worker_limits(make_pipeline, tmp_path):
+    extract, summary, embedding = StageStub(delay=0.02), StageStub(delay=0.1), StageStub(delay=0.02)
+    pipeline = make_pipeline(extract, summary, embedding, ocr_workers=2, summary_workers=3, embed_workers=1)
+    pdf_paths = write_pdfs(str(tmp_path / 'inbox'), [f'lecture{i}.pdf' for i in range(8)])
+
+    results = pipeline.run(pdf_paths)
+
+    assert len(results['completed']) == 8
+    assert extract.max_in_flight <= 2
+    assert 1 < summary.max_in_flight <= 3
+    assert embedding.max_in_flight == 1
+
+
+def test_pdfs_enter_pdf_dir_only_after_indexing(make_pipeline, tmp_path):
+    seen_in_pdf_dir = []
+    extract, summary, embedding = StageStub(), StageStub(failing={'broken.pdf'}), StageStub()
+    pipeline = make_pipeline(extract, summary, embedding)
+    # 匯入期間 Web 應用掃描 PDF 目錄時不應看到尚未索引的檔案
+    summary.on_call = lambda filename: seen_in_pdf_dir.extend(os.listdir(pipeline.paths.pdf_dir))
+    pdf_paths = write_pdfs(str(tmp_path / 'inbox'), ['good.pdf', 'broken.pdf'])
+
+    results = pipeline.run(pdf_paths)
+
+    assert results['completed'] == ['good.pdf']
+    assert 'broken.pdf' not in seen_in_pdf_dir
+    assert sorted(os.listdir(pipeline.paths.pdf_dir)) == ['good.pdf']
+
+
+def test_cli_refuses_to_run_while_data_dir_is_locked(tmp_path):
+    inbox = str(tmp_path / 'inbox')
+    write_pdfs(inbox, ['notes.pdf'])
+    web_app_lock = WriterLock()
+    assert web_app_lock.acquire()
+    try:
+        assert main([inbox]) == 2
+        assert not os.path.exists(os.path.join(Config.PDF_DIR, 'notes.pdf'))
+    finally:
+        web_app_lock.release()
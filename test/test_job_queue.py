@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+測試背景處理工作佇列
+"""
+
+import os
+import sqlite3
+import sys
+import time
+
+# 添加專案根目錄到 Python 路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.config import Config
+from src.job_queue import JOB_REINDEX, JobQueue
+
+
+def _wait_for(queue, job_id, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = queue.get_job(job_id)
+        if job['status'] in ('completed', 'failed'):
+            return job
+        time.sleep(0.05)
+    return queue.get_job(job_id)
+
+
+def test_enqueue_and_stage_progress(tmp_path):
+    """工作完成後每個階段都應標記為 done"""
+    queue = JobQueue(db_path=str(tmp_path / 'jobs.db'))
+
+    def handler(job, stage):
+        for name in ('ocr', 'summary', 'embedding'):
+            stage(name)
+
+    job_id = queue.enqueue('notes.pdf', '/tmp/notes.pdf')
+    assert queue.get_job(job_id)['status'] == 'queued'
+
+    queue.start(handler, num_workers=2)
+    try:
+        job = _wait_for(queue, job_id)
+    finally:
+        queue.stop(timeout=5)
+
+    assert job['status'] == 'completed'
+    assert job['stages'] == {'ocr': 'done', 'summary': 'done', 'embedding': 'done'}
+    assert job['progress'] == 1.0
+
+
+def test_failed_stage_is_recorded(tmp_path):
+    """階段失敗時應記錄失敗階段與錯誤訊息"""
+    queue = JobQueue(db_path=str(tmp_path / 'jobs.db'))
+
+    def handler(job, stage):
+        stage('ocr')
+        stage('summary')
+        raise Exception('摘要生成失敗')
+
+    job_id = queue.enqueue('notes.pdf', '/tmp/notes.pdf')
+    queue.start(handler, num_workers=1)
+    try:
+        job = _wait_for(queue, job_id)
+    finally:
+        queue.stop(timeout=5)
+
+    assert job['status'] == 'failed'
+    assert job['error'] == '摘要生成失敗'
+    assert job['stages'] == {'ocr': 'done', 'summary': 'failed', 'embedding': 'pending'}
+
+
+def test_failed_file_is_not_requeued_until_retried(tmp_path):
+    """最近一次處理失敗的檔案不會被 enqueue_if_absent 自動重新排隊，明確重試後才會再處理"""
+    queue = JobQueue(db_path=str(tmp_path / 'jobs.db'))
+    job_id = queue.enqueue('notes.pdf', '/tmp/notes.pdf')
+    queue.claim_next()
+    queue.finish(job_id, error='OCR 文字提取失敗')
+
+    assert queue.enqueue_if_absent('notes.pdf', '/tmp/notes.pdf') == job_id
+    assert queue.get_active_job('notes.pdf') is None
+    latest = queue.get_latest_jobs(filenames=['notes.pdf', 'other.pdf'])
+    assert list(latest) == ['notes.pdf']
+    assert latest['notes.pdf']['status'] == 'failed'
+    assert latest['notes.pdf']['error'] == 'OCR 文字提取失敗'
+
+    retry_id = queue.enqueue('notes.pdf', '/tmp/notes.pdf')
+    assert queue.get_latest_jobs()['notes.pdf']['id'] == retry_id
+    assert queue.enqueue_if_absent('notes.pdf', '/tmp/notes.pdf') == retry_id
+
+
+def test_reindex_job_only_has_embedding_stage(tmp_path):
+    """重新索引工作只有向量化階段，且與同檔名的處理工作共用進行中檢查"""
+    queue = JobQueue(db_path=str(tmp_path / 'jobs.db'))
+    job_id = queue.enqueue('notes.pdf', '/data/ocr_texts/notes.txt', kind=JOB_REINDEX)
+
+    job = queue.get_job(job_id)
+    assert job['kind'] == JOB_REINDEX
+    assert job['stages'] == {'embedding': 'pending'}
+    assert queue.get_active_job('notes.pdf')['id'] == job_id
+    assert queue.enqueue_if_absent('notes.pdf', '/data/pdfs/notes.pdf') == job_id
+
+
+def test_queue_survives_restart(tmp_path, monkeypatch):
+    """中斷的工作在租約逾期後重新排隊；其他程序仍在執行的工作不受影響"""
+    monkeypatch.setattr(Config, 'JOB_LEASE_SECONDS', 0.2)
+    db_path = str(tmp_path / 'jobs.db')
+    queue = JobQueue(db_path=db_path)
+    job_id = queue.enqueue('notes.pdf', '/tmp/notes.pdf')
+    assert queue.claim_next()['id'] == job_id
+    assert queue.enqueue_if_absent('notes.pdf', '/tmp/notes.pdf') == job_id
+
+    # 另一個程序（第二個 web worker、命令列工具）啟動時不搶走租約仍有效的工作
+    other = JobQueue(db_path=db_path)
+    assert other.requeue_interrupted() == 0
+    assert other.claim_next() is None
+
+    # 原程序中斷不再續約：租約逾期後重新排隊
+    time.sleep(0.3)
+    restarted = JobQueue(db_path=db_path)
+    assert restarted.requeue_interrupted() == 1
+    assert restarted.get_job(job_id)['status'] == 'queued'
+
+
+def test_running_job_renews_its_lease(tmp_path, monkeypatch):
+    """執行時間超過租約長度的工作持續續約；失去租約的 worker 不覆寫新擁有者的結果"""
+    monkeypatch.setattr(Config, 'JOB_LEASE_SECONDS', 0.2)
+    db_path = str(tmp_path / 'jobs.db')
+    queue = JobQueue(db_path=db_path)
+    other = JobQueue(db_path=db_path)
+    job_id = queue.enqueue('notes.pdf', '/tmp/notes.pdf')
+    claimed = []
+
+    def handler(job, stage):
+        stage('ocr')
+        time.sleep(0.5)
+        claimed.append(other.claim_next())
+
+    queue.run_job(queue.claim_next(), handler)
+    assert claimed == [None]
+    assert queue.get_job(job_id)['status'] == 'completed'
+
+    # 租約逾期後被其他 worker 取走：原 worker 的結果不寫入
+    stale_id = queue.enqueue('slides.pdf', '/tmp/slides.pdf')
+    assert queue.claim_next()['id'] == stale_id
+    time.sleep(0.3)
+    assert other.claim_next()['id'] == stale_id
+    assert not queue.renew_lease(stale_id)
+    queue.finish(stale_id, error='逾時')
+    assert other.get_job(stale_id)['status'] == 'running'
+
+
+def test_jobs_are_scoped_to_tenants(tmp_path):
+    """不同 tenant 的同名檔案各自排隊；舊版資料表的工作歸入預設 tenant"""
+    db_path = str(tmp_path / 'jobs.db')
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        "CREATE TABLE jobs (id TEXT PRIMARY KEY, filename TEXT NOT NULL, file_path TEXT NOT NULL, status TEXT NOT NULL, "
+        "current_stage TEXT, stages TEXT NOT NULL, error TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+    )
+    conn.execute("INSERT INTO jobs VALUES ('old', 'notes.pdf', '/tmp/notes.pdf', 'queued', NULL, '{}', NULL, 0, 0)")
+    conn.commit()
+    conn.close()
+
+    queue = JobQueue(db_path=db_path)
+    assert queue.get_job('old')['tenant_id'] == Config.DEFAULT_TENANT
+    assert queue.get_job('old')['kind'] == 'ingest'
+    assert queue.enqueue_if_absent('notes.pdf', '/tmp/notes.pdf') == 'old'
+
+    alice_job = queue.enqueue_if_absent('notes.pdf', '/data/tenants/alice/pdfs/notes.pdf', 'alice')
+    assert alice_job != 'old'
+    assert queue.get_job(alice_job)['tenant_id'] == 'alice'
+    assert queue.get_active_job('notes.pdf', 'alice')['id'] == alice_job
+    assert queue.get_active_job('notes.pdf', 'bob') is None
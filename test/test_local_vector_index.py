@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+測試本機向量集合（記憶體映射向量檔 + 精確/HNSW 檢索）
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# 添加專案根目錄到 Python 路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conftest import FakeEmbeddingModel
+from src.bm25_index import BM25Index
+from src.document_catalog import DocumentCatalog
+from src.local_vector_index import LocalVectorCollection, faiss, matches_where
+from src.vector_store import VectorStore
+
+
+def random_vectors(count, dim=32, seed=0):
+    return np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32)
+
+
+def exact_top_k(vectors, query, k):
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    return list(np.argsort(-(normalized @ (query / np.linalg.norm(query))))[:k])
+
+
+def test_exact_search_matches_numpy_and_survives_reopen(tmp_path):
+    vectors = random_vectors(300)
+    collection = LocalVectorCollection(str(tmp_path))
+    collection.upsert(
+        ids=[f"c{i}" for i in range(300)],
+        embeddings=vectors,
+        documents=[f"片段{i}" for i in range(300)],
+        metadatas=[{'filename': f"doc{i % 3}.pdf", 'chunk_id': i} for i in range(300)]
+    )
+    query = random_vectors(1, seed=1)[0]
+
+    results = collection.query(query_embeddings=[query.tolist()], n_results=5)
+    assert results['ids'][0] == [f"c{i}" for i in exact_top_k(vectors, query, 5)]
+    assert results['documents'][0][0] == f"片段{exact_top_k(vectors, query, 1)[0]}"
+    assert results['distances'][0] == sorted(results['distances'][0])
+
+    reopened = LocalVectorCollection(str(tmp_path))
+    assert reopened.count() == 300
+    assert reopened.query(query_embeddings=[query.tolist()], n_results=5)['ids'] == results['ids']
+
+
+def test_upsert_delete_update_and_where(tmp_path):
+    collection = LocalVectorCollection(str(tmp_path))
+    vectors = random_vectors(6)
+    collection.upsert(
+        ids=['a0', 'a1', 'a2', 'b0', 'b1', 'b2'],
+        embeddings=vectors,
+        documents=['a0', 'a1', 'a2', 'b0', 'b1', 'b2'],
+        metadatas=[{'filename': name[0], 'chunk_id': int(name[1])} for name in ['a0', 'a1', 'a2', 'b0', 'b1', 'b2']]
+    )
+    # 覆寫後查詢得到新向量，舊向量不再出現
+    collection.upsert(ids=['a0'], embeddings=vectors[3:4], documents=['a0 new'], metadatas=[{'filename': 'a', 'chunk_id': 0}])
+    results = collection.query(query_embeddings=[vectors[3].tolist()], n_results=2, where={'filename': 'a'})
+    assert results['ids'][0][0] == 'a0'
+    assert results['documents'][0][0] == 'a0 new'
+
+    collection.update(ids=['a1'], metadatas=[{'total_chunks': 3}])
+    assert collection.get(ids=['a1'])['metadatas'][0] == {'filename': 'a', 'chunk_id': 1, 'total_chunks': 3}
+
+    collection.delete(where={'filename': 'b'})
+    assert sorted(collection.get(include=[])['ids']) == ['a0', 'a1', 'a2']
+    assert collection.get(where={'$and': [{'filename': 'a'}, {'chunk_id': {'$gte': 1}}]}, include=[])['ids'] == ['a1', 'a2']
+    embeddings = collection.get(ids=['a2'], include=['embeddings'])['embeddings']
+    assert np.allclose(embeddings[0], vectors[2] / np.linalg.norm(vectors[2]), atol=1e-6)
+
+
+def test_compaction_keeps_live_chunks(tmp_path):
+    collection = LocalVectorCollection(str(tmp_path))
+    vectors = random_vectors(2000)
+    collection.upsert(ids=[f"c{i}" for i in range(2000)], embeddings=vectors)
+    collection.delete(ids=[f"c{i}" for i in range(0, 2000, 2)])
+
+    # 一半的列失效後壓縮，slot 重新編號但查詢結果不變
+    assert collection._size == 1000
+    survivors = vectors[1::2]
+    query = random_vectors(1, seed=2)[0]
+    expected = [f"c{2 * i + 1}" for i in exact_top_k(survivors, query, 10)]
+    assert collection.query(query_embeddings=[query.tolist()], n_results=10)['ids'][0] == expected
+    assert LocalVectorCollection(str(tmp_path)).query(query_embeddings=[query.tolist()], n_results=10)['ids'][0] == expected
+
+
+@pytest.mark.skipif(faiss is None, reason="faiss is not installed")
+def test_hnsw_search_recall_and_filters(tmp_path):
+    vectors = random_vectors(3000)
+    collection = LocalVectorCollection(str(tmp_path), hnsw_threshold=1000)
+    collection.upsert(
+        ids=[f"c{i}" for i in range(3000)],
+        embeddings=vectors,
+        metadatas=[{'filename': 'even' if i % 2 == 0 else 'odd'} for i in range(3000)]
+    )
+    queries = random_vectors(20, seed=3)
+    results = collection.query(query_embeddings=queries.tolist(), n_results=10)
+    assert collection._hnsw is not None
+    recall = np.mean([
+        len(set(ids) & {f"c{i}" for i in exact_top_k(vectors, query, 10)}) / 10
+        for ids, query in zip(results['ids'], queries)
+    ])
+    assert recall >= 0.9
+
+    filtered = collection.query(query_embeddings=queries[:1].tolist(), n_results=10, where={'filename': 'odd'})
+    assert len(filtered['ids'][0]) == 10
+    assert all(int(chunk_id[1:]) % 2 == 1 for chunk_id in filtered['ids'][0])
+    assert os.path.exists(os.path.join(str(tmp_path), 'hnsw-0.index'))
+
+
+def test_matches_where_operators():
+    metadata = {'filename': 'a.pdf', 'page': 3}
+    assert matches_where(metadata, {'filename': {'$in': ['a.pdf', 'b.pdf']}})
+    assert matches_where(metadata, {'$or': [{'page': {'$gt': 5}}, {'filename': 'a.pdf'}]})
+    assert not matches_where(metadata, {'page': {'$lt': 3}})
+    assert not matches_where(metadata, {'missing': 'x'})
+
+
+def test_vector_store_runs_on_local_collection(tmp_path):
+    store = VectorStore(
+        embedding_model=FakeEmbeddingModel(),
+        catalog=DocumentCatalog(db_path=str(tmp_path / 'catalog.db')),
+        bm25_index=BM25Index(db_path=str(tmp_path / 'bm25.db')),
+        collection=LocalVectorCollection(str(tmp_path / 'vectors'))
+    )
+    text = "\n\n".join(f"第{i}節：特徵值{i}與矩陣的關係。" * 40 for i in range(5))
+    assert store.add_document(text, 'notes.pdf')
+    chunk_count = store.get_chunk_count()
+    assert chunk_count > 1
+
+    results = store.search('特徵值3', top_k=3)
+    assert results and all(result['metadata']['filename'] == 'notes.pdf' for result in results)
+
+    # 修改一段後增量重新索引，再刪除整份文檔
+    assert store.add_document(text.replace('特徵值3', '特徵植3'), 'notes.pdf')
+    assert store.get_chunk_count() == chunk_count
+    assert store.delete_document('notes.pdf')
+    assert store.collection.count() == 0
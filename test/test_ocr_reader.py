@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+測試 OCR 程序池：大小依設定或可用 CPU 數，所有文件共用同一個 spawn 程序池
+"""
+
+import os
+import sys
+
+import pytest
+
+# 添加專案根目錄到 Python 路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src import ocr_reader
+from src.config import Config
+from src.ocr_reader import OCRReader, available_cpus, ocr_pool_size
+
+
+@pytest.fixture
+def shared_pool(monkeypatch):
+    monkeypatch.setattr(ocr_reader, '_pool', None)
+    yield
+    if ocr_reader._pool is not None:
+        ocr_reader._pool.shutdown()
+
+
+def test_pool_size_follows_setting_or_available_cpus(monkeypatch):
+    monkeypatch.setattr(Config, 'OCR_WORKERS', 3)
+    assert ocr_pool_size() == 3
+    monkeypatch.setattr(Config, 'OCR_WORKERS', 0)
+    assert ocr_pool_size() == available_cpus()
+    assert 1 <= available_cpus() <= (os.cpu_count() or 1)
+
+
+def test_documents_share_one_spawn_pool(shared_pool, monkeypatch, tmp_path):
+    monkeypatch.setattr(Config, 'OCR_WORKERS', 2)
+    monkeypatch.setattr(Config, 'OCR_WINDOW_SIZE', 2)
+    reader = OCRReader()
+    missing_pdf = str(tmp_path / 'missing.pdf')
+
+    # 無法轉換的頁面回傳空字串，頁碼與順序不變
+    assert reader._ocr_pages(missing_pdf, [5, 1, 2, 3]) == {1: '', 2: '', 3: '', 5: ''}
+    pool = ocr_reader._pool
+    assert reader._ocr_pages(missing_pdf, [1]) == {1: ''}
+    assert OCRReader()._ocr_pages(missing_pdf, [2]) == {2: ''}
+
+    assert ocr_reader._pool is pool
+    assert pool._max_workers == 2
+    assert pool._mp_context.get_start_method() == 'spawn'
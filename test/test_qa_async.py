@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+測試非同步問答：檢索在執行緒池執行，並行的 LLM 等待不互相阻塞，OpenAI 以非同步客戶端串流
+"""
+
+import asyncio
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+# 添加專案根目錄到 Python 路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.config import Config
+from src.qa_service import QAService, openai
+
+
+def make_service():
+    service = QAService(vector_store=object(), smart_retrieval=object())
+    service.answer_cache = None
+    docs = [{'content': '內容', 'metadata': {'filename': 'a.pdf', 'chunk_index': 0, 'total_chunks': 1}, 'distance': 0.1}]
+    service._plan_answer = lambda question, filenames=None: {
+        'question': question, 'docs': docs, 'context': '內容',
+        'question_analysis': {'is_broad': False, 'complexity_score': 2}
+    }
+
+    async def astream_answer(plan):
+        await asyncio.sleep(0.2)
+        yield plan['question']
+        yield ' 的回答'
+
+    service._astream_answer = astream_answer
+    return service
+
+
+def test_concurrent_async_answers_share_the_event_loop():
+    service = make_service()
+
+    async def ask_all():
+        return await asyncio.gather(*[service.answer_question_async(f'問題 {i}') for i in range(50)])
+
+    start = time.perf_counter()
+    results = asyncio.run(ask_all())
+    elapsed = time.perf_counter() - start
+
+    assert results[7]['answer'] == '問題 7 的回答'
+    assert results[7]['sources'][0]['filename'] == 'a.pdf'
+    assert elapsed < 2.0  # 50 個 0.2 秒的 LLM 呼叫並行等待
+
+
+def test_async_stream_yields_same_events_as_sync_stream():
+    service = make_service()
+
+    async def collect():
+        return [event async for event in service.answer_question_stream_async('問題')]
+
+    events = asyncio.run(collect())
+    assert [event for event, _ in events] == ['sources', 'token', 'token', 'done']
+
+
+class FakeAsyncOpenAI:
+    """模擬 openai.AsyncOpenAI：chat.completions.create(stream=True) 回傳非同步的片段串流"""
+
+    instances = 0
+
+    def __init__(self, api_key=None):
+        FakeAsyncOpenAI.instances += 1
+        self.requests = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, **kwargs):
+        self.requests.append(kwargs)
+
+        async def stream():
+            for content in ['非同步', None, '回答']:
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+            yield SimpleNamespace(choices=[])
+
+        return stream()
+
+
+def test_openai_async_answer_uses_async_client(monkeypatch):
+    monkeypatch.setattr(Config, 'PROVIDER', 'openai')
+    monkeypatch.setattr(openai, 'AsyncOpenAI', FakeAsyncOpenAI)
+    service = make_service()
+    del service._astream_answer  # 使用真正的 OpenAI 串流路徑
+
+    async def ask_twice():
+        return [await service.answer_question_async(f'問題 {i}') for i in range(2)]
+
+    results = asyncio.run(ask_twice())
+    assert [result['answer'] for result in results] == ['非同步回答', '非同步回答']
+    assert FakeAsyncOpenAI.instances == 1  # 客戶端重複使用
+    request = service._async_openai.requests[0]
+    assert request['stream'] is True and request['model'] == Config.OPENAI_MODEL
+    assert request['messages'][-1]['role'] == 'user'
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+測試串流問答：事件順序、完整回答寫入快取、快取命中時的串流、OpenAI 串流客戶端
+"""
+
+import os
+import sys
+from types import SimpleNamespace
+
+# 添加專案根目錄到 Python 路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conftest import FakeVectorStore
+from src.answer_cache import AnswerCache
+from src.document_catalog import DocumentCatalog
+from src.config import Config
+from src.qa_service import QAService, openai
+
+
+def test_stream_sends_sources_before_tokens_and_caches_answer(tmp_path):
+    catalog = DocumentCatalog(db_path=str(tmp_path / 'catalog.db'))
+    service = QAService(vector_store=FakeVectorStore(catalog), smart_retrieval=object(), answer_cache=AnswerCache())
+    docs = [{'content': '內容', 'metadata': {'filename': 'a.pdf', 'chunk_index': 0, 'total_chunks': 1}, 'distance': 0.1}]
+    service._plan_answer = lambda question, filenames=None: {
+        'question': question, 'docs': docs, 'context': '內容',
+        'question_analysis': {'is_broad': False, 'complexity_score': 2}
+    }
+    service._stream_answer = lambda plan: iter(['第一段', '第二段'])
+
+    events = list(service.answer_question_stream('什麼是 CS101？'))
+
+    assert [event for event, _ in events] == ['sources', 'token', 'token', 'done']
+    assert events[0][1]['sources'][0]['filename'] == 'a.pdf'
+    assert 'answer' not in events[0][1]
+
+    service._stream_answer = None  # 快取命中時不應再呼叫 LLM
+    cached = list(service.answer_question_stream('什麼是 CS101？'))
+    assert cached[1] == ('token', {'text': '第一段第二段'})
+    assert cached[-1] == ('done', {'cached': True})
+    assert service.answer_question('什麼是 CS101？')['answer'] == '第一段第二段'
+
+
+class FakeOpenAI:
+    """模擬 openai.OpenAI：chat.completions.create(stream=True) 回傳片段串流，否則回傳完整回答"""
+
+    def __init__(self, api_key=None):
+        self.requests = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        self.requests.append(kwargs)
+        if not kwargs.get('stream'):
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=' 完整回答 '))])
+        chunks = [SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+                  for content in ['第一段', None, '第二段']]
+        return iter(chunks + [SimpleNamespace(choices=[])])
+
+
+def test_openai_stream_reads_delta_content(monkeypatch):
+    monkeypatch.setattr(Config, 'PROVIDER', 'openai')
+    monkeypatch.setattr(openai, 'OpenAI', FakeOpenAI)
+    service = QAService(vector_store=object(), smart_retrieval=object(), answer_cache=None)
+
+    pieces = list(service._stream_openai('system', 'prompt', 100))
+    assert pieces == ['第一段', '第二段']
+    assert service._openai.requests[0]['stream'] is True
+
+
+def test_openai_answers_use_the_same_client(monkeypatch):
+    monkeypatch.setattr(Config, 'PROVIDER', 'openai')
+    monkeypatch.setattr(openai, 'OpenAI', FakeOpenAI)
+    service = QAService(vector_store=object(), smart_retrieval=object(), answer_cache=None)
+
+    assert service._generate_answer_openai('問題', '上下文') == '完整回答'
+    assert service._generate_comprehensive_answer_openai('問題', '上下文', ['子問題']) == '完整回答'
+    assert list(service._stream_openai('system', 'prompt', 100)) == ['第一段', '第二段']
+    requests = service._openai.requests
+    assert [request.get('stream', False) for request in requests] == [False, False, True]
+    assert '上下文' in requests[0]['messages'][1]['content']
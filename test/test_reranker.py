@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+以假的 cross-encoder 測試重新排序階段
+"""
+
+import os
+import sys
+
+# 添加專案根目錄到 Python 路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conftest import FakeVectorStore
+from src.config import Config
+from src.reranker import Reranker
+from src.smart_retrieval import SmartRetrievalService
+
+
+class FakeCrossEncoder:
+    """以問題最後一個字在片段中出現的次數作為分數，並記錄 predict 的次數"""
+
+    def __init__(self):
+        self.predict_calls = 0
+        self.scored_pairs = 0
+
+    def predict(self, pairs, **kwargs):
+        self.predict_calls += 1
+        self.scored_pairs += len(pairs)
+        return [float(content.count(question[-1])) for question, content in pairs]
+
+
+def make_chunks():
+    # 向量距離最近的片段與問題無關，最相關的片段排在最後
+    contents = ['無關內容'] * 7 + ['甲乙', '甲甲甲']
+    return [
+        {
+            'id': f"notes.pdf_chunk_{i}",
+            'content': content,
+            'metadata': {'filename': 'notes.pdf', 'chunk_index': i},
+            'distance': 0.1 + i * 0.05
+        }
+        for i, content in enumerate(contents)
+    ]
+
+
+def test_rerank_promotes_relevant_candidates_in_one_batch(monkeypatch):
+    monkeypatch.setattr(Config, 'RERANK_CANDIDATES', 9)
+    model = FakeCrossEncoder()
+    store = FakeVectorStore(chunks=make_chunks())
+    retrieval = SmartRetrievalService(store, reranker=Reranker(model=model))
+
+    results = retrieval.adaptive_retrieval_many(['甲', '乙'])
+
+    # 兩個問題的候選在同一次推論中評分
+    assert model.predict_calls == 1
+    assert model.scored_pairs == 18
+    assert store.requested_top_k == [9]
+    assert [doc['id'] for doc in results[0][:2]] == ['notes.pdf_chunk_8', 'notes.pdf_chunk_7']
+    assert results[1][0]['id'] == 'notes.pdf_chunk_7'
+    assert len(results[0]) == Config.MIN_TOP_K
+    # 重新排序後以 cross-encoder 分數作為上下文挑選的相關度
+    assert retrieval.relevance_score(results[0][0]) == 3.0
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+以本地 stub LLM 測試並行分段摘要與階層式整合
+"""
+
+import os
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+# 添加專案根目錄到 Python 路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.config import Config
+from src.summarizer import Summarizer, openai
+
+
+class StubLLM:
+    """記錄呼叫次數與最大同時呼叫數的假 LLM"""
+
+    def __init__(self, delay=0.02, rate_limited_calls=0):
+        self.delay = delay
+        self.rate_limited_calls = rate_limited_calls
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.reduce_prompts = []
+        self._lock = threading.Lock()
+
+    def __call__(self, prompt, system_message, max_tokens):
+        with self._lock:
+            self.calls += 1
+            if '整合' in system_message:
+                self.reduce_prompts.append(prompt)
+            if self.rate_limited_calls > 0:
+                self.rate_limited_calls -= 1
+                raise Exception('429 Resource has been exhausted (e.g. check quota).')
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay)
+        with self._lock:
+            self.in_flight -= 1
+        return '摘要' * 200
+
+
+def test_map_stage_respects_concurrency_limit(monkeypatch):
+    monkeypatch.setattr(Config, 'SUMMARY_CONCURRENCY', 3)
+    llm = StubLLM()
+    summarizer = Summarizer(llm=llm)
+
+    summary = summarizer._create_long_text_summary('文' * 6000 * 12)
+
+    assert summary
+    assert 1 < llm.max_in_flight <= 3
+
+
+def test_reduce_prompts_stay_under_reduce_limit(monkeypatch):
+    monkeypatch.setattr(Config, 'SUMMARY_CONCURRENCY', 4)
+    monkeypatch.setattr(Config, 'SUMMARY_REDUCE_MAX_CHARS', 1000)
+    llm = StubLLM(delay=0)
+    summarizer = Summarizer(llm=llm)
+    template = StubLLM(delay=0)
+    Summarizer(llm=template)._create_final_summary('')
+    template_length = len(template.reduce_prompts[0])
+
+    summarizer._create_long_text_summary('文' * 6000 * 20)
+
+    # 20 段摘要（每段 400 字）每層兩兩整合：第一層 10 組加上最終整合共 11 次，超過代表至少整合了兩層
+    assert len(llm.reduce_prompts) > 11
+    # 每個整合 prompt 只包含不超過上限的摘要內容（加上固定的指示文字）
+    assert all(len(prompt) <= Config.SUMMARY_REDUCE_MAX_CHARS + template_length for prompt in llm.reduce_prompts)
+
+
+def test_rate_limit_is_retried(monkeypatch):
+    monkeypatch.setattr(Config, 'SUMMARY_RETRY_BASE_DELAY', 0.001)
+    llm = StubLLM(delay=0, rate_limited_calls=2)
+    summarizer = Summarizer(llm=llm)
+
+    summary = summarizer._create_short_text_summary('短文本')
+
+    assert summary == '摘要' * 200
+    assert llm.calls == 3
+
+
+def test_openai_summaries_use_the_1x_client(monkeypatch):
+    requests = []
+
+    class FakeOpenAI:
+        def __init__(self, api_key=None):
+            self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+        def create(self, **kwargs):
+            requests.append(kwargs)
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=' 摘要 '))])
+
+    monkeypatch.setattr(Config, 'PROVIDER', 'openai')
+    monkeypatch.setattr(openai, 'OpenAI', FakeOpenAI)
+    summarizer = Summarizer()
+
+    assert summarizer._call_llm('prompt', 'system', 100) == '摘要'
+    assert summarizer._call_llm('prompt', 'system', 100) == '摘要'
+    assert requests[0]['messages'] == [{'role': 'system', 'content': 'system'}, {'role': 'user', 'content': 'prompt'}]
+    assert requests[0]['max_tokens'] == 100
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+測試多租戶：tenant 資料隔離、延遲開啟與 LRU 關閉
+"""
+
+import os
+import sys
+
+import pytest
+
+# 添加專案根目錄到 Python 路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conftest import FakeEmbeddingModel
+from src import services
+from src.config import Config
+from src.tenants import Tenant, TenantPaths, TenantRegistry, tenant_from_headers, validate_tenant_id
+
+
+class FakeUpload:
+    """模擬 werkzeug 的上傳檔案"""
+
+    def __init__(self, filename, content):
+        self.filename = filename
+        self.content = content
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(self.content)
+
+
+class FakeTenant:
+    def __init__(self, tenant_id, executor=None):
+        self.tenant_id = tenant_id
+        self.leases = 0
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def tenant_env(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'TENANTS_DIR', str(tmp_path / 'tenants'))
+    monkeypatch.setitem(services._instances, 'embedding_model', FakeEmbeddingModel(dim=64, per_char=True))
+    return tmp_path
+
+
+def make_registry(max_open):
+    return TenantRegistry(default_tenant=FakeTenant(Config.DEFAULT_TENANT), max_open=max_open, factory=FakeTenant)
+
+
+def test_validate_tenant_id():
+    assert validate_tenant_id('team-a_01') == 'team-a_01'
+    for tenant_id in ['', '../etc', 'a/b', '-a', 'x' * 65, None]:
+        with pytest.raises(ValueError):
+            validate_tenant_id(tenant_id)
+
+
+def test_tenant_header_is_ignored_unless_trusted(monkeypatch):
+    headers = {Config.TENANT_HEADER: 'other-team'}
+    # 預設不採用客戶端自帶的標頭，請求一律屬於預設 tenant
+    monkeypatch.setattr(Config, 'TRUST_TENANT_HEADER', False)
+    assert tenant_from_headers(headers) == Config.DEFAULT_TENANT
+    assert tenant_from_headers({Config.TENANT_HEADER: '../etc'}) == Config.DEFAULT_TENANT
+
+    monkeypatch.setattr(Config, 'TRUST_TENANT_HEADER', True)
+    assert tenant_from_headers(headers) == 'other-team'
+    assert tenant_from_headers({}) == Config.DEFAULT_TENANT
+    with pytest.raises(ValueError):
+        tenant_from_headers({Config.TENANT_HEADER: '../etc'})
+
+
+def test_registry_opens_lazily_and_closes_least_recently_used():
+    registry = make_registry(max_open=2)
+    assert registry.stats()['open'] == []
+    assert registry.acquire(None) is registry.default
+
+    tenants = {}
+    for tenant_id in ['a', 'b', 'a', 'c']:
+        with registry.use(tenant_id) as tenant:
+            tenants[tenant_id] = tenant
+
+    # b 最久未使用，開啟 c 時被關閉；預設 tenant 不計入上限
+    assert tenants['b'].closed
+    assert not tenants['a'].closed and not tenants['c'].closed
+    assert registry.stats()['open'] == ['a', 'c']
+    assert registry.stats()['opened'] == 3
+
+    # 再次使用已關閉的 tenant 時重新開啟
+    with registry.use('b') as tenant:
+        assert tenant is not tenants['b']
+    assert tenants['a'].closed
+    assert registry.stats()['closed'] == 2
+
+
+def test_evicted_tenant_closes_after_last_release():
+    registry = make_registry(max_open=1)
+    busy = registry.acquire('a')
+    with registry.use('b'):
+        pass
+    # a 被逐出時仍在使用中：延後到歸還時才關閉
+    assert registry.stats()['closing'] == ['a']
+    assert not busy.closed
+    registry.release(busy)
+    assert busy.closed
+    assert registry.stats()['closing'] == []
+
+    # 關閉前再次取用時沿用同一個 tenant，不會被關閉
+    busy = registry.acquire('c')
+    registry.acquire('d')
+    assert registry.acquire('c') is busy
+    registry.release(busy)
+    registry.release(busy)
+    assert not busy.closed
+
+
+@pytest.mark.parametrize('backend', ['local', 'chroma'])
+def test_tenants_keep_same_filename_apart(tenant_env, monkeypatch, backend):
+    monkeypatch.setattr(Config, 'VECTOR_BACKEND', backend)
+    alice, bob = Tenant('alice'), Tenant('bob')
+    assert alice.paths.root == os.path.join(Config.TENANTS_DIR, 'alice')
+    assert TenantPaths(Config.DEFAULT_TENANT).pdf_dir == Config.PDF_DIR
+
+    # 兩個 tenant 上傳同名檔案，各自保留原檔名與內容
+    alice_path, alice_name = alice.file_handler.save_pdf(FakeUpload('notes.pdf', b'alice'))
+    bob_path, bob_name = bob.file_handler.save_pdf(FakeUpload('notes.pdf', b'bob'))
+    assert alice_name == bob_name == 'notes.pdf'
+    assert alice_path != bob_path
+    with open(alice_path, 'rb') as f:
+        assert f.read() == b'alice'
+
+    alice_text = "\n\n".join(f"第{i}節：線性代數的特徵值與特徵向量。" * 30 for i in range(3))
+    bob_text = "\n\n".join(f"第{i}節：有機化學的官能基與反應。" * 30 for i in range(3))
+    assert alice.vector_store.add_document(alice_text, 'notes.pdf')
+    assert bob.vector_store.add_document(bob_text, 'notes.pdf')
+
+    results = alice.vector_store.hybrid_search('特徵值', top_k=10)
+    assert results and all('特徵值' in result['content'] for result in results)
+
+    # 刪除只影響自己的 tenant
+    alice_chunks = alice.vector_store.get_chunk_count()
+    assert bob.vector_store.delete_document('notes.pdf')
+    assert bob.vector_store.get_chunk_count() == 0
+    assert alice.vector_store.get_chunk_count() == alice_chunks
+    assert alice.vector_store.catalog.get('notes.pdf') is not None
+
+    # 關閉後重新開啟，資料仍在
+    alice.close()
+    bob.close()
+    reopened = Tenant('alice')
+    assert reopened.vector_store.search('特徵值', top_k=1)[0]['metadata']['filename'] == 'notes.pdf'
+    reopened.close()
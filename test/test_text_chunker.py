@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+測試共用的文本分塊引擎
+"""
+
+import os
+import sys
+
+# 添加專案根目錄到 Python 路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.text_chunker import TextChunker
+from src.token_counter import HeuristicTokenCounter
+
+
+def test_chunks_end_at_sentence_boundaries_and_always_advance():
+    text = "\n\n".join(
+        "".join(f"第{p}段第{s}句說明矩陣與向量空間的關係。" for s in range(12)) for p in range(10)
+    )
+    chunks = TextChunker(300, 200).split(text)
+
+    assert all(len(chunk) <= 300 for chunk in chunks)
+    assert all(chunk.endswith('。') for chunk in chunks)
+    # 每塊至少帶來一半的新內容，不會產生近乎重複的片段
+    positions = [text.index(chunk) for chunk in chunks]
+    assert all(b - a >= len(chunks[i]) // 2 for i, (a, b) in enumerate(zip(positions, positions[1:])))
+    assert chunks[-1] == text[-len(chunks[-1]):]
+
+
+def test_unpunctuated_text_is_hard_split_without_gaps():
+    text = "無標點的掃描文字" * 500
+    chunks = TextChunker(1000, 0).split(text)
+
+    assert "".join(chunks) == text
+    assert [len(chunk) for chunk in chunks] == [1000] * 4
+
+
+def test_token_unit_respects_token_budget():
+    counter = HeuristicTokenCounter()
+    text = " ".join(f"Eigenvalues of matrix {i} are computed by the characteristic polynomial." for i in range(200))
+    chunks = TextChunker(120, 30, token_counter=counter).split(text)
+
+    assert len(chunks) > 1
+    assert all(counter.count(chunk) <= 120 for chunk in chunks)
+    assert all(chunk.endswith('.') for chunk in chunks)
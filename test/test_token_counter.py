@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+測試 token 計數與依相關度的 token 預算管理
+"""
+
+import os
+import sys
+
+# 添加專案根目錄到 Python 路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.config import Config
+from src.smart_retrieval import SmartRetrievalService
+from src.token_counter import HeuristicTokenCounter
+
+
+def test_heuristic_counter_counts_cjk_per_character():
+    counter = HeuristicTokenCounter()
+    assert counter.count('線性代數') == 4
+    assert counter.count('eigenvalue') == 3
+    # len // 4 的舊估算會把中文低估成 1/4
+    assert counter.count('矩陣的特徵值與特徵向量') > len('矩陣的特徵值與特徵向量') // 4
+    assert counter.count(counter.truncate('矩陣的特徵值與特徵向量' * 10, 15)) <= 15
+
+
+def test_relevance_packing_stays_within_budget_and_keeps_order(monkeypatch):
+    monkeypatch.setattr(Config, 'MAX_CONTEXT_TOKENS', 600)
+    monkeypatch.setattr(Config, 'CONTEXT_PACKING', 'relevance')
+    counter = HeuristicTokenCounter()
+    retrieval = SmartRetrievalService(vector_store=object(), token_counter=counter)
+
+    parts = ['甲' * 90, '乙' * 40, '丙' * 40]
+    scores = [0.5, 0.8, 0.7]
+    token_counts = counter.count_many(parts)
+    budget = 600 - counter.count('問題') - 500
+
+    # 依每 token 相關度：兩個較短且較相關的片段勝過一個長片段，並維持原本順序
+    context = retrieval.manage_token_budget(parts, '問題', token_counts, scores)
+    assert context == '乙' * 40 + '\n\n' + '丙' * 40
+    assert counter.count(context) <= budget
+
+    # greedy：依檢索順序放入，剩餘空間不足以截斷下一個片段
+    monkeypatch.setattr(Config, 'CONTEXT_PACKING', 'greedy')
+    assert retrieval.manage_token_budget(parts, '問題', token_counts, scores) == '甲' * 90
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+以假的嵌入模型與暫存 ChromaDB 測試 VectorStore
+"""
+
+import os
+import sys
+import time
+
+import chromadb
+import pytest
+from chromadb.config import Settings
+
+# 添加專案根目錄到 Python 路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conftest import FakeEmbeddingModel
+from src.config import Config
+from src.bm25_index import BM25Index
+from src.document_catalog import DocumentCatalog, parse_scope
+from src.vector_store import VectorStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    client = chromadb.PersistentClient(path=str(tmp_path / 'chroma'), settings=Settings(anonymized_telemetry=False))
+    catalog = DocumentCatalog(db_path=str(tmp_path / 'catalog.db'))
+    bm25_index = BM25Index(db_path=str(tmp_path / 'bm25.db'))
+    return VectorStore(client=client, embedding_model=FakeEmbeddingModel(), catalog=catalog, bm25_index=bm25_index)
+
+
+def test_search_reuses_cached_query_embeddings(store):
+    store.add_document('機器學習是人工智慧的一個分支。' * 50, 'notes.pdf')
+    model = store.embedding_model
+    calls_after_ingest = model.encode_calls
+
+    for _ in range(3):
+        assert store.search('主要內容是什麼？', top_k=2)
+    store.search('  主要內容是什麼？ ', top_k=2)
+
+    assert model.encode_calls == calls_after_ingest + 1
+    stats = store.query_cache.stats()
+    assert stats['hits'] == 3
+    assert stats['misses'] == 1
+
+
+def test_query_cache_is_bounded(store):
+    store.query_cache.max_size = 2
+    for query in ('a', 'b', 'c'):
+        store.embed_query(query)
+    assert store.query_cache.stats()['size'] == 2
+    # 最舊的項目已被淘汰
+    assert store.query_cache.get(Config.LOCAL_EMBEDDING_MODEL, 'a') is None
+
+
+def test_get_chunks_returns_requested_order_in_one_call(store):
+    store.add_document('第一段內容。' * 400, 'notes.pdf')
+    ids = ['notes.pdf_chunk_2', 'missing_chunk_0', 'notes.pdf_chunk_0', 'notes.pdf_chunk_2']
+
+    chunks = store.get_chunks(ids)
+
+    assert [chunk['id'] for chunk in chunks] == ['notes.pdf_chunk_2', 'notes.pdf_chunk_0']
+    assert [chunk['id'] for chunk in store.get_adjacent_chunks('notes.pdf', 1)] == [
+        'notes.pdf_chunk_0', 'notes.pdf_chunk_2'
+    ]
+
+
+def test_catalog_tracks_documents_without_scanning(store):
+    store.add_document('內容。' * 600, 'a.pdf', content_hash='abc')
+    store.add_document('內容。' * 300, 'b.pdf')
+
+    assert sorted(store.get_document_list()) == ['a.pdf', 'b.pdf']
+    assert store.get_chunk_count() == store.collection.count()
+    assert store.catalog.get('a.pdf')['content_hash'] == 'abc'
+
+    store.delete_document('a.pdf')
+    assert store.get_document_list() == ['b.pdf']
+    assert store.get_chunk_count() == store.collection.count()
+
+
+def test_catalog_is_rebuilt_for_existing_collections(store, tmp_path):
+    store.add_document('內容。' * 600, 'a.pdf')
+    fresh = VectorStore(
+        client=store.client, embedding_model=store.embedding_model,
+        catalog=DocumentCatalog(db_path=str(tmp_path / 'new_catalog.db')), bm25_index=store.bm25_index
+    )
+    assert fresh.get_document_list() == ['a.pdf']
+    assert fresh.get_chunk_count() == store.collection.count()
+
+
+def test_add_document_embeds_in_fixed_batches(store, monkeypatch):
+    monkeypatch.setattr(Config, 'EMBEDDING_BATCH_SIZE', 4)
+    model = store.embedding_model
+
+    assert store.add_document('這是一個很長的句子。' * 1000, 'long.pdf')
+
+    total = store.catalog.get('long.pdf')['chunk_count']
+    assert total > 4
+    assert model.encode_calls == -(-total // 4)
+    assert store.collection.count() == total
+
+
+def test_hybrid_search_finds_exact_terms(store):
+    filler = '這份筆記討論了許多一般性的主題與概念。' * 80
+    store.add_document(filler + '期末考範圍包含 CS101 與貝氏定理。' + filler, 'course.pdf')
+    store.add_document('完全無關的內容。' * 300, 'other.pdf')
+
+    results = store.hybrid_search('CS101', top_k=3)
+
+    assert 'CS101' in results[0]['content']
+    assert results[0]['bm25_rank'] == 1
+    assert 'distance' in results[0]
+
+    store.delete_document('course.pdf')
+    assert store.bm25_index.search('CS101') == []
+
+
+def test_search_many_embeds_all_queries_in_one_call(store):
+    store.add_document('第一章 線性代數。' * 200 + '第二章 機率論。' * 200, 'notes.pdf')
+    model = store.embedding_model
+    calls_after_ingest = model.encode_calls
+
+    queries = ['線性代數', '機率論', '線性代數']
+    batched = store.hybrid_search_many(queries, top_k=3)
+
+    assert model.encode_calls == calls_after_ingest + 1
+    assert len(batched) == 3
+    assert [doc['id'] for doc in batched[0]] == [doc['id'] for doc in store.hybrid_search('線性代數', top_k=3)]
+
+
+def test_add_document_records_token_counts(store):
+    store.add_document('矩陣與特徵值。' * 300, 'tokens.pdf')
+
+    chunk = store.get_chunk_by_id('tokens.pdf_chunk_0')
+    assert chunk['metadata']['token_counter'] == store.token_counter.name
+    assert chunk['metadata']['token_count'] == store.token_counter.count(chunk['content'])
+
+
+def test_add_document_reembeds_only_changed_chunks(store):
+    paragraphs = [f"第{p}段：" + f"矩陣與向量空間的性質{p}。" * 40 for p in range(12)]
+    store.add_document('\n\n'.join(paragraphs), 'edit.pdf')
+    model = store.embedding_model
+    total_chunks = store.get_chunk_count()
+    encoded_after_ingest = model.encoded_texts
+
+    # 修正中間一段的 OCR 錯字
+    paragraphs[6] = paragraphs[6].replace('向量空間', '向量空閒', 1)
+    assert store.add_document('\n\n'.join(paragraphs), 'edit.pdf')
+
+    assert 0 < model.encoded_texts - encoded_after_ingest <= 2
+    assert store.get_chunk_count() == total_chunks
+    assert store.bm25_index.search('空閒')
+
+    # 刪掉最後幾段：多出來的舊片段從向量資料庫與 BM25 索引移除，只有新的最後一塊需要重新嵌入
+    encoded_before_truncate = model.encoded_texts
+    assert store.add_document('\n\n'.join(paragraphs[:6]), 'edit.pdf')
+    remaining = store.collection.get(where={"filename": 'edit.pdf'}, include=["metadatas"])
+    assert model.encoded_texts - encoded_before_truncate <= 1
+    assert len(remaining['ids']) < total_chunks
+    assert all(metadata['total_chunks'] == len(remaining['ids']) for metadata in remaining['metadatas'])
+    assert {chunk_id for chunk_id, _ in store.bm25_index.search('矩陣', top_k=20)} <= set(remaining['ids'])
+
+
+def test_failed_reindex_keeps_catalog_entry(store, monkeypatch):
+    paragraphs = [f"第{p}段：" + f"線性代數的基底與維度{p}。" * 40 for p in range(4)]
+    store.add_document('\n\n'.join(paragraphs), 'n.pdf')
+    store.catalog.set_tags('n.pdf', ['期中'])
+    before = store.catalog.get('n.pdf')
+
+    def failing_encode(texts, **kwargs):
+        raise RuntimeError('embedding failed')
+
+    monkeypatch.setattr(store.embedding_model, 'encode', failing_encode)
+    paragraphs[1] = paragraphs[1].replace('基底', '基低', 1)
+    assert not store.add_document('\n\n'.join(paragraphs), 'n.pdf')
+
+    # 既有片段仍可檢索，文檔紀錄保留上傳時間、標籤與原本的片段數
+    after = store.catalog.get('n.pdf')
+    assert after['status'] == 'ready'
+    assert after['chunk_count'] == before['chunk_count']
+    assert after['uploaded_at'] == before['uploaded_at'] and after['tags'] == ['期中']
+    assert store.catalog.resolve_scope({'tags': ['期中']}) == ['n.pdf']
+
+    # 新文檔寫入失敗時不留下紀錄
+    assert not store.add_document('機率論。' * 100, 'new.pdf')
+    assert store.catalog.get('new.pdf') is None
+
+
+def test_failed_batch_removes_partially_written_document(store, monkeypatch):
+    monkeypatch.setattr(Config, 'EMBEDDING_BATCH_SIZE', 4)
+    store.add_document('傅立葉轉換的定義與性質。' * 100, 'fourier.pdf')
+    chunks = store.get_chunk_count()
+    encode = store.embedding_model.encode
+    calls = []
+
+    def failing_second_batch(texts, **kwargs):
+        calls.append(len(texts))
+        if len(calls) == 2:
+            raise RuntimeError('embedding failed')
+        return encode(texts, **kwargs)
+
+    monkeypatch.setattr(store.embedding_model, 'encode', failing_second_batch)
+    assert not store.add_document('矩陣的秩與行列式。' * 1000, 'matrix.pdf')
+
+    # 第一批已寫入的片段被清除，檢索不會回傳文檔目錄中沒有的片段
+    assert len(calls) == 2
+    assert store.catalog.get('matrix.pdf') is None
+    assert store.get_chunk_count() == chunks
+    assert store.collection.get(where={'filename': 'matrix.pdf'})['ids'] == []
+    assert store.bm25_index.search('矩陣', top_k=20) == []
+    assert all(result['metadata']['filename'] == 'fourier.pdf' for result in store.hybrid_search('矩陣', top_k=10))
+
+
+def test_failed_delete_restores_document(store, monkeypatch):
+    store.add_document('傅立葉轉換的定義與性質。' * 100, 'fourier.pdf')
+    chunks = store.get_chunk_count()
+
+    def failing_delete(**kwargs):
+        raise RuntimeError('delete failed')
+
+    monkeypatch.setattr(store.collection, 'delete', failing_delete)
+    assert not store.delete_document('fourier.pdf')
+    # 片段仍可檢索，文檔也仍在清單中（不會永遠停在刪除中）
+    assert store.get_document_list() == ['fourier.pdf']
+    assert store.get_chunk_count() == chunks
+    monkeypatch.undo()
+
+    # 程序在刪除途中中斷：下次開啟時完成刪除
+    store.catalog.mark_deleting('fourier.pdf')
+    reopened = VectorStore(client=store.client, embedding_model=store.embedding_model,
+                           catalog=store.catalog, bm25_index=store.bm25_index)
+    assert reopened.get_document_list() == []
+    assert reopened.collection.count() == 0
+    assert reopened.catalog.get('fourier.pdf') is None
+
+
+def test_scoped_search_only_returns_chunks_from_scope(store):
+    store.add_document('期末考範圍包含 CS101 與貝氏定理。' * 60, 'course.pdf')
+    store.add_document('CS101 的作業繳交規定與貝氏定理練習。' * 60, 'homework.pdf')
+    store.add_document('完全無關的內容。' * 300, 'other.pdf')
+    store.catalog.set_tags('homework.pdf', ['作業', 'cs101'])
+
+    filenames = store.catalog.resolve_scope({'tags': ['作業']})
+    assert filenames == ['homework.pdf']
+    for results in (store.hybrid_search('CS101', top_k=5, filenames=filenames),
+                    store.search('CS101', top_k=5, filenames=filenames)):
+        assert results and {doc['metadata']['filename'] for doc in results} == {'homework.pdf'}
+
+    assert store.catalog.resolve_scope({'filenames': ['course.pdf', 'missing.pdf']}) == ['course.pdf']
+    assert store.catalog.resolve_scope({'uploaded_after': time.time() + 60}) == []
+    assert store.hybrid_search('CS101', filenames=[]) == []
+    # 重新索引保留標籤
+    store.add_document('CS101 的作業繳交規定。' * 60, 'homework.pdf')
+    assert store.catalog.get('homework.pdf')['tags'] == ['cs101', '作業']
+
+
+def test_parse_scope_validates_and_converts_dates():
+    scope = parse_scope({'filenames': 'a.pdf', 'uploaded_after': '2024-03-01', 'uploaded_before': '2024-03-01'})
+    assert scope['filenames'] == ['a.pdf']
+    assert scope['uploaded_before'] - scope['uploaded_after'] > 86000
+    assert parse_scope({}) is None
+    for invalid in ({'tags': [1]}, {'uploaded_after': 'yesterday'}, {'owner': 'me'}, ['a.pdf']):
+        with pytest.raises(ValueError):
+            parse_scope(invalid)